@@ -0,0 +1,29 @@
+"""add_ingestion_job_file_counters
+
+Revision ID: 3f9a7c2d5e14
+Revises: 8b2e4f61c0d3
+Create Date: 2026-10-17 14:37:09.214855
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a7c2d5e14'
+down_revision: Union[str, None] = '8b2e4f61c0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-file tasks update these counters atomically as they finish
+    op.add_column('ingestion_jobs', sa.Column('failed_files', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('ingestion_jobs', sa.Column('chunks_created', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('ingestion_jobs', 'chunks_created')
+    op.drop_column('ingestion_jobs', 'failed_files')
@@ -0,0 +1,58 @@
+"""add_document_registry
+
+Revision ID: 8b2e4f61c0d3
+Revises: 6269fe91c30e
+Create Date: 2026-10-17 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4f61c0d3'
+down_revision: Union[str, None] = '6269fe91c30e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Documents held by each persona and the chunks/vectors they were stored as
+    op.create_table('documents',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('persona_id', sa.String(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('file_hash', sa.String(length=64), nullable=False),
+    sa.Column('file_type', sa.String(), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('chunk_count', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['persona_id'], ['personas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('persona_id', 'filename', name='uq_documents_persona_filename')
+    )
+    op.create_index(op.f('ix_documents_persona_id'), 'documents', ['persona_id'], unique=False)
+
+    op.create_table('document_chunks',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('document_id', sa.String(), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.Column('chunk_hash', sa.String(length=64), nullable=False),
+    sa.Column('vector_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_document_chunks_document_id'), 'document_chunks', ['document_id'], unique=False)
+    op.create_index('ix_document_chunks_document_hash', 'document_chunks', ['document_id', 'chunk_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_chunks_document_hash', table_name='document_chunks')
+    op.drop_index(op.f('ix_document_chunks_document_id'), table_name='document_chunks')
+    op.drop_table('document_chunks')
+    op.drop_index(op.f('ix_documents_persona_id'), table_name='documents')
+    op.drop_table('documents')
@@ -0,0 +1,38 @@
+"""add_ingestion_checkpoints
+
+Revision ID: a7d3e9b1c4f2
+Revises: 3f9a7c2d5e14
+Create Date: 2026-10-17 16:02:41.538207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9b1c4f2'
+down_revision: Union[str, None] = '3f9a7c2d5e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingestion_checkpoints',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('job_id', sa.String(), nullable=False),
+    sa.Column('file_hash', sa.String(length=64), nullable=False),
+    sa.Column('batch_index', sa.Integer(), nullable=False),
+    sa.Column('chunk_records', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['ingestion_jobs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('job_id', 'file_hash', 'batch_index', name='uq_ingestion_checkpoints_batch')
+    )
+    op.create_index(op.f('ix_ingestion_checkpoints_job_id'), 'ingestion_checkpoints', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ingestion_checkpoints_job_id'), table_name='ingestion_checkpoints')
+    op.drop_table('ingestion_checkpoints')
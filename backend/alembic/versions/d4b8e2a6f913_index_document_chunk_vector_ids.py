@@ -0,0 +1,25 @@
+"""index_document_chunk_vector_ids
+
+Revision ID: d4b8e2a6f913
+Revises: a7d3e9b1c4f2
+Create Date: 2026-10-17 21:14:08.902317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4b8e2a6f913'
+down_revision: Union[str, None] = 'a7d3e9b1c4f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_document_chunks_vector_id', 'document_chunks', ['vector_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_document_chunks_vector_id', table_name='document_chunks')
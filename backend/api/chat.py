@@ -4,13 +4,13 @@ from sse_starlette.sse import EventSourceResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
-from typing import Optional, AsyncIterator
+from typing import Optional, AsyncIterator, Awaitable, Dict, List, TypeVar
 import json
+import time
 import logging
 import asyncio
-import tiktoken
 
-from database import get_db
+from database import get_db, AsyncSessionLocal
 from models import Persona, UsageLog
 from api.auth import get_current_user, User
 from services.pinecone_client import get_pinecone_client
@@ -21,10 +21,15 @@ from services.persona_prompt_service import persona_prompt_service
 from services.testing_service import testing_service
 from services.llm_judge_service import llm_judge_service
 from services.conversation_service import ConversationService
+from services.token_accounting import TokenAccountant
+from services.answer_cache import CachedAnswer, get_answer_cache, prompt_fingerprint, replay_chunks
+from services.context_packer import get_context_packer
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+T = TypeVar("T")
+
 # Request/Response models
 class ChatRequest(BaseModel):
     persona_id: str
@@ -32,17 +37,97 @@ class ChatRequest(BaseModel):
     model: str = "auto"
     k: int = 6
     thread_id: Optional[str] = None  # Optional thread ID for conversation persistence
+    debug: bool = False  # Send a debug event with preflight timings
 
 class ChatMessage(BaseModel):
     role: str
     content: str
 
-# Token counting
-encoding = tiktoken.get_encoding("cl100k_base")
+async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable[T]) -> T:
+    """Await a preflight stage, recording its duration in milliseconds"""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+async def _load_active_prompts(persona_id: str) -> Dict[str, str]:
+    """Persona prompts on a session of their own, so they load alongside the request's queries"""
+    async with AsyncSessionLocal() as prompt_db:
+        return await persona_prompt_service.get_active_prompts(persona_id=persona_id, db=prompt_db)
+
+async def _replay_cached_answer(
+    cached: CachedAnswer,
+    request: ChatRequest,
+    current_user: User,
+    conversation,
+    model: str,
+    db: AsyncSession
+) -> AsyncIterator[dict]:
+    """Answer from the cache with the same events a generated answer produces"""
+    answer_cache = get_answer_cache()
+    yield {
+        "event": "citations",
+        "data": json.dumps(cached.citations)
+    }
+    
+    if conversation and request.thread_id:
+        await ConversationService.add_message(
+            thread_id=conversation.id,
+            role="user",
+            content=request.question,
+            db=db
+        )
+    
+    for i, piece in enumerate(replay_chunks(cached.answer, answer_cache.replay_words)):
+        if i and answer_cache.replay_delay:
+            await asyncio.sleep(answer_cache.replay_delay)
+        yield {
+            "event": "token",
+            "data": json.dumps({"token": piece})
+        }
+    
+    if conversation:
+        await ConversationService.add_message(
+            thread_id=conversation.id,
+            role="assistant",
+            content=cached.answer,
+            citations=cached.citations,
+            token_count=cached.output_tokens,
+            model=model,
+            db=db
+        )
+    
+    # Nothing was generated, so nothing is billed
+    db.add(UsageLog(
+        user_id=current_user.id,
+        persona_id=request.persona_id,
+        action="chat",
+        model=model,
+        input_tokens=0,
+        output_tokens=0,
+        cost_usd=0,
+        extra_metadata={
+            "question": request.question[:100],
+            "response_length": len(cached.answer),
+            "answer_cache_hit": True,
+            "similarity": round(cached.similarity, 4)
+        }
+    ))
+    await db.commit()
+    
+    yield {
+        "event": "done",
+        "data": json.dumps({"status": "complete", "tokens": cached.output_tokens, "cached": True})
+    }
 
-def count_tokens(text: str) -> int:
-    """Count tokens in text"""
-    return len(encoding.encode(text))
+def _discard(tasks: List[asyncio.Task]):
+    """Cancel preflight tasks the response no longer needs"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Discarded preflight task failed: {task.exception()}")
 
 async def stream_chat_response(
     request: ChatRequest,
@@ -56,20 +141,39 @@ async def stream_chat_response(
     - thread_info: Thread ID for conversation (if persistence enabled)
     - token: Individual tokens
     - citations: Source citations
+    - debug: Preflight stage timings (if requested)
     - done: Completion signal
     - error: Error messages
+    
+    The preflight runs as a small dependency graph: the query embedding and
+    the persona's prompts load while the persona and conversation are read
+    (those share the request's session), and the vector search starts as
+    soon as the persona's namespace and the embedding are known.
     """
     # Track if we need to close the session at the end
     should_close_session = False
     conversation = None
+    timings: Dict[str, float] = {}
+    preflight_started = time.perf_counter()
+    tasks: List[asyncio.Task] = []
     
     try:
+        # Independent of everything else: start at once
+        async def embed_question():
+            return await Embedder().embed_query(request.question)
+        
+        embed_task = asyncio.create_task(_timed(timings, "embed_query", embed_question()))
+        prompts_task = asyncio.create_task(
+            _timed(timings, "prompts", _load_active_prompts(request.persona_id))
+        )
+        tasks += [embed_task, prompts_task]
+        
         # Get persona
         stmt = select(Persona).where(
             Persona.id == request.persona_id,
             Persona.user_id == current_user.id
         )
-        result = await db.execute(stmt)
+        result = await _timed(timings, "persona", db.execute(stmt))
         persona = result.scalar_one_or_none()
         
         if not persona:
@@ -79,7 +183,43 @@ async def stream_chat_response(
             }
             return
         
+        pinecone_client = get_pinecone_client()
+        context_packer = get_context_packer()
+        
+        async def retrieve():
+            """Check the persona has documents, then search them"""
+            exists, vector_count = await _timed(
+                timings, "namespace_check", pinecone_client.check_namespace_exists(persona.namespace)
+            )
+            if not exists or vector_count == 0:
+                return None
+            query_embedding = await embed_task
+            return await _timed(timings, "similarity_search", pinecone_client.similarity_search(
+                namespace=persona.namespace,
+                query_embedding=query_embedding,
+                k=request.k,
+                include_values=context_packer.enabled  # For redundancy removal
+            ))
+        
+        retrieve_task = asyncio.create_task(retrieve())
+        tasks.append(retrieve_task)
+        
+        # Look for a cached answer alongside the retrieval
+        answer_cache = get_answer_cache()
+        model_name = request.model if request.model != "auto" else "gpt-4o"
+        lookup_task = None
+        if answer_cache.enabled:
+            async def lookup_answer():
+                fingerprint = prompt_fingerprint(await prompts_task)
+                return await _timed(timings, "answer_cache", answer_cache.lookup(
+                    request.persona_id, model_name, fingerprint, await embed_task
+                ))
+            
+            lookup_task = asyncio.create_task(lookup_answer())
+            tasks.append(lookup_task)
+        
         # Handle conversation persistence
+        conversation_started = time.perf_counter()
         if request.thread_id:
             # Verify conversation exists and belongs to user
             conversation = await ConversationService.get_conversation(
@@ -101,6 +241,7 @@ async def stream_chat_response(
                 first_message=request.question,
                 db=db
             )
+        timings["conversation"] = round((time.perf_counter() - conversation_started) * 1000, 1)
         
         # Send thread info
         yield {
@@ -111,17 +252,39 @@ async def stream_chat_response(
             })
         }
         
-        # Check if persona is ready
-        pinecone_client = get_pinecone_client()
-        exists, vector_count = await pinecone_client.check_namespace_exists(persona.namespace)
+        cache_bucket = None
+        if lookup_task is not None:
+            try:
+                cached, cache_bucket = await lookup_task
+            except Exception as e:
+                logger.warning(f"Answer cache lookup skipped: {e}")
+                cached = None
+            if cached is not None:
+                _discard([retrieve_task])
+                if request.debug:
+                    yield {
+                        "event": "debug",
+                        "data": json.dumps({
+                            "preflight_ms": round((time.perf_counter() - preflight_started) * 1000, 1),
+                            "stages_ms": timings,
+                            "answer_cache_hit": True
+                        })
+                    }
+                async for event in _replay_cached_answer(cached, request, current_user, conversation, model_name, db):
+                    yield event
+                return
         
         # Initialize variables
         citations = []
         formatted_chunks = []
         chunks = []
+        packed = None
+        
+        # None if the persona has no documents
+        retrieved = await retrieve_task
         
         # Handle personas with no documents gracefully
-        if not exists or vector_count == 0:
+        if retrieved is None:
             logger.info(f"Persona {persona.name} has no documents, using fallback prompt without RAG")
             
             # Send empty citations for consistency
@@ -133,16 +296,11 @@ async def stream_chat_response(
             # Use fallback prompt without RAG context
             formatted_chunks = []  # Empty chunks for personas without documents
         else:
-            # Embed the question
-            embedder = Embedder()
-            query_embedding = await embedder.embed_query(request.question)
-            
-            # Search for relevant chunks
-            chunks = await pinecone_client.similarity_search(
-                namespace=persona.namespace,
-                query_embedding=query_embedding,
-                k=request.k
-            )
+            # Keep the relevant, non-redundant chunks that fit the model's context budget
+            packing_started = time.perf_counter()
+            packed = context_packer.pack(retrieved, model_name)
+            timings["context_pack"] = round((time.perf_counter() - packing_started) * 1000, 1)
+            chunks = packed.chunks
             
             if not chunks:
                 # Send empty citations if no relevant chunks found
@@ -179,10 +337,7 @@ async def stream_chat_response(
         
         # Get persona-specific prompts (system, rag, user)
         try:
-            persona_prompts = await persona_prompt_service.get_active_prompts(
-                persona_id=request.persona_id,
-                db=db
-            )
+            persona_prompts = await prompts_task
             
             # If no persona-specific prompts, fall back to global service
             if not any(persona_prompts.values()):
@@ -242,10 +397,20 @@ async def stream_chat_response(
             )
             prompt = prompt_service.format_for_llm(prompt_layers)
         
-        # Count input tokens
-        input_tokens = count_tokens(prompt)
-        output_tokens = 0
-        full_response = []
+        # Token counts come from the provider's stream, else are counted incrementally
+        usage = TokenAccountant(prompt=prompt)
+        
+        preflight_ms = round((time.perf_counter() - preflight_started) * 1000, 1)
+        logger.debug(f"Chat preflight took {preflight_ms}ms: {timings}")
+        if request.debug:
+            yield {
+                "event": "debug",
+                "data": json.dumps({
+                    "preflight_ms": preflight_ms,
+                    "stages_ms": timings,
+                    "context": packed.as_dict() if packed else None
+                })
+            }
         
         # Save user message if this is a new conversation and we haven't added it yet
         if conversation and not request.thread_id:
@@ -267,16 +432,17 @@ async def stream_chat_response(
                 prompt=prompt,
                 model=request.model,
                 temperature=0.7,
-                max_tokens=2000
+                max_tokens=2000,
+                usage=usage
             ):
-                full_response.append(token)
-                output_tokens = count_tokens(''.join(full_response))
                 yield {
                     "event": "token",
                     "data": json.dumps({"token": token})
                 }
             
-            logger.info(f"LLM call completed successfully. Generated {output_tokens} tokens.")
+            input_tokens = usage.input_tokens
+            output_tokens = usage.output_tokens
+            logger.info(f"LLM call completed successfully. Generated {output_tokens} tokens ({usage.source} count).")
             
         except Exception as llm_error:
             logger.error(f"LLM call failed: {llm_error}", exc_info=True)
@@ -287,7 +453,7 @@ async def stream_chat_response(
             return
         
         # Save assistant response
-        assistant_response = ''.join(full_response)
+        assistant_response = usage.text
         if conversation:
             await ConversationService.add_message(
                 thread_id=conversation.id,
@@ -314,15 +480,30 @@ async def stream_chat_response(
             input_tokens=input_tokens,
             output_tokens=output_tokens,
             cost_usd=int(cost_info["total_cost"] * 100),  # Store in cents
-            metadata={
+            extra_metadata={
                 "question": request.question[:100],
                 "chunk_count": len(chunks),
-                "response_length": len(''.join(full_response))
+                "response_length": len(assistant_response),
+                "token_count_source": usage.source
             }
         )
         db.add(usage_log)
         await db.commit()
         
+        # Cache the answer for similar questions, in the bucket the lookup read
+        if cache_bucket is not None and assistant_response:
+            try:
+                await answer_cache.store(
+                    request.persona_id,
+                    cache_bucket,
+                    await embed_task,
+                    assistant_response,
+                    citations,
+                    output_tokens
+                )
+            except Exception as e:
+                logger.debug(f"Answer not cached: {e}")
+        
         # Send completion signal
         yield {
             "event": "done",
@@ -336,6 +517,7 @@ async def stream_chat_response(
             "data": json.dumps({"error": str(e)})
         }
     finally:
+        _discard(tasks)
         # Close session if we opened it
         if should_close_session and db:
             await db.close()
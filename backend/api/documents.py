@@ -4,15 +4,13 @@ Document Management API
 Handles file upload, listing, and management for personas.
 """
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from typing import List, Optional
 from pydantic import BaseModel
 import os
 import uuid
-import base64
-import threading
 from datetime import datetime
 import logging
 
@@ -21,7 +19,10 @@ from models import Persona, User, IngestionJob, JobStatus
 from api.auth import get_current_user
 
 # Import new simple processing service
-from services.simple_processor import start_processing_thread
+from services.simple_processor import submit_processing_job
+from services.ingestion_executor import IngestionBacklogFull, get_ingestion_executor
+from services.blob_store import get_blob_store
+from services.upload_stream import multipart_openapi, release_upload, stream_multipart_upload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -120,14 +121,19 @@ async def list_persona_files(
         total=len(files)
     )
 
-@router.post("/{persona_id}/files", response_model=UploadResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/{persona_id}/files",
+    response_model=UploadResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=multipart_openapi("files", multiple=True)
+)
 async def upload_files_to_persona(
     persona_id: str,
-    files: List[UploadFile] = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Upload one or more files to a persona's knowledge base with real processing"""
+    """Upload one or more files (form field `files`) to a persona's knowledge base with real processing"""
     
     # Verify persona ownership
     persona_result = await db.execute(
@@ -140,45 +146,40 @@ async def upload_files_to_persona(
     if not persona:
         raise HTTPException(404, "Persona not found")
     
-    if not files:
-        raise HTTPException(400, "No files provided")
+    # Reject with 429 before reading the upload if the ingestion backlog is full
+    get_ingestion_executor().check_capacity()
     
-    if len(files) > 20:
-        raise HTTPException(400, "Too many files. Maximum 20 files per upload")
+    # Stream files into the blob store, hashing and enforcing limits as bytes arrive
+    form = await stream_multipart_upload(
+        request,
+        file_fields=("files",),
+        max_file_size=MAX_FILE_SIZE_BYTES,
+        max_total_size=MAX_FILE_SIZE_BYTES * 5,  # Max 125MB total
+        max_files=20,
+        allowed_extensions=None
+    )
     
-    # Validate each file and prepare file data
+    if not form.files:
+        raise HTTPException(400, "No files provided")
+    
+    # Prepare file data; the processor reads each file from the blob store by hash
     total_size = 0
     files_data = []
     
-    for file in files:
-        # Read file content
-        file_content = await file.read()
-        
-        if len(file_content) > MAX_FILE_SIZE_BYTES:
-            raise HTTPException(413, f"File {file.filename} exceeds {MAX_FILE_SIZE_MB}MB limit")
-        
-        total_size += len(file_content)
-        
-        # Encode content as base64 for storage
-        encoded_content = base64.b64encode(file_content).decode('utf-8')
+    for upload in form.files:
+        total_size += upload.size
         
         # Determine file type
         file_type = "text"
-        if file.filename and file.filename.lower().endswith('.pdf'):
+        if upload.filename and upload.filename.lower().endswith('.pdf'):
             file_type = "pdf"
         
         files_data.append({
-            'filename': file.filename or f"upload_{len(files_data)}.txt",
-            'content': encoded_content,
+            'filename': upload.filename or f"upload_{len(files_data)}.txt",
+            'blob_hash': upload.blob_hash,
             'type': file_type,
-            'size': len(file_content)
+            'size': upload.size
         })
-        
-        # Reset file pointer for potential future use
-        await file.seek(0)
-    
-    if total_size > MAX_FILE_SIZE_BYTES * 5:  # Max 125MB total
-        raise HTTPException(413, "Total upload size exceeds limit")
     
     # Create ingestion job
     job_id = str(uuid.uuid4())
@@ -187,11 +188,11 @@ async def upload_files_to_persona(
         id=job_id,
         persona_id=persona_id,
         user_id=current_user.id,
-        total_files=len(files),
+        total_files=len(files_data),
         processed_files=0,
         status=JobStatus.QUEUED,
         job_metadata={
-            "files": [{"filename": f["filename"], "size": f["size"], "type": f["type"]} for f in files_data],
+            "files": [{"filename": f["filename"], "hash": f["blob_hash"], "size": f["size"], "type": f["type"]} for f in files_data],
             "started_at": datetime.utcnow().isoformat()
         }
     )
@@ -200,19 +201,31 @@ async def upload_files_to_persona(
     await db.commit()
     await db.refresh(job)
     
-    logger.info(f"Created ingestion job {job_id} for persona {persona_id} with {len(files)} files")
+    # The job holds the uploaded files from here until it finishes
+    blob_hashes = [f["blob_hash"] for f in files_data]
+    get_blob_store().hold_for_job(job_id, blob_hashes)
+    await release_upload(form)
+    
+    logger.info(f"Created ingestion job {job_id} for persona {persona_id} with {len(files_data)} files")
     
-    # Start background processing using threading for reliable database isolation
-    # Each thread gets its own database session to avoid async conflicts  
-    start_processing_thread(job_id, persona_id, files_data)
+    # Queue background processing on the bounded ingestion executor
+    # Each job gets its own database session to avoid async conflicts
+    try:
+        submit_processing_job(job_id, persona_id, files_data)
+    except IngestionBacklogFull:
+        job.status = JobStatus.FAILED
+        job.error_message = "Rejected: ingestion backlog full"
+        await db.commit()
+        get_blob_store().keep_for_requeue(job_id, blob_hashes)
+        raise
     
     # Return the job ID as server_id for frontend tracking
     return UploadResponse(
         id=job_id,  # Frontend will use this job_id to poll status
-        name=f"{len(files)} file(s)",
+        name=f"{len(files_data)} file(s)",
         size=total_size,
         status="queued",
-        message=f"Upload successful, processing {len(files)} files"
+        message=f"Upload successful, processing {len(files_data)} files"
     )
 
 @router.delete("/files/{file_id}")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks, Response, status
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import os
@@ -7,8 +7,7 @@ import uuid
 from typing import Optional, List
 import logging
 import asyncio
-import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 
 from database import get_db
@@ -17,6 +16,12 @@ from api.auth import get_current_user, User
 from services.pinecone_client import get_pinecone_client
 from services.chunker import TextChunker
 from services.embedder import Embedder
+from services.dedup_index import get_dedup_index
+from services.pdf_extractor import iter_pdf_pages
+from services.blob_store import get_blob_store
+from services.upload_stream import multipart_openapi, release_upload, stream_multipart_upload
+from services.ingestion_executor import IngestionBacklogFull, get_ingestion_executor
+from services.answer_cache import get_answer_cache
 from services.agent_service import agent_service
 
 logger = logging.getLogger(__name__)
@@ -59,10 +64,14 @@ class JobProgressResponse(BaseModel):
     total_files: int
     current_file: Optional[str] = None
     error: Optional[str] = None
+    chunks_embedded: Optional[int] = None
+    chunks_upserted: Optional[int] = None
 
 # Constants
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "10"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# Job progress streams send a keep-alive (and re-check the job row) after this much silence
+JOB_STREAM_KEEPALIVE_SECONDS = float(os.getenv("JOB_STREAM_KEEPALIVE_SECONDS", "15"))
 
 @router.post("/upload", response_model=PersonaUploadResponse)
 async def upload_persona(
@@ -85,6 +94,10 @@ async def upload_persona(
     if file and text:
         raise HTTPException(400, "Provide either file or text, not both")
     
+    # Reject with 429 before processing if the ingestion backlog is full
+    executor = get_ingestion_executor()
+    executor.check_capacity()
+    
     # Process file upload
     content = ""
     source_type = "text"
@@ -138,14 +151,21 @@ async def upload_persona(
     await db.commit()
     await db.refresh(persona)
     
-    # Process in background
-    background_tasks.add_task(
-        process_and_embed_content,
-        persona_id=persona.id,
-        namespace=namespace,
-        content=content,
-        source=source_filename or "uploaded_text"
-    )
+    # Process in background on the bounded ingestion executor
+    try:
+        executor.submit(
+            f"persona-{persona.id[:8]}",
+            process_and_embed_content,
+            persona_id=persona.id,
+            namespace=namespace,
+            content=content,
+            source=source_filename or "uploaded_text"
+        )
+    except IngestionBacklogFull:
+        # Don't leave a persona behind that will never get its content
+        await db.delete(persona)
+        await db.commit()
+        raise
     
     # 🎯 Sprint 7 Phase 2: Auto-create ElevenLabs agent for new persona
     background_tasks.add_task(
@@ -162,26 +182,30 @@ async def upload_persona(
         message="Upload received. Processing in background..."
     )
 
-@router.post("/{persona_id}/ingest", response_model=IngestJobResponse)
+@router.post(
+    "/{persona_id}/ingest",
+    response_model=IngestJobResponse,
+    openapi_extra=multipart_openapi("files", multiple=True, text_fields=["topic_tags"])
+)
 async def ingest_multiple_files(
     persona_id: str,
-    files: List[UploadFile] = File(..., description="Multiple PDF or text files"),
-    topic_tags: Optional[str] = Form(None, description="JSON array of topic tags"),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Ingest multiple files to an existing persona.
     Creates a background job for processing and returns job tracking information.
+
+    Form fields: `files` (PDF or text files) and optional `topic_tags` (JSON
+    array). The body is streamed into the blob store as it arrives.
     """
     logger.info(f"Starting ingest_multiple_files for persona {persona_id}")
     logger.info(f"Current user: {current_user.id if current_user else 'None'}")
-    logger.info(f"Number of files: {len(files) if files else 0}")
     
     try:
-        # Import queue manager
-        from services.queue_manager import enqueue_job
-        from services.ingestion_worker import run_ingestion_job
+        # Import the fair-share scheduler for per-file tasks
+        from services.fair_scheduler import get_fair_scheduler
     except ImportError as e:
         logger.error(f"Failed to import required modules: {e}")
         raise HTTPException(500, f"Server configuration error: {str(e)}")
@@ -197,45 +221,28 @@ async def ingest_multiple_files(
     if not persona:
         raise HTTPException(404, "Persona not found")
     
-    # Validate files
-    if not files or len(files) == 0:
+    # Stream files into the blob store, hashing and enforcing limits as bytes arrive
+    form = await stream_multipart_upload(
+        request,
+        file_fields=("files",),
+        max_file_size=MAX_FILE_SIZE_BYTES,
+        max_total_size=100 * 1024 * 1024,  # 100MB limit for batch
+        max_files=50  # Increased limit for production
+    )
+    if not form.files:
         raise HTTPException(400, "At least one file must be provided")
-    
-    if len(files) > 50:  # Increased limit for production
-        raise HTTPException(400, "Too many files. Maximum 50 files per upload")
-    
-    # Validate and read files
-    file_data = []
-    total_size = 0
-    
-    for file in files:
-        # Read file content
-        content = await file.read()
-        total_size += len(content)
-        
-        # Check individual file size
-        if len(content) > MAX_FILE_SIZE_BYTES:
-            raise HTTPException(413, f"File '{file.filename}' exceeds {MAX_FILE_SIZE_MB}MB limit")
-        
-        # Check file type
-        filename = file.filename.lower() if file.filename else ""
-        if not (filename.endswith('.pdf') or filename.endswith('.txt')):
-            raise HTTPException(400, f"Unsupported file type for '{file.filename}'. Use PDF or TXT")
-        
-        # Generate file hash for deduplication
-        file_hash = hashlib.sha256(content).hexdigest()
-        
-        file_data.append({
-            "filename": file.filename,
-            "content": content,
-            "hash": file_hash,
-            "size": len(content),
-            "type": "pdf" if filename.endswith('.pdf') else "text"
-        })
-    
-    # Check total size (100MB limit for batch)
-    if total_size > 100 * 1024 * 1024:
-        raise HTTPException(413, "Total file size exceeds 100MB limit")
+    topic_tags = form.fields.get("topic_tags")
+    
+    file_data = [
+        {
+            "filename": f.filename,
+            "hash": f.blob_hash,
+            "size": f.size,
+            "type": "pdf" if f.filename.lower().endswith('.pdf') else "text"
+        }
+        for f in form.files
+    ]
+    total_size = sum(f.size for f in form.files)
     
     # Parse topic tags if provided
     parsed_tags = []
@@ -289,33 +296,34 @@ async def ingest_multiple_files(
         await db.refresh(job)
         logger.info(f"Refreshed job: {job.id}")
         
+        # The job holds the uploaded files from here until it finishes
+        get_blob_store().hold_for_job(job.id, [f["hash"] for f in file_data])
+        
     except Exception as e:
         logger.error(f"Failed to create/save ingestion job: {e}")
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
+        await release_upload(form)
         raise HTTPException(500, f"Failed to create ingestion job: {str(e)}")
-    
-    # Prepare file data for worker (convert bytes to base64 for JSON serialization)
-    import base64
-    worker_files_data = []
-    for f in file_data:
-        worker_files_data.append({
-            "filename": f["filename"],
-            "content": base64.b64encode(f["content"]).decode('utf-8')  # base64 encoded content
-        })
-    
-    # Enqueue background job using Redis Queue
+    await release_upload(form)
+    
+    # Fan the job out into one Redis Queue task per file, so free workers
+    # process the files in parallel; the scheduler admits tasks round-robin
+    # across users. Files reach the workers through the blob store, so each
+    # task only carries a hash
+    file_tasks = [
+        {
+            "job_id": job.id,
+            "persona_id": persona_id,
+            "file_data": {"filename": f["filename"], "blob_hash": f["hash"], "size": f["size"]},
+            "total_files": len(file_data),
+            "topic_tags": parsed_tags  # Pass topic tags to worker
+        }
+        for f in file_data
+    ]
     try:
-        rq_job_id = enqueue_job(
-            run_ingestion_job,
-            job.id,
-            persona_id,
-            worker_files_data,
-            parsed_tags,  # Pass topic tags to worker
-            queue_name="ingestion",
-            job_timeout="30m"  # 30 minute timeout
-        )
-        logger.info(f"Enqueued RQ job {rq_job_id} for ingestion job {job.id}")
+        get_fair_scheduler().submit(current_user.id, "services.ingestion_worker.run_ingestion_file", file_tasks)
+        logger.info(f"Submitted {len(file_tasks)} file tasks for ingestion job {job.id}")
     except Exception as e:
         logger.error(f"Failed to enqueue job: {e}")
         import traceback
@@ -324,6 +332,8 @@ async def ingest_multiple_files(
         job.status = "FAILED"
         job.job_metadata = {"error": f"Failed to enqueue job: {str(e)}"}
         await db.commit()
+        # Without its file list the job cannot be requeued
+        await asyncio.to_thread(get_blob_store().release_job, job.id, [f["hash"] for f in file_data])
         raise HTTPException(500, f"Failed to start processing: {str(e)}")
     
     # Estimate processing time (rough calculation)
@@ -338,22 +348,12 @@ async def ingest_multiple_files(
         message=f"Started processing {len(file_data)} files. Use /jobs/{job.id}/stream for progress updates."
     )
 
-async def process_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
+async def process_pdf(file_content: bytes, path: Optional[str] = None) -> str:
+    """Extract text from PDF file (path: the same bytes on disk, if available)"""
     try:
-        import pypdf
-        from io import BytesIO
-        
-        pdf_file = BytesIO(file_content)
-        reader = pypdf.PdfReader(pdf_file)
-        
-        text_content = []
-        for page_num, page in enumerate(reader.pages):
-            page_text = page.extract_text()
-            if page_text:
-                text_content.append(page_text)
-        
-        return "\n\n".join(text_content)
+        # Extraction is CPU-bound; run it off the event loop (large PDFs use a process pool)
+        pages = await asyncio.to_thread(lambda: [page for page in iter_pdf_pages(file_content, path=path) if page])
+        return "\n\n".join(pages)
     
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
@@ -365,125 +365,114 @@ def process_and_embed_content(
     content: str,
     source: str
 ):
-    """Background task to chunk and embed content"""
-    # Create a new thread to run the async function
-    import threading
-    import time
-    
-    logger.info(f"Starting background task thread for persona {persona_id}")
+    """
+    Background job to chunk and embed content
+
+    Runs on an ingestion executor worker thread; async calls are awaited on
+    the executor's shared event loop.
+    """
+    executor = get_ingestion_executor()
+    logger.info(f"Starting background job for persona {persona_id}")
     
-    def run_async():
+    try:
+        # Process content and get chunks
+        chunker = TextChunker(
+            chunk_size=int(os.getenv("CHUNK_SIZE_TOKENS", "800")),
+            chunk_overlap=int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+        )
+        chunks = chunker.chunk_text(content, source=source)
+        logger.info(f"Created {len(chunks)} chunks for persona {persona_id}")
+        
+        if not chunks:
+            logger.warning(f"No chunks created for persona {persona_id}")
+            return
+        
+        # Generate embeddings on the shared ingestion loop
+        embedder = Embedder()
+        texts = [chunk["text"] for chunk in chunks]
+        embeddings = executor.run_async(embedder.embed_documents(texts))
+        logger.info(f"Generated {len(embeddings)} embeddings for persona {persona_id}")
+        
+        # Initialize Pinecone client
         try:
-            logger.info(f"Thread started for persona {persona_id}")
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                # Process content and get chunks
-                chunker = TextChunker(
-                    chunk_size=int(os.getenv("CHUNK_SIZE_TOKENS", "800")),
-                    chunk_overlap=int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
-                )
-                chunks = chunker.chunk_text(content, source=source)
-                logger.info(f"Created {len(chunks)} chunks for persona {persona_id}")
-                
-                if not chunks:
-                    logger.warning(f"No chunks created for persona {persona_id}")
-                    return
-                
-                # Generate embeddings synchronously
-                embedder = Embedder()
-                texts = [chunk["text"] for chunk in chunks]
-                embeddings = loop.run_until_complete(embedder.embed_documents(texts))
-                logger.info(f"Generated {len(embeddings)} embeddings for persona {persona_id}")
-                
-                # Initialize Pinecone client
-                try:
-                    pinecone_client = get_pinecone_client()
-                    logger.info("Pinecone client initialized successfully")
-                    
-                    # Prepare metadata
-                    metadata_list = []
-                    ids = []
-                    for i, chunk in enumerate(chunks):
-                        chunk_id = f"{namespace}_chunk_{i}"
-                        ids.append(chunk_id)
-                        metadata_list.append({
-                            "text": chunk["text"][:1000],  # Store first 1000 chars in metadata
-                            "chunk_id": chunk["chunk_id"],
-                            "source": chunk["source"],
-                            "char_start": chunk["char_start"],
-                            "char_end": chunk["char_end"],
-                            "persona_id": persona_id
-                        })
-                    
-                    # Upsert to Pinecone
-                    result = loop.run_until_complete(pinecone_client.upsert_vectors(
-                        namespace=namespace,
-                        embeddings=embeddings,
-                        metadata=metadata_list,
-                        ids=ids
-                    ))
-                    logger.info(f"Upserted {len(ids)} vectors to Pinecone namespace {namespace}")
-                except Exception as e:
-                    logger.error(f"Pinecone error: {type(e).__name__}: {str(e)}")
-                
-                # Update database directly with raw SQL
-                import psycopg2
-                from urllib.parse import urlparse
-                from database import DATABASE_URL
-                
-                # Parse the DATABASE_URL
-                parsed_url = urlparse(DATABASE_URL)
-                db_info = {
-                    'dbname': parsed_url.path[1:],
-                    'user': parsed_url.username,
-                    'password': parsed_url.password,
-                    'host': parsed_url.hostname,
-                    'port': parsed_url.port
-                }
-                
-                try:
-                    # Connect directly with psycopg2
-                    conn = psycopg2.connect(**db_info)
-                    cur = conn.cursor()
-                    
-                    # Update the persona with direct SQL
-                    cur.execute(
-                        "UPDATE personas SET chunk_count = %s, total_tokens = %s WHERE id = %s",
-                        (len(chunks), sum(chunk.get("token_count", 0) for chunk in chunks), persona_id)
-                    )
-                    
-                    # Commit the transaction
-                    conn.commit()
-                    
-                    # Check if any rows were affected
-                    if cur.rowcount > 0:
-                        logger.info(f"Updated persona {persona_id} with {len(chunks)} chunks using direct SQL")
-                    else:
-                        logger.error(f"Persona {persona_id} not found in database")
-                    
-                    # Close cursor and connection
-                    cur.close()
-                    conn.close()
-                except Exception as e:
-                    logger.error(f"Database update error: {type(e).__name__}: {str(e)}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                
-                logger.info(f"Thread completed successfully for persona {persona_id}")
-            except Exception as e:
-                logger.error(f"Error in thread for persona {persona_id}: {type(e).__name__}: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-            finally:
-                loop.close()
+            pinecone_client = get_pinecone_client()
+            logger.info("Pinecone client initialized successfully")
+            
+            # Prepare metadata
+            metadata_list = []
+            ids = []
+            for i, chunk in enumerate(chunks):
+                chunk_id = f"{namespace}_chunk_{i}"
+                ids.append(chunk_id)
+                metadata_list.append({
+                    "text": chunk["text"][:1000],  # Store first 1000 chars in metadata
+                    "chunk_id": chunk["chunk_id"],
+                    "source": chunk["source"],
+                    "char_start": chunk["char_start"],
+                    "char_end": chunk["char_end"],
+                    "persona_id": persona_id
+                })
+            
+            # Upsert to Pinecone
+            result = executor.run_async(pinecone_client.upsert_vectors(
+                namespace=namespace,
+                embeddings=embeddings,
+                metadata=metadata_list,
+                ids=ids
+            ))
+            logger.info(f"Upserted {len(ids)} vectors to Pinecone namespace {namespace}")
+            get_answer_cache().invalidate_persona(persona_id)
         except Exception as e:
-            logger.error(f"Thread setup error for persona {persona_id}: {type(e).__name__}: {str(e)}")
-    
-    thread = threading.Thread(target=run_async)
-    thread.daemon = True  # Make thread a daemon so it doesn't block process exit
-    thread.start()
-    logger.info(f"Background thread started for persona {persona_id}")
+            logger.error(f"Pinecone error: {type(e).__name__}: {str(e)}")
+        
+        # Update database directly with raw SQL
+        import psycopg2
+        from urllib.parse import urlparse
+        from database import DATABASE_URL
+        
+        # Parse the DATABASE_URL
+        parsed_url = urlparse(DATABASE_URL)
+        db_info = {
+            'dbname': parsed_url.path[1:],
+            'user': parsed_url.username,
+            'password': parsed_url.password,
+            'host': parsed_url.hostname,
+            'port': parsed_url.port
+        }
+        
+        try:
+            # Connect directly with psycopg2
+            conn = psycopg2.connect(**db_info)
+            cur = conn.cursor()
+            
+            # Update the persona with direct SQL
+            cur.execute(
+                "UPDATE personas SET chunk_count = %s, total_tokens = %s WHERE id = %s",
+                (len(chunks), sum(chunk.get("token_count", 0) for chunk in chunks), persona_id)
+            )
+            
+            # Commit the transaction
+            conn.commit()
+            
+            # Check if any rows were affected
+            if cur.rowcount > 0:
+                logger.info(f"Updated persona {persona_id} with {len(chunks)} chunks using direct SQL")
+            else:
+                logger.error(f"Persona {persona_id} not found in database")
+            
+            # Close cursor and connection
+            cur.close()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Database update error: {type(e).__name__}: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+        
+        logger.info(f"Background job completed successfully for persona {persona_id}")
+    except Exception as e:
+        logger.error(f"Error in background job for persona {persona_id}: {type(e).__name__}: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
 
 async def _process_and_embed_content(
     persona_id: str,
@@ -551,6 +540,7 @@ async def _process_and_embed_content(
             ids=ids
         )
         logger.info(f"Upserted {len(ids)} vectors to Pinecone namespace {namespace}")
+        get_answer_cache().invalidate_persona(persona_id)
         
         await _update_persona_chunk_count(persona_id, chunks)
         
@@ -757,6 +747,14 @@ async def delete_persona(
         logger.warning(f"Failed to delete Pinecone namespace {persona.namespace}: {e}")
         # Continue with database deletion even if Pinecone fails
     
+    dedup_index = get_dedup_index()
+    if dedup_index is not None:
+        try:
+            await asyncio.to_thread(dedup_index.delete_persona, str(persona.id))
+        except Exception as e:
+            logger.warning(f"Failed to delete dedup index for persona {persona.id}: {e}")
+    get_answer_cache().invalidate_persona(str(persona.id))
+    
     # 🎯 Sprint 7 Phase 2: Delete associated ElevenLabs agent
     if persona.elevenlabs_agent_id:
         try:
@@ -913,6 +911,7 @@ async def process_ingestion_job(job_id: str, persona: Persona, file_data: List[d
                 ids=ids
             )
             logger.info(f"Upserted {len(ids)} vectors to Pinecone")
+            get_answer_cache().invalidate_persona(persona.id)
             
         except Exception as e:
             logger.error(f"Pinecone error: {e}")
@@ -1022,9 +1021,7 @@ async def stream_job_progress(
     """SSE endpoint for real-time job progress updates"""
     from fastapi.responses import StreamingResponse
     import json
-    import asyncio
     from api.auth import verify_token
-    from services.queue_manager import get_job_status as get_rq_job_status
     
     # Verify token manually since EventSource doesn't support Authorization headers
     try:
@@ -1047,88 +1044,65 @@ async def stream_job_progress(
         raise HTTPException(404, "Job not found")
     
     async def event_stream():
-        """Generate SSE events for job progress"""
+        """Forward the job's progress events as SSE"""
         from database import AsyncSessionLocal
+        from services.job_progress import get_job_progress_hub
+        
+        def progress_from(current_job, state=None):
+            state = state or {}
+            return JobProgressResponse(
+                job_id=current_job.id,
+                persona_id=current_job.persona_id,
+                status=state.get("status", current_job.status.value),
+                progress=state.get("progress", int(current_job.processed_files / current_job.total_files * 100) if current_job.total_files else 0),
+                processed_files=state.get("processed_files", current_job.processed_files),
+                total_files=state.get("total_files", current_job.total_files),
+                current_file=state.get("current_file"),
+                error=state.get("error") or (current_job.job_metadata.get("error") if current_job.job_metadata else None),
+                chunks_embedded=state.get("chunks_embedded"),
+                chunks_upserted=state.get("chunks_upserted")
+            )
         
-        last_progress = -1
-        last_status = None
-        last_current_file = None
+        finished = (JobStatus.COMPLETED, JobStatus.READY, JobStatus.FAILED)
+        if job.status in finished:
+            yield "event: complete\n"
+            yield f"data: {progress_from(job, {'progress': 100}).json()}\n\n"
+            return
         
-        while True:
-            try:
-                # Get latest job status from database
-                async with AsyncSessionLocal() as db:
-                    job_result = await db.execute(select(IngestionJob).where(IngestionJob.id == job_id))
-                    current_job = job_result.scalar_one_or_none()
+        try:
+            # Workers push events; all viewers of the job share one subscription
+            async with get_job_progress_hub().subscribe(job_id) as subscription:
+                yield "event: progress\n"
+                yield f"data: {progress_from(job).json()}\n\n"
+                
+                while True:
+                    state = await subscription.get(timeout=JOB_STREAM_KEEPALIVE_SECONDS)
+                    if state is None:
+                        # Quiet for a while: keep the connection open, and check the
+                        # job row in case its worker died without reporting
+                        yield ": keep-alive\n\n"
+                        async with AsyncSessionLocal() as session:
+                            current_job = await session.get(IngestionJob, job_id)
+                        if current_job is None:
+                            break
+                        if current_job.status in finished:
+                            yield "event: complete\n"
+                            yield f"data: {progress_from(current_job, {'progress': 100}).json()}\n\n"
+                            break
+                        continue
                     
-                    if not current_job:
+                    if state.get("event") in ("completed", "failed"):
+                        yield "event: complete\n"
+                        yield f"data: {progress_from(job, state).json()}\n\n"
                         break
                     
-                    # Get RQ job status for real-time details
-                    rq_status = get_rq_job_status(job_id, queue_name="ingestion")
-                    
-                    # Determine current file and progress
-                    current_file = None
-                    current_progress = current_job.progress
-                    
-                    if rq_status and rq_status.get("status") != "not_found":
-                        current_file = rq_status.get("current_file")
-                        # Use RQ progress if available and more recent
-                        rq_progress = rq_status.get("progress", 0)
-                        if rq_progress > current_progress:
-                            current_progress = rq_progress
-                    
-                    # Check if anything changed
-                    status_changed = current_job.status != last_status
-                    progress_changed = current_progress != last_progress
-                    file_changed = current_file != last_current_file
-                    
-                    if status_changed or progress_changed or file_changed:
-                        # Create progress response
-                        progress_data = JobProgressResponse(
-                            job_id=current_job.id,
-                            persona_id=current_job.persona_id,
-                            status=current_job.status.value,
-                            progress=current_progress,
-                            processed_files=current_job.processed_files,
-                            total_files=current_job.total_files,
-                            current_file=current_file,
-                            error=current_job.job_metadata.get("error") if current_job.job_metadata else None
-                        )
-                        
-                        # Send SSE event
-                        yield f"event: progress\n"
-                        yield f"data: {progress_data.json()}\n\n"
-                        
-                        last_progress = current_progress
-                        last_status = current_job.status
-                        last_current_file = current_file
-                    
-                    # If job is completed or failed, send final event and break
-                    if current_job.status in [JobStatus.COMPLETED, JobStatus.FAILED]:
-                        final_data = JobProgressResponse(
-                            job_id=current_job.id,
-                            persona_id=current_job.persona_id,
-                            status=current_job.status.value,
-                            progress=100,
-                            processed_files=current_job.processed_files,
-                            total_files=current_job.total_files,
-                            current_file=None,
-                            error=current_job.job_metadata.get("error") if current_job.job_metadata else None
-                        )
-                        
-                        yield f"event: complete\n"
-                        yield f"data: {final_data.json()}\n\n"
-                        break
-                
-                # Wait before next update
-                await asyncio.sleep(2)  # Check every 2 seconds
-                
-            except Exception as e:
-                logger.error(f"Error in SSE stream: {e}")
-                yield f"event: error\n"
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                break
+                    yield "event: progress\n"
+                    yield f"data: {progress_from(job, state).json()}\n\n"
+        
+        except Exception as e:
+            logger.error(f"Error in SSE stream: {e}")
+            yield "event: error\n"
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
     
     return StreamingResponse(
         event_stream(),
@@ -1160,17 +1134,22 @@ class UploadProgressResponse(BaseModel):
 # Simple in-memory storage for upload progress (in production, use Redis or DB)
 upload_sessions = {}
 
-@router.post("/{persona_id}/upload-direct", response_model=DirectUploadResponse)
+@router.post(
+    "/{persona_id}/upload-direct",
+    response_model=DirectUploadResponse,
+    openapi_extra=multipart_openapi("file", multiple=False, text_fields=["topic_tags"])
+)
 async def upload_file_direct(
     persona_id: str,
-    file: UploadFile = File(..., description="PDF or text file"),
-    topic_tags: Optional[str] = Form(None, description="JSON array of topic tags"),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Direct file upload endpoint - processes immediately without queue.
     Designed for reliability over complexity.
+
+    Form fields: `file` (PDF or text file) and optional `topic_tags` (JSON array).
     """
     # Generate job ID for tracking
     job_id = str(uuid.uuid4())
@@ -1186,22 +1165,29 @@ async def upload_file_direct(
     if not persona:
         raise HTTPException(404, "Persona not found")
     
+    # Stream the file into the blob store; the size limit (100MB) and file type
+    # are enforced as the bytes arrive
+    form = await stream_multipart_upload(
+        request,
+        file_fields=("file",),
+        max_file_size=100 * 1024 * 1024,
+        max_files=1
+    )
+    if not form.files:
+        raise HTTPException(400, "No file provided")
+    upload = form.files[0]
+    topic_tags = form.fields.get("topic_tags")
+    
     # Initialize progress tracking
     upload_sessions[job_id] = {
         "status": "uploading",
         "progress": 10,
         "persona_id": persona_id,
-        "filename": file.filename,
+        "filename": upload.filename,
         "started_at": datetime.utcnow()
     }
     
-    # Validate file
-    if not file.filename:
-        raise HTTPException(400, "No filename provided")
-    
-    filename = file.filename.lower()
-    if not (filename.endswith('.pdf') or filename.endswith('.txt')):
-        raise HTTPException(400, "Only PDF and TXT files are supported")
+    filename = upload.filename.lower()
     
     # Parse topic tags if provided
     parsed_tags = []
@@ -1215,23 +1201,18 @@ async def upload_file_direct(
             # Ignore invalid JSON, just use empty tags
             parsed_tags = []
     
-    # Read file content
     try:
-        content = await file.read()
-        
-        # Check file size (100MB limit)
-        if len(content) > 100 * 1024 * 1024:
-            raise HTTPException(413, "File size exceeds 100MB limit")
-        
         # Update progress
         upload_sessions[job_id]["progress"] = 30
         upload_sessions[job_id]["status"] = "processing"
         
-        # Extract text content
-        if filename.endswith('.pdf'):
-            text_content = await process_pdf(content)
-        else:
-            text_content = content.decode('utf-8', errors='ignore')
+        # Extract text content from the mapped blob
+        blob_store = get_blob_store()
+        with blob_store.open(upload.blob_hash) as content:
+            if filename.endswith('.pdf'):
+                text_content = await process_pdf(content, blob_store.path(upload.blob_hash))
+            else:
+                text_content = str(content, 'utf-8', errors='ignore')
         
         if not text_content.strip():
             raise HTTPException(400, "File is empty or could not be processed")
@@ -1244,7 +1225,7 @@ async def upload_file_direct(
             persona_id=persona_id,
             namespace=persona.namespace,
             content=text_content,
-            source=file.filename,
+            source=upload.filename,
             job_id=job_id,
             topic_tags=parsed_tags
         )
@@ -1261,11 +1242,11 @@ async def upload_file_direct(
         return DirectUploadResponse(
             job_id=job_id,
             persona_id=persona_id,
-            message=f"Successfully processed {file.filename} into {chunks_created} chunks"
+            message=f"Successfully processed {upload.filename} into {chunks_created} chunks"
         )
         
     except Exception as e:
-        logger.error(f"Error processing file {file.filename}: {e}")
+        logger.error(f"Error processing file {upload.filename}: {e}")
         
         # Mark as failed
         upload_sessions[job_id]["status"] = "failed"
@@ -1275,6 +1256,9 @@ async def upload_file_direct(
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(500, f"Error processing file: {str(e)}")
+    finally:
+        # The file was processed inline; no job needs it
+        await release_upload(form)
 
 async def process_file_content(
     persona_id: str,
@@ -1360,6 +1344,7 @@ async def process_file_content(
                 ids=ids
             )
             logger.info(f"Upserted {len(ids)} vectors to Pinecone namespace {namespace}")
+            get_answer_cache().invalidate_persona(persona_id)
             
         except Exception as e:
             logger.error(f"Pinecone error: {e}")
@@ -1382,8 +1367,21 @@ async def requeue_failed_job(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Requeue a failed ingestion job
+    Requeue a failed ingestion job, or one whose workers died mid-way
+
+    The job resumes where it stopped: files the last attempt finished are
+    already in the document registry and are skipped as unchanged, and
+    half-stored files continue after their last checkpointed batch. A job
+    still PROCESSING can be requeued once it has made no progress for
+    INGEST_STALE_JOB_MINUTES, and never sooner than a file task can run.
+    Tasks of the previous attempt that have not started are cancelled, and
+    results of ones still running are ignored.
     """
+    from services.fair_scheduler import get_fair_scheduler
+    from services.job_progress import get_job_progress_hub
+    
+    scheduler = get_fair_scheduler()
+    
     # Get the failed job
     result = await db.execute(
         select(IngestionJob).where(
@@ -1395,34 +1393,73 @@ async def requeue_failed_job(
     if not job:
         raise HTTPException(404, "Job not found")
     
-    if job.status != "FAILED":
-        raise HTTPException(400, "Only failed jobs can be requeued")
+    # Longer than a file task may run, so the old attempt has no task left running
+    stale_after = max(
+        timedelta(minutes=int(os.getenv("INGEST_STALE_JOB_MINUTES", "45"))),
+        timedelta(seconds=scheduler.task_timeout_seconds, minutes=5)
+    )
+    last_activity = job.updated_at or job.created_at
+    stalled = (
+        job.status == JobStatus.PROCESSING
+        and last_activity is not None
+        and datetime.now(timezone.utc) - last_activity > stale_after
+    )
+    if job.status != JobStatus.FAILED and not stalled:
+        raise HTTPException(400, "Only failed or stalled jobs can be requeued")
     
     # Get original job metadata to reconstruct file data
     if not job.job_metadata or "files" not in job.job_metadata:
         raise HTTPException(400, "Job metadata missing - cannot requeue")
+    files = job.job_metadata["files"]
+    # Hold the files again before checking them, so they cannot be swept in between
+    blob_store = get_blob_store()
+    blob_store.hold_for_job(job.id, [f["hash"] for f in files])
+    missing = blob_store.missing(f["hash"] for f in files)
+    if missing:
+        raise HTTPException(409, f"{len(missing)} of the job's files are no longer stored, please re-upload them")
     
     try:
-        # Reset job status
-        job.status = "QUEUED"
-        job.progress = 0
+        # Drop the old attempt's parked and queued tasks, so no file runs twice
+        scheduler.cancel_job(current_user.id, job.id)
+        
+        # Reset the file counters; every file reports again, finished ones
+        # with no new chunks, so chunks_created keeps counting from here.
+        # Bumping the attempt voids results of the old attempt's tasks.
+        attempt = job.job_metadata.get("attempts", 1) + 1
+        job.status = JobStatus.QUEUED
         job.processed_files = 0
-        job.job_metadata = {**job.job_metadata, "requeued_at": datetime.utcnow().isoformat()}
+        job.failed_files = 0
+        job.error_message = None
+        job.job_metadata = {
+            **job.job_metadata,
+            "requeued_at": datetime.utcnow().isoformat(),
+            "attempts": attempt
+        }
         await db.commit()
+        get_job_progress_hub().reset(job.id)
         
         # Get topic tags from original job metadata
         topic_tags = job.job_metadata.get("topic_tags", [])
         
-        # Since we don't have the original file content, we can only requeue 
-        # if the files were stored (which they're not in current implementation)
-        # For now, return an error message suggesting manual re-upload
+        file_tasks = [
+            {
+                "job_id": job.id,
+                "persona_id": job.persona_id,
+                "file_data": {"filename": f["filename"], "blob_hash": f["hash"], "size": f["size"]},
+                "total_files": len(files),
+                "topic_tags": topic_tags,
+                "attempt": attempt
+            }
+            for f in files
+        ]
+        scheduler.submit(current_user.id, "services.ingestion_worker.run_ingestion_file", file_tasks)
+        logger.info(f"Requeued ingestion job {job_id} (attempt {attempt}) with {len(file_tasks)} file tasks")
         
         return {
-            "message": "Job reset to QUEUED status. Note: Files need to be re-uploaded as content is not stored.",
+            "message": "Job requeued; it resumes from the last stored batch of each file",
             "job_id": job_id,
             "status": "queued"
         }
-        
     except Exception as e:
         logger.error(f"Error requeuing job {job_id}: {e}")
         raise HTTPException(500, f"Failed to requeue job: {str(e)}")
@@ -0,0 +1,96 @@
+"""
+Throughput benchmark for TextChunker
+
+Generates a synthetic document (default 100 MB) of paragraphs and sentences,
+streams it through TextChunker.iter_chunks in 1 MB pieces and reports
+throughput and chunk statistics.
+
+Usage:
+    python benchmark_chunker.py [--size-mb 100] [--file path] [--chunk-size 800] [--overlap 200]
+"""
+
+import os
+import time
+import random
+import argparse
+from dotenv import load_dotenv
+from services.chunker import TextChunker
+
+load_dotenv()
+
+WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which "
+    "but have an they you were her she there been one all we their has would when if so no what "
+    "business offer value customer price market growth revenue leads acquisition retention scale"
+).split()
+
+
+def generate_document(size_bytes: int, seed: int = 42):
+    """Yield ~1 MB pieces of synthetic prose until size_bytes is reached"""
+    rng = random.Random(seed)
+    produced = 0
+    while produced < size_bytes:
+        paragraphs = []
+        piece_size = 0
+        while piece_size < (1 << 20):
+            sentences = []
+            for _ in range(rng.randint(1, 8)):
+                words = rng.choices(WORDS, k=rng.randint(4, 30))
+                sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+            paragraph = " ".join(sentences)
+            paragraphs.append(paragraph)
+            piece_size += len(paragraph) + 2
+        piece = "\n\n".join(paragraphs) + "\n\n"
+        produced += len(piece)
+        yield piece
+
+
+def read_file(path: str):
+    """Yield 1 MB pieces of a text file"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            piece = f.read(1 << 20)
+            if not piece:
+                break
+            yield piece
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TextChunker throughput")
+    parser.add_argument("--size-mb", type=int, default=100, help="Size of the generated document")
+    parser.add_argument("--file", help="Chunk this text file instead of generated text")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE_TOKENS", "800")))
+    parser.add_argument("--overlap", type=int, default=int(os.getenv("CHUNK_OVERLAP_TOKENS", "200")))
+    args = parser.parse_args()
+
+    chunker = TextChunker(chunk_size=args.chunk_size, chunk_overlap=args.overlap)
+
+    # Materialize the input first so generation time is not measured
+    if args.file:
+        pieces = list(read_file(args.file))
+    else:
+        pieces = list(generate_document(args.size_mb << 20))
+    total_chars = sum(len(piece) for piece in pieces)
+    total_mb = sum(len(piece.encode("utf-8")) for piece in pieces) / (1 << 20)
+    print(f"Input: {total_mb:.1f} MB, {total_chars:,} characters in {len(pieces)} pieces")
+
+    chunk_count = 0
+    total_tokens = 0
+    max_tokens = 0
+    min_tokens = None
+    start = time.perf_counter()
+    for chunk in chunker.iter_chunks(pieces, source="benchmark"):
+        chunk_count += 1
+        total_tokens += chunk["token_count"]
+        max_tokens = max(max_tokens, chunk["token_count"])
+        min_tokens = chunk["token_count"] if min_tokens is None else min(min_tokens, chunk["token_count"])
+    elapsed = time.perf_counter() - start
+
+    print(f"Chunks: {chunk_count:,} (tokens per chunk: min {min_tokens}, "
+          f"avg {total_tokens / max(chunk_count, 1):.0f}, max {max_tokens})")
+    print(f"Elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {total_mb / elapsed:.1f} MB/s, {total_tokens / elapsed:,.0f} chunk tokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
+import asyncio
 from dotenv import load_dotenv
 from os import getenv
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -34,9 +35,22 @@ from test_sse_endpoint import router as test_sse_router
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Clone Advisor API...")
+    from services.client_pool import get_client_pool
+    if os.getenv("OPENAI_POOL_WARMUP", "true").lower() == "true":
+        await get_client_pool().warm_up()
     yield
     # Shutdown
     print("Shutting down Clone Advisor API...")
+    # Let queued and running ingestion jobs finish before their clients close
+    from services.ingestion_executor import get_ingestion_executor
+    await asyncio.to_thread(get_ingestion_executor().shutdown)
+    from services.job_progress import get_job_progress_hub
+    await get_job_progress_hub().close()
+    await get_client_pool().close_current_loop()
+    from services.pinecone_client import close_pinecone_client
+    close_pinecone_client()
+    from services.pdf_extractor import shutdown_pool
+    shutdown_pool()
 
 # Create FastAPI app
 app = FastAPI(
@@ -71,6 +85,21 @@ async def health_check():
         "service": "clone-advisor-api"
     }
 
+@app.get("/health/pools")
+async def pool_health():
+    from services.client_pool import get_client_pool
+    from services.ingestion_executor import get_ingestion_executor
+    from services.job_progress import get_job_progress_hub
+    from services.answer_cache import get_answer_cache
+    from services.prompt_cache import get_prompt_cache
+    return {
+        "openai": get_client_pool().get_stats(),
+        "ingestion": get_ingestion_executor().get_stats(),
+        "job_progress": get_job_progress_hub().get_stats(),
+        "answer_cache": get_answer_cache().get_stats(),
+        "prompt_cache": get_prompt_cache().get_stats()
+    }
+
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(persona_router, prefix="/persona", tags=["persona"])  # Legacy singular route
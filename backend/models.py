@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, Text, JSON, Boolean, Enum, ForeignKey
+from sqlalchemy import Column, String, DateTime, Integer, BigInteger, Text, JSON, Boolean, Enum, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -66,12 +66,70 @@ class IngestionJob(Base):
     user_id = Column(String, nullable=False, index=True)
     total_files = Column(Integer, nullable=False)
     processed_files = Column(Integer, default=0)
+    failed_files = Column(Integer, default=0)  # Files whose per-file task failed
+    chunks_created = Column(Integer, default=0)  # Summed atomically as file tasks finish
     status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False)
     error_message = Column(Text, nullable=True)  # Store error details for failed jobs
     job_metadata = Column(JSON, nullable=True)  # file details, results, etc.
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class Document(Base):
+    """A file held in a persona's knowledge base, identified by filename"""
+    __tablename__ = "documents"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    persona_id = Column(String, ForeignKey("personas.id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    file_hash = Column(String(64), nullable=False)  # SHA-256 of the raw file bytes
+    file_type = Column(String, nullable=True)  # 'pdf', 'text'
+    size = Column(BigInteger, nullable=True)
+    chunk_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Relationships
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        UniqueConstraint("persona_id", "filename", name="uq_documents_persona_filename"),
+    )
+
+class DocumentChunk(Base):
+    """A chunk of a document and the vector it is stored as"""
+    __tablename__ = "document_chunks"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    chunk_hash = Column(String(64), nullable=False)  # SHA-256 of the chunk text
+    vector_id = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    document = relationship("Document", back_populates="chunks")
+    
+    __table_args__ = (
+        Index("ix_document_chunks_document_hash", "document_id", "chunk_hash"),
+        # Vectors are shared by documents that reference a near-duplicate chunk
+        Index("ix_document_chunks_vector_id", "vector_id"),
+    )
+
+class IngestionCheckpoint(Base):
+    """A batch of a file that an ingestion job has durably upserted"""
+    __tablename__ = "ingestion_checkpoints"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    job_id = Column(String, ForeignKey("ingestion_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    file_hash = Column(String(64), nullable=False)
+    batch_index = Column(Integer, nullable=False)
+    chunk_records = Column(JSON, nullable=False)  # [chunk_id, chunk_hash, vector_id] of the batch's chunks
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint("job_id", "file_hash", "batch_index", name="uq_ingestion_checkpoints_batch"),
+    )
+
 class UsageLog(Base):
     __tablename__ = "usage_logs"
     
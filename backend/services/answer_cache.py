@@ -0,0 +1,316 @@
+"""
+Semantic answer cache for chat
+
+Popular personas are asked the same questions again and again, and every one
+pays for retrieval and a full generation. With ANSWER_CACHE_ENABLED, answers
+are cached per persona, model and active prompts, and a new question whose
+embedding is within ANSWER_CACHE_SIMILARITY of a cached one is answered from
+the cache.
+
+Invalidation is by key: the active prompts are part of the bucket key, so
+editing a prompt starts a new bucket, and each persona has a generation
+counter, bumped whenever its documents change (invalidate_persona), that is
+part of the key as well. Stale buckets are never read again and expire
+(ANSWER_CACHE_TTL_SECONDS). An answer is stored in the bucket its lookup
+read, so one generated while the documents changed lands in the stale
+generation rather than the new one.
+
+Entries live in Redis so every API process shares them; without Redis the
+cache is process-local.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "answer_cache:"
+
+
+@dataclass
+class CachedAnswer:
+    """An answer served from the cache"""
+    answer: str
+    citations: List[Dict[str, Any]]
+    output_tokens: int
+    similarity: float
+    created_at: float
+
+
+def prompt_fingerprint(prompts: Dict[str, str]) -> str:
+    """Fingerprint of a persona's active prompts"""
+    return hashlib.sha256(json.dumps(prompts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def replay_chunks(answer: str, words: int) -> List[str]:
+    """Split a cached answer into stream pieces of a few words each (all of it if words <= 0)"""
+    if words <= 0:
+        return [answer]
+    pieces = re.findall(r"\s*\S+\s*", answer) or [answer]
+    return ["".join(pieces[i:i + words]) for i in range(0, len(pieces), words)]
+
+
+def _unit(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
+
+
+class AnswerCache:
+    """Answers keyed by persona, prompts and model, matched by query embedding"""
+
+    def __init__(self, redis_url: str = None):
+        """
+        Args:
+            redis_url: Redis shared by the API processes (REDIS_URL); the
+                cache is process-local if it is unreachable
+        """
+        self.enabled = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+        self.similarity = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+        self.ttl = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+        self.max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "200"))  # Per bucket
+        # Hits are streamed back in pieces of this many words, this far apart
+        self.replay_words = int(os.getenv("ANSWER_CACHE_REPLAY_WORDS", "3"))
+        self.replay_delay = float(os.getenv("ANSWER_CACHE_REPLAY_DELAY_MS", "0")) / 1000
+
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        # Bucket -> entry ID -> (unit query vector, entry, expiry)
+        self._buckets: Dict[str, "OrderedDict[str, Tuple[np.ndarray, Dict[str, Any], float]]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        self.redis_client = None
+        if self.enabled:
+            try:
+                client = redis.from_url(
+                    redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                    socket_connect_timeout=1, socket_timeout=2
+                )
+                client.ping()
+                self.redis_client = client
+                logger.info("Answer cache enabled (Redis)")
+            except Exception as e:
+                logger.info(f"Redis not available, answer cache is process-local: {e}")
+
+    def _generation_key(self, persona_id: str) -> str:
+        return f"{KEY_PREFIX}gen:{persona_id}"
+
+    def _generation(self, persona_id: str) -> int:
+        if self.redis_client is not None:
+            value = self.redis_client.get(self._generation_key(persona_id))
+            return int(value) if value else 0
+        with self._lock:
+            return self._generations.get(persona_id, 0)
+
+    def _bucket(self, persona_id: str, model: str, fingerprint: str) -> str:
+        scope = hashlib.sha256(f"{model}\0{fingerprint}".encode("utf-8")).hexdigest()[:16]
+        return f"{KEY_PREFIX}{persona_id}:{self._generation(persona_id)}:{scope}"
+
+    async def lookup(
+        self,
+        persona_id: str,
+        model: str,
+        fingerprint: str,
+        query_embedding: List[float]
+    ) -> Tuple[Optional[CachedAnswer], Optional[str]]:
+        """
+        Find a cached answer to a question similar enough to this one
+
+        Args:
+            persona_id: Persona asked
+            model: Model the answer must have come from
+            fingerprint: prompt_fingerprint() of the persona's active prompts
+            query_embedding: Embedding of the question
+
+        Returns:
+            The closest cached answer (or None), and the bucket that was
+            searched, to pass to store() (None if the cache is unavailable)
+        """
+        if not self.enabled:
+            return None, None
+        try:
+            bucket = await asyncio.to_thread(self._bucket, persona_id, model, fingerprint)
+            hit = await asyncio.to_thread(self._lookup_sync, bucket, query_embedding)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            bucket, hit = None, None
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            logger.info(f"Answer cache hit for persona {persona_id} (similarity {hit.similarity:.3f})")
+        return hit, bucket
+
+    def _lookup_sync(self, bucket: str, query_embedding) -> Optional[CachedAnswer]:
+        query = _unit(query_embedding)
+
+        if self.redis_client is not None:
+            stored = self.redis_client.hgetall(bucket + ":vectors")
+            if not stored:
+                return None
+            ids = list(stored)
+            matrix = np.stack([np.frombuffer(stored[entry_id], dtype=np.float32) for entry_id in ids])
+        else:
+            now = time.time()
+            with self._lock:
+                entries = self._buckets.get(bucket)
+                if not entries:
+                    return None
+                for entry_id in [k for k, (_, _, expires) in entries.items() if expires <= now]:
+                    del entries[entry_id]
+                if not entries:
+                    return None
+                ids = list(entries)
+                matrix = np.stack([entries[entry_id][0] for entry_id in ids])
+
+        if matrix.shape[1] != query.shape[0]:
+            return None
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+
+        if self.redis_client is not None:
+            payload = self.redis_client.hget(bucket + ":entries", ids[best])
+            if payload is None:
+                return None
+            entry = json.loads(payload)
+        else:
+            with self._lock:
+                entry = self._buckets[bucket][ids[best]][1]
+        return CachedAnswer(
+            answer=entry["answer"],
+            citations=entry["citations"],
+            output_tokens=entry.get("output_tokens", 0),
+            similarity=float(scores[best]),
+            created_at=entry.get("created_at", 0.0)
+        )
+
+    async def store(
+        self,
+        persona_id: str,
+        bucket: Optional[str],
+        query_embedding: List[float],
+        answer: str,
+        citations: List[Dict[str, Any]],
+        output_tokens: int
+    ):
+        """
+        Cache a generated answer; failures are logged, never raised
+
+        Args:
+            persona_id: Persona asked
+            bucket: Bucket returned by the lookup() for this question, so the
+                answer is kept under the document generation it was read
+                against (nothing is stored if None)
+        """
+        if not self.enabled or not answer or bucket is None:
+            return
+        entry = {
+            "answer": answer,
+            "citations": citations,
+            "output_tokens": output_tokens,
+            "created_at": time.time()
+        }
+        try:
+            await asyncio.to_thread(self._store_sync, persona_id, bucket, _unit(query_embedding), entry)
+            with self._lock:
+                self.stores += 1
+        except Exception as e:
+            logger.warning(f"Failed to cache answer for persona {persona_id}: {e}")
+
+    def _store_sync(self, persona_id: str, bucket: str, vector: np.ndarray, entry: Dict[str, Any]):
+        entry_id = uuid.uuid4().hex
+
+        if self.redis_client is None:
+            with self._lock:
+                if not bucket.startswith(f"{KEY_PREFIX}{persona_id}:{self._generations.get(persona_id, 0)}:"):
+                    return  # Invalidated since the lookup; the bucket is never read again
+                entries = self._buckets.setdefault(bucket, OrderedDict())
+                entries[entry_id] = (vector, entry, time.time() + self.ttl)
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+            return
+
+        order_key = bucket + ":order"
+        pipe = self.redis_client.pipeline()
+        pipe.hset(bucket + ":vectors", entry_id, vector.tobytes())
+        pipe.hset(bucket + ":entries", entry_id, json.dumps(entry))
+        pipe.rpush(order_key, entry_id)
+        for key in (bucket + ":vectors", bucket + ":entries", order_key):
+            pipe.expire(key, self.ttl)
+        pipe.llen(order_key)
+        excess = pipe.execute()[-1] - self.max_entries
+        if excess > 0:
+            # Evict the oldest entries of the bucket
+            evicted = self.redis_client.lpop(order_key, excess) or []
+            if evicted:
+                pipe = self.redis_client.pipeline()
+                pipe.hdel(bucket + ":vectors", *evicted)
+                pipe.hdel(bucket + ":entries", *evicted)
+                pipe.execute()
+
+    def invalidate_persona(self, persona_id: str):
+        """
+        Drop a persona's cached answers (call when its documents change)
+
+        Safe to call from any thread; failures are logged, never raised.
+        """
+        if not self.enabled:
+            return
+        try:
+            if self.redis_client is not None:
+                self.redis_client.incr(self._generation_key(persona_id))
+            else:
+                with self._lock:
+                    self._generations[persona_id] = self._generations.get(persona_id, 0) + 1
+                    prefix = f"{KEY_PREFIX}{persona_id}:"
+                    for bucket in [b for b in self._buckets if b.startswith(prefix)]:
+                        del self._buckets[bucket]
+            logger.info(f"Invalidated cached answers of persona {persona_id}")
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached answers of persona {persona_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit and store counters for this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "transport": "redis" if self.redis_client is not None else "local",
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# Singleton instance
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    """Get the process-wide answer cache"""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
@@ -11,6 +11,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import desc, and_, func, select, update
 from models import PromptVersion, PromptLayer
+from services.prompt_cache import get_prompt_cache
 import uuid
 from datetime import datetime
 
@@ -147,6 +148,8 @@ class AsyncPromptVersionService:
         
         await db.commit()
         await db.refresh(version)
+        # Other API processes see the change on their next prompt lookup
+        get_prompt_cache().invalidate_persona(version.persona_id)
         
         return version
     
@@ -0,0 +1,346 @@
+"""
+Content-addressed blob store for uploaded files
+
+Uploads are written once to a directory shared by the API and the workers
+(BLOB_STORE_DIR, e.g. a shared volume), keyed by the SHA-256 of their bytes.
+Jobs carry only the hash; workers map the file into memory instead of
+decoding a base64 copy out of the job payload. Writing a blob that is already
+stored is a no-op, so re-uploads of identical files cost nothing extra.
+
+Because a blob can be shared by several uploads and jobs, each of them holds
+it with an expiring marker file (refs/<hash>/<holder>). A blob is deleted
+once nothing holds it: an upload holds its files until its job takes them
+over (or the upload is rejected), a job until it completes, and a failed job
+for a while longer so it can be requeued. Blobs whose holders died are
+removed by a periodic sweep after their holds expire.
+"""
+
+import os
+import mmap
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class BlobStore:
+    """SHA-256 addressed files under a root directory"""
+
+    def __init__(self, root: str = None):
+        """
+        Args:
+            root: Directory for the blobs (BLOB_STORE_DIR)
+        """
+        self.root = os.path.abspath(root or os.getenv("BLOB_STORE_DIR", "blob_store"))
+        self._tmp_dir = os.path.join(self.root, "tmp")
+        self._refs_dir = os.path.join(self.root, "refs")
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        os.makedirs(self._refs_dir, exist_ok=True)
+
+        # How long holds last if their holder never releases them
+        self.upload_hold_seconds = float(os.getenv("BLOB_UPLOAD_HOLD_SECONDS", "3600"))
+        self.job_hold_seconds = float(os.getenv("BLOB_JOB_HOLD_SECONDS", str(7 * 86400)))
+        self.failed_job_hold_seconds = float(os.getenv("BLOB_FAILED_JOB_HOLD_SECONDS", str(3 * 86400)))
+        # Unheld blobs (and temp files) older than this are removed by sweep()
+        self.orphan_seconds = float(os.getenv("BLOB_ORPHAN_SECONDS", "86400"))
+        self.sweep_interval_seconds = float(os.getenv("BLOB_SWEEP_INTERVAL_SECONDS", "3600"))
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    @staticmethod
+    def hash_bytes(content: BytesLike) -> str:
+        """SHA-256 hex digest used as a blob's key"""
+        return hashlib.sha256(content).hexdigest()
+
+    def path(self, blob_hash: str) -> str:
+        """Path of a blob; two levels of fan-out keep directories small"""
+        if len(blob_hash) != 64 or any(c not in "0123456789abcdef" for c in blob_hash):
+            raise ValueError(f"Invalid blob hash: {blob_hash!r}")
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def _holds_dir(self, blob_hash: str) -> str:
+        self.path(blob_hash)  # Validates the hash
+        return os.path.join(self._refs_dir, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.exists(self.path(blob_hash))
+
+    def missing(self, blob_hashes: Iterable[str]) -> List[str]:
+        """The hashes in blob_hashes that are not stored"""
+        return [blob_hash for blob_hash in blob_hashes if not self.exists(blob_hash)]
+
+    def put(self, content: BytesLike, blob_hash: str = None) -> str:
+        """
+        Store content, unless a blob with the same hash already exists
+
+        Args:
+            content: File bytes
+            blob_hash: SHA-256 of content, if the caller already computed it
+
+        Returns:
+            The blob hash
+        """
+        blob_hash = blob_hash or self.hash_bytes(content)
+        if os.path.exists(self.path(blob_hash)):
+            logger.debug(f"Blob {blob_hash[:12]} already stored")
+            return blob_hash
+
+        writer = self.writer()
+        try:
+            writer.write(content)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def hold(self, blob_hashes: Iterable[str], holder: str, ttl_seconds: float):
+        """
+        Keep blobs from being deleted, or extend an existing hold
+
+        Args:
+            blob_hashes: Blobs to hold (they need not be stored yet)
+            holder: Who holds them, e.g. "job-<id>"
+            ttl_seconds: The hold lapses after this long unless renewed
+        """
+        expires_at = time.time() + ttl_seconds
+        for blob_hash in set(blob_hashes):
+            holds_dir = self._holds_dir(blob_hash)
+            os.makedirs(holds_dir, exist_ok=True)
+            marker = os.path.join(holds_dir, holder)
+            with open(marker, "a"):
+                pass
+            # The marker's mtime is its expiry
+            os.utime(marker, (expires_at, expires_at))
+
+    def release(self, blob_hashes: Iterable[str], holder: str) -> int:
+        """
+        Drop a holder's holds and delete the blobs nothing else holds
+
+        Returns:
+            Number of blobs deleted
+        """
+        deleted = 0
+        for blob_hash in set(blob_hashes):
+            try:
+                os.unlink(os.path.join(self._holds_dir(blob_hash), holder))
+            except FileNotFoundError:
+                pass
+            if self._delete_if_unheld(blob_hash):
+                deleted += 1
+        if deleted:
+            logger.info(f"Deleted {deleted} blobs released by {holder}")
+        self._maybe_sweep()
+        return deleted
+
+    def hold_for_job(self, job_id: str, blob_hashes: Iterable[str]):
+        """Hold a queued or running job's files"""
+        self.hold(blob_hashes, f"job-{job_id}", self.job_hold_seconds)
+
+    def keep_for_requeue(self, job_id: str, blob_hashes: Iterable[str]):
+        """Hold a failed job's files for BLOB_FAILED_JOB_HOLD_SECONDS, so it can be requeued"""
+        self.hold(blob_hashes, f"job-{job_id}", self.failed_job_hold_seconds)
+
+    def release_job(self, job_id: str, blob_hashes: Iterable[str]) -> int:
+        """Release a finished job's files"""
+        return self.release(blob_hashes, f"job-{job_id}")
+
+    def settle_job(self, job_id: str, blob_hashes: Iterable[str], failed: bool):
+        """
+        Release a finished job's files, or keep a failed job's for requeue;
+        failures are logged, never raised
+        """
+        blob_hashes = [blob_hash for blob_hash in blob_hashes if blob_hash]
+        try:
+            if failed:
+                self.keep_for_requeue(job_id, blob_hashes)
+            else:
+                self.release_job(job_id, blob_hashes)
+        except Exception as e:
+            logger.warning(f"Failed to settle the files of job {job_id}: {e}")
+
+    def _holders(self, blob_hash: str) -> List[str]:
+        """Current holders of a blob; expired holds are removed on the way"""
+        holds_dir = self._holds_dir(blob_hash)
+        now = time.time()
+        holders = []
+        try:
+            entries = list(os.scandir(holds_dir))
+        except FileNotFoundError:
+            return holders
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime > now:
+                    holders.append(entry.name)
+                else:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+        return holders
+
+    def _delete_if_unheld(self, blob_hash: str) -> bool:
+        if self._holders(blob_hash):
+            return False
+        # Move the blob aside before the final check: a writer holds the blob
+        # before installing it, so either the check sees its hold and the
+        # blob is put back, or the writer finds it missing and installs it
+        target = self.path(blob_hash)
+        trash = os.path.join(self._tmp_dir, f"{blob_hash}.{uuid.uuid4().hex}.deleted")
+        try:
+            os.replace(target, trash)
+        except FileNotFoundError:
+            return False
+        if self._holders(blob_hash):
+            os.replace(trash, target)
+            return False
+        os.unlink(trash)
+        try:
+            os.rmdir(self._holds_dir(blob_hash))
+        except OSError:
+            pass
+        logger.debug(f"Deleted blob {blob_hash[:12]}")
+        return True
+
+    def _maybe_sweep(self):
+        with self._sweep_lock:
+            if time.monotonic() - self._last_sweep < self.sweep_interval_seconds and self._last_sweep:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.warning(f"Blob sweep failed: {e}")
+
+    def sweep(self) -> int:
+        """
+        Delete unheld blobs older than BLOB_ORPHAN_SECONDS, such as those of
+        failed jobs whose hold expired, and leftover temp files
+
+        Returns:
+            Number of blobs deleted
+        """
+        cutoff = time.time() - self.orphan_seconds
+        deleted = 0
+        for entry in os.scandir(self._tmp_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+        for first in os.scandir(self.root):
+            if not first.is_dir() or len(first.name) != 2:
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                for entry in os.scandir(second.path):
+                    try:
+                        if entry.stat().st_mtime < cutoff and self._delete_if_unheld(entry.name):
+                            deleted += 1
+                    except (FileNotFoundError, ValueError):
+                        pass
+        if deleted:
+            logger.info(f"Blob sweep deleted {deleted} unheld blobs")
+        return deleted
+
+    def writer(self) -> "BlobWriter":
+        """Start a blob whose bytes arrive incrementally"""
+        return BlobWriter(self)
+
+    def _install(self, tmp_path: str, blob_hash: str, size: int):
+        """Move a fully written temp file into place (or drop it if the blob exists)"""
+        target = self.path(blob_hash)
+        if os.path.exists(target):
+            os.unlink(tmp_path)
+            logger.debug(f"Blob {blob_hash[:12]} already stored")
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Rename so readers never see a partial blob
+        os.replace(tmp_path, target)
+        logger.info(f"Stored blob {blob_hash[:12]} ({size} bytes)")
+
+    def open(self, blob_hash: str) -> BytesLike:
+        """
+        Map a blob into memory, read-only
+
+        The result supports the buffer protocol; use it in a `with` block
+        so the mapping is released when done.
+
+        Raises:
+            FileNotFoundError: If the blob is not stored
+        """
+        with open(self.path(blob_hash), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")  # Empty files cannot be mapped
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BlobWriter:
+    """
+    Writes a blob to a temp file, hashing the bytes as they arrive
+
+    Call commit() once all bytes are written, or abort() to discard them.
+    """
+
+    def __init__(self, store: BlobStore):
+        self._store = store
+        handle, self._tmp_path = tempfile.mkstemp(dir=store._tmp_dir)
+        self._file = os.fdopen(handle, "wb")
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: BytesLike):
+        self._file.write(data)
+        self._sha256.update(data)
+        self.size += len(data)
+
+    def commit(self, holder: Optional[str] = None, ttl_seconds: Optional[float] = None) -> str:
+        """
+        Finish the blob and return its hash
+
+        Args:
+            holder: Hold the blob for this holder (see BlobStore.hold); the
+                hold is taken before the blob is installed, so a concurrent
+                release cannot delete an existing copy from under it
+            ttl_seconds: Hold duration, BLOB_UPLOAD_HOLD_SECONDS by default
+        """
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            blob_hash = self._sha256.hexdigest()
+            if holder is not None:
+                self._store.hold([blob_hash], holder, ttl_seconds or self._store.upload_hold_seconds)
+            self._store._install(self._tmp_path, blob_hash, self.size)
+        except BaseException:
+            self.abort()
+            raise
+        return blob_hash
+
+    def abort(self):
+        """Discard the bytes written so far"""
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except OSError:
+            pass
+
+
+# Singleton instance
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Get the shared blob store"""
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = BlobStore()
+    return _blob_store
@@ -1,10 +1,30 @@
+import re
 import tiktoken
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import Iterable, Iterator, List, Dict, Tuple
 import logging
 from dataclasses import dataclass
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+# Text is tokenized in segments of about this many characters, so memory stays
+# flat regardless of document size
+SEGMENT_CHARS = 1 << 20
+
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[9, 10, 11, 12, 13, 32]] = True
+_SENTENCE_END = np.zeros(256, dtype=bool)
+_SENTENCE_END[[ord('.'), ord('!'), ord('?')]] = True
+
+# Surrogate code points are not valid in UTF-8 text (PDF extraction can
+# produce them)
+_SURROGATES = re.compile('[\ud800-\udfff]')
+
+def _replace_surrogates(text: str) -> str:
+    """Replace each surrogate with U+FFFD, keeping character offsets unchanged"""
+    return _SURROGATES.sub('\ufffd', text)
+
 @dataclass
 class Chunk:
     text: str
@@ -13,6 +33,117 @@ class Chunk:
     char_end: int
     token_count: int
 
+@lru_cache(maxsize=None)
+def _token_byte_lengths(encoding_name: str) -> np.ndarray:
+    """Byte length of every token in the encoding's vocabulary"""
+    encoding = tiktoken.get_encoding(encoding_name)
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # Unused ids between the mergeable ranks and special tokens
+    return lengths
+
+class _Segment:
+    """
+    Byte-level view of one tokenized segment of text
+
+    Holds token start offsets and sorted arrays of boundary positions (all in
+    UTF-8 byte offsets) so chunk boundaries can be chosen with binary searches
+    instead of re-encoding candidate text.
+    """
+
+    def __init__(self, text: str, tokens: List[int], token_lengths: np.ndarray):
+        self.text = text
+        self.data = text.encode('utf-8')
+        b = np.frombuffer(self.data, dtype=np.uint8)
+        size = len(b)
+
+        token_bytes = token_lengths[np.asarray(tokens, dtype=np.int64)]
+        self.token_starts = np.zeros(len(tokens), dtype=np.int64)
+        if len(tokens) > 1:
+            np.cumsum(token_bytes[:-1], out=self.token_starts[1:])
+        self.token_count = len(tokens)
+
+        ws = _WHITESPACE[b]
+        positions = np.arange(size, dtype=np.int64)
+        # Position of the first non-whitespace byte at or after p (size if none)
+        self.next_content = np.empty(size + 1, dtype=np.int64)
+        self.next_content[size] = size
+        self.next_content[:size] = np.minimum.accumulate(np.where(ws, size, positions)[::-1])[::-1]
+        # Position of the last non-whitespace byte strictly before p (-1 if none)
+        last_content = np.empty(size + 1, dtype=np.int64)
+        last_content[0] = -1
+        last_content[1:] = np.maximum.accumulate(np.where(ws, -1, positions))
+        self.content_end = int(last_content[size]) + 1
+
+        newlines = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(b == 10, out=newlines[1:])
+
+        # Word ends: first whitespace byte after a word; word starts: first byte of a word
+        prev_ws = np.concatenate(([True], ws[:-1]))
+        next_ws = np.concatenate((ws[1:], [True]))
+        word_ends = np.flatnonzero(~ws & next_ws) + 1
+        word_starts = np.flatnonzero(~ws & prev_ws)
+
+        # A gap of whitespace containing a blank line separates paragraphs
+        end_gap_newlines = newlines[self.next_content[word_ends]] - newlines[word_ends]
+        start_gap_begin = last_content[word_starts] + 1
+        start_gap_newlines = newlines[word_starts] - newlines[start_gap_begin]
+
+        ends_sentence = _SENTENCE_END[b[word_ends - 1]] if len(word_ends) else np.zeros(0, dtype=bool)
+        prev_char = b[np.maximum(last_content[word_starts], 0)]
+        starts_sentence = (last_content[word_starts] < 0) | _SENTENCE_END[prev_char] | (start_gap_newlines >= 2)
+
+        self.paragraph_ends = word_ends[end_gap_newlines >= 2]
+        self.sentence_ends = word_ends[ends_sentence | (end_gap_newlines >= 2)]
+        self.word_ends = word_ends
+        self.sentence_starts = word_starts[starts_sentence]
+        self.word_starts = word_starts
+
+        # Byte -> character offset map, only needed for non-ASCII text
+        if size != len(text):
+            self.char_offsets = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum((b & 0xC0) != 0x80, out=self.char_offsets[1:])
+        else:
+            self.char_offsets = None
+
+    def token_at(self, position: int) -> int:
+        """Index of the token containing byte `position`"""
+        return int(np.searchsorted(self.token_starts, position, side='right')) - 1
+
+    def tokens_before(self, position: int) -> int:
+        """Number of tokens starting before byte `position`"""
+        return int(np.searchsorted(self.token_starts, position, side='left'))
+
+    def snap_to_char(self, position: int) -> int:
+        """Move a byte offset back onto a UTF-8 character boundary"""
+        while 0 < position < len(self.data) and (self.data[position] & 0xC0) == 0x80:
+            position -= 1
+        return position
+
+    def to_char(self, position: int) -> int:
+        if self.char_offsets is None:
+            return position
+        return int(self.char_offsets[position])
+
+    @staticmethod
+    def last_in(boundaries: np.ndarray, low: int, high: int) -> int:
+        """Largest boundary in (low, high], or -1"""
+        index = int(np.searchsorted(boundaries, high, side='right')) - 1
+        if index >= 0 and boundaries[index] > low:
+            return int(boundaries[index])
+        return -1
+
+    @staticmethod
+    def first_in(boundaries: np.ndarray, low: int, high: int) -> int:
+        """Smallest boundary in [low, high), or -1"""
+        index = int(np.searchsorted(boundaries, low, side='left'))
+        if index < len(boundaries) and boundaries[index] < high:
+            return int(boundaries[index])
+        return -1
+
 class TextChunker:
     def __init__(
         self,
@@ -22,7 +153,7 @@ class TextChunker:
     ):
         """
         Initialize text chunker with token-based chunking
-        
+
         Args:
             chunk_size: Maximum tokens per chunk
             chunk_overlap: Number of overlapping tokens between chunks
@@ -30,170 +161,179 @@ class TextChunker:
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
         self.encoding = tiktoken.get_encoding(encoding_name)
-        
+
         if chunk_overlap >= chunk_size:
             raise ValueError("Chunk overlap must be less than chunk size")
-    
+
     def count_tokens(self, text: str) -> int:
         """Count tokens in text"""
         return len(self.encoding.encode(text))
-    
+
     def chunk_text(self, text: str, source: str = "document") -> List[Dict]:
         """
         Split text into overlapping chunks based on token count
-        
+
         Args:
             text: Text to chunk
             source: Source identifier for metadata
-        
+
         Returns:
             List of chunk dictionaries with metadata
         """
         if not text or not text.strip():
             return []
-        
-        # First, split by paragraphs to maintain some semantic coherence
-        paragraphs = text.split('\n\n')
-        
-        chunks = []
-        current_chunk = []
-        current_tokens = 0
-        current_char_start = 0
+
+        chunks = list(self.iter_chunks([text], source=source))
+        logger.info(f"Created {len(chunks)} chunks from {len(text)} characters")
+        return chunks
+
+    def iter_chunks(self, pieces: Iterable[str], source: str = "document") -> Iterator[Dict]:
+        """
+        Chunk a stream of text pieces (e.g. PDF pages) without holding the whole document
+
+        The text is tokenized once, in segments of about SEGMENT_CHARS characters.
+        Each chunk ends at the last paragraph break in its token window, falling
+        back to a sentence break, a word break and finally a hard cut, and is
+        at least half a window long unless the document ends first. The next
+        chunk starts chunk_overlap tokens back, snapped forward to a sentence
+        or word start. Surrogate code points are replaced with U+FFFD.
+
+        Args:
+            pieces: Consecutive pieces of the document text
+            source: Source identifier for metadata
+
+        Yields:
+            Chunk dictionaries, in order, with character offsets into the
+            concatenated text
+        """
+        token_lengths = _token_byte_lengths(self.encoding_name)
+        pending: List[str] = []
+        pending_chars = 0
+        buffer = ""
+        base = 0
         chunk_id = 0
-        
-        for para_idx, paragraph in enumerate(paragraphs):
-            if not paragraph.strip():
-                continue
-            
-            para_tokens = self.count_tokens(paragraph)
-            
-            # If single paragraph is too large, split it
-            if para_tokens > self.chunk_size:
-                # Split paragraph by sentences or words
-                sentences = self._split_paragraph(paragraph)
-                
-                for sentence in sentences:
-                    sent_tokens = self.count_tokens(sentence)
-                    
-                    if current_tokens + sent_tokens > self.chunk_size and current_chunk:
-                        # Save current chunk
-                        chunk_text = '\n\n'.join(current_chunk)
-                        chunks.append(self._create_chunk_dict(
-                            chunk_text,
-                            chunk_id,
-                            current_char_start,
-                            current_char_start + len(chunk_text),
-                            source,
-                            current_tokens
-                        ))
-                        
-                        # Start new chunk with overlap
-                        overlap_text = self._get_overlap_text(current_chunk, self.chunk_overlap)
-                        current_chunk = [overlap_text] if overlap_text else []
-                        current_tokens = self.count_tokens('\n\n'.join(current_chunk)) if current_chunk else 0
-                        current_char_start += len(chunk_text) - len(overlap_text) if overlap_text else len(chunk_text)
+
+        def drain(final: bool) -> Iterator[Dict]:
+            nonlocal buffer, base, chunk_id
+            while buffer:
+                if not final and len(buffer) < SEGMENT_CHARS:
+                    return
+                is_last = final and len(buffer) <= SEGMENT_CHARS
+                segment_text = buffer if is_last else buffer[:SEGMENT_CHARS]
+                tokens = self.encoding.encode_ordinary(segment_text)
+                segment = _Segment(segment_text, tokens, token_lengths)
+                consumed = len(segment_text) if is_last else None
+                emitted = False
+                for chunk, carry in self._chunk_segment(segment, base, chunk_id, source, is_last):
+                    if chunk is None:
+                        consumed = carry
+                        break
+                    chunk_id += 1
+                    emitted = True
+                    yield chunk
+                if is_last:
+                    buffer = ""
+                    return
+                if consumed is None and emitted:
+                    # The last window ended at the segment's last content;
+                    # only whitespace is left
+                    consumed = len(segment_text)
+                if not consumed:
+                    # A single window spans the whole segment (pathologically
+                    # token-sparse text); cut it as if the document ended here
+                    for chunk, _ in self._chunk_segment(segment, base, chunk_id, source, True):
                         chunk_id += 1
-                    
-                    current_chunk.append(sentence)
-                    current_tokens += sent_tokens
-            
-            # If adding the paragraph doesn't exceed limit, add it
-            elif current_tokens + para_tokens <= self.chunk_size:
-                current_chunk.append(paragraph)
-                current_tokens += para_tokens
-            
-            # Otherwise, save current chunk and start new one
+                        yield chunk
+                    consumed = len(segment_text)
+                buffer = buffer[consumed:]
+                base += consumed
+
+        for piece in pieces:
+            if not piece:
+                continue
+            pending.append(_replace_surrogates(piece))
+            pending_chars += len(piece)
+            if pending_chars >= SEGMENT_CHARS:
+                buffer += "".join(pending)
+                pending, pending_chars = [], 0
+                yield from drain(final=False)
+
+        buffer += "".join(pending)
+        yield from drain(final=True)
+
+    def _chunk_segment(
+        self,
+        segment: _Segment,
+        base: int,
+        first_chunk_id: int,
+        source: str,
+        final: bool
+    ) -> Iterator[Tuple[Dict, int]]:
+        """
+        Cut one segment into chunks
+
+        Yields (chunk, 0) for every chunk. When the segment is not the last
+        one, the window that would reach past the segment end is not emitted;
+        instead (None, char_offset) is yielded with the offset where the next
+        segment must start.
+        """
+        chunk_id = first_chunk_id
+        min_fill = max(1, self.chunk_size // 2)
+        position = int(segment.next_content[0])
+
+        while position < segment.content_end:
+            first_token = max(segment.token_at(position), 0)
+            window_end = first_token + self.chunk_size
+
+            if window_end >= segment.token_count:
+                if not final:
+                    yield None, segment.to_char(position)
+                    return
+                end = segment.content_end
             else:
-                if current_chunk:
-                    chunk_text = '\n\n'.join(current_chunk)
-                    chunks.append(self._create_chunk_dict(
-                        chunk_text,
-                        chunk_id,
-                        current_char_start,
-                        current_char_start + len(chunk_text),
-                        source,
-                        current_tokens
-                    ))
-                    
-                    # Start new chunk with overlap
-                    overlap_text = self._get_overlap_text(current_chunk, self.chunk_overlap)
-                    current_chunk = [overlap_text] if overlap_text else []
-                    current_tokens = self.count_tokens('\n\n'.join(current_chunk)) if current_chunk else 0
-                    current_char_start += len(chunk_text) - len(overlap_text) if overlap_text else len(chunk_text)
-                    chunk_id += 1
-                
-                current_chunk.append(paragraph)
-                current_tokens = para_tokens
-        
-        # Don't forget the last chunk
-        if current_chunk:
-            chunk_text = '\n\n'.join(current_chunk)
-            chunks.append(self._create_chunk_dict(
-                chunk_text,
+                limit = int(segment.token_starts[window_end])
+                low = int(segment.token_starts[first_token + min_fill])
+                end = segment.last_in(segment.paragraph_ends, low, limit)
+                if end < 0:
+                    end = segment.last_in(segment.sentence_ends, low, limit)
+                if end < 0:
+                    end = segment.last_in(segment.word_ends, low, limit)
+                if end < 0:
+                    end = segment.snap_to_char(limit)
+                    if end <= position:
+                        end = limit
+
+            char_start = segment.to_char(position)
+            char_end = segment.to_char(end)
+            yield self._create_chunk_dict(
+                segment.text[char_start:char_end],
                 chunk_id,
-                current_char_start,
-                current_char_start + len(chunk_text),
+                base + char_start,
+                base + char_end,
                 source,
-                current_tokens
-            ))
-        
-        logger.info(f"Created {len(chunks)} chunks from {len(text)} characters")
-        return chunks
-    
-    def _split_paragraph(self, paragraph: str) -> List[str]:
-        """Split a paragraph into smaller parts (sentences or phrases)"""
-        # Simple sentence splitting - can be improved with NLTK or spaCy
-        import re
-        sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-        
-        result = []
-        for sentence in sentences:
-            if self.count_tokens(sentence) > self.chunk_size:
-                # If even a sentence is too long, split by commas or words
-                parts = sentence.split(', ')
-                for part in parts:
-                    if self.count_tokens(part) <= self.chunk_size:
-                        result.append(part)
-                    else:
-                        # Last resort: split by words
-                        words = part.split()
-                        current_part = []
-                        for word in words:
-                            current_part.append(word)
-                            if self.count_tokens(' '.join(current_part)) > self.chunk_size * 0.8:
-                                result.append(' '.join(current_part))
-                                current_part = []
-                        if current_part:
-                            result.append(' '.join(current_part))
-            else:
-                result.append(sentence)
-        
-        return result
-    
-    def _get_overlap_text(self, chunks: List[str], overlap_tokens: int) -> str:
-        """Get text from the end of chunks that contains approximately overlap_tokens"""
-        if not chunks:
-            return ""
-        
-        # Start from the last chunk and work backwards
-        overlap_text = []
-        current_tokens = 0
-        
-        for chunk in reversed(chunks):
-            sentences = chunk.split('. ')
-            for sentence in reversed(sentences):
-                sent_tokens = self.count_tokens(sentence)
-                if current_tokens + sent_tokens <= overlap_tokens:
-                    overlap_text.insert(0, sentence)
-                    current_tokens += sent_tokens
-                else:
-                    break
-            if current_tokens >= overlap_tokens * 0.8:  # Allow some flexibility
-                break
-        
-        return '. '.join(overlap_text)
-    
+                segment.tokens_before(end) - first_token
+            ), 0
+            chunk_id += 1
+
+            if end >= segment.content_end:
+                return
+
+            # Step back by the overlap, snapped forward to a sentence or word start
+            last_token = segment.tokens_before(end)
+            target = int(segment.token_starts[max(first_token + 1, last_token - self.chunk_overlap)])
+            next_position = -1
+            if self.chunk_overlap > 0 and target < end:
+                next_position = segment.first_in(segment.sentence_starts, target, end)
+                if next_position < 0:
+                    next_position = segment.first_in(segment.word_starts, target, end)
+                if next_position < 0 and not segment.word_starts.size:
+                    next_position = segment.snap_to_char(target)
+            if next_position <= position:
+                next_position = int(segment.next_content[end])
+            position = next_position
+
     def _create_chunk_dict(
         self,
         text: str,
@@ -0,0 +1,167 @@
+"""
+Pooled, long-lived provider HTTP clients
+
+Creating an AsyncOpenAI client per call costs a fresh TCP+TLS handshake on
+every embedding request. This module keeps one client per event loop with
+keep-alive connections instead. httpx connections are bound to the loop
+that opened them, so clients are never shared across loops (the API loop,
+ingestion worker loops), and the pool resets itself after a fork so RQ
+work horses never reuse the parent's sockets.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderClientPool:
+    """Per-process, per-event-loop cache of AsyncOpenAI clients"""
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+        self.max_keepalive = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+        self.keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "60"))
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self.clients_created = 0
+        self.requests_total = 0
+        self.responses_total = 0
+        self.error_responses = 0
+        self.total_request_seconds = 0.0
+
+    def _check_fork(self):
+        """Drop clients inherited from a parent process"""
+        if os.getpid() != self._pid:
+            # The inherited sockets belong to the parent; just forget them
+            self._clients = weakref.WeakKeyDictionary()
+            self._pid = os.getpid()
+            self._reset_metrics()
+            logger.info("Provider client pool reset after fork")
+
+    def get_openai_client(self) -> AsyncOpenAI:
+        """
+        Get the AsyncOpenAI client for the running event loop, creating it if needed
+
+        Returns:
+            A client whose connections stay open across calls
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_fork()
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._create_openai_client()
+                self._clients[loop] = client
+            return client
+
+    def _create_openai_client(self) -> AsyncOpenAI:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
+            }
+        )
+        self.clients_created += 1
+        return AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+    async def _on_request(self, request: httpx.Request):
+        request.extensions["pool_started_at"] = time.perf_counter()
+        self.requests_total += 1
+
+    async def _on_response(self, response: httpx.Response):
+        self.responses_total += 1
+        started_at = response.request.extensions.get("pool_started_at")
+        if started_at is not None:
+            self.total_request_seconds += time.perf_counter() - started_at
+        if response.status_code >= 400:
+            self.error_responses += 1
+
+    async def warm_up(self):
+        """Open a connection on the current loop so the first real call skips the handshake"""
+        try:
+            client = self.get_openai_client()
+            await client.models.retrieve("text-embedding-3-small")
+            logger.info("OpenAI connection pool warmed up")
+        except Exception as e:
+            logger.warning(f"OpenAI connection warm-up failed: {e}")
+
+    async def close_current_loop(self):
+        """Close the client bound to the running event loop, if any"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_fork()
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool configuration and request metrics for this process"""
+        with self._lock:
+            self._check_fork()
+            open_connections = 0
+            for client in list(self._clients.values()):
+                # httpcore's pool is not public API; report it when available
+                pool = getattr(getattr(client._client, "_transport", None), "_pool", None)
+                open_connections += len(getattr(pool, "connections", []) or [])
+            return {
+                "pid": self._pid,
+                "clients": len(self._clients),
+                "clients_created": self.clients_created,
+                "open_connections": open_connections,
+                "max_connections": self.max_connections,
+                "max_keepalive_connections": self.max_keepalive,
+                "requests_total": self.requests_total,
+                "responses_total": self.responses_total,
+                "error_responses": self.error_responses,
+                "avg_request_ms": (
+                    round(self.total_request_seconds / self.responses_total * 1000, 1)
+                    if self.responses_total else None
+                ),
+            }
+
+
+# Singleton instance
+_client_pool: Optional[ProviderClientPool] = None
+
+def get_client_pool() -> ProviderClientPool:
+    """Get singleton provider client pool instance"""
+    global _client_pool
+    if _client_pool is None:
+        _client_pool = ProviderClientPool()
+    return _client_pool
+
+async def release_after(coro):
+    """
+    Await `coro`, then close the pooled clients bound to the current loop
+
+    For call sites that spin up a throwaway loop (e.g. asyncio.run in a thread).
+    """
+    try:
+        return await coro
+    finally:
+        await get_client_pool().close_current_loop()
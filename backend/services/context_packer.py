@@ -0,0 +1,192 @@
+"""
+Token-budgeted context packing for chat
+
+Chat used to paste every retrieved chunk into the prompt, whatever its score,
+the model's context size or its overlap with the other chunks. The packer
+sits between similarity search and prompt building:
+
+1. Chunks scoring below CONTEXT_MIN_RELATIVE_SCORE times the best score are
+   dropped.
+2. The rest are ordered by maximal marginal relevance (MMR): each pick
+   maximizes lambda * relevance - (1 - lambda) * its highest similarity to a
+   chunk already picked, using the vectors returned with the matches.
+   Chunks nearly identical to a picked one are dropped.
+3. Chunks are added in that order while they fit the model's token budget;
+   one that does not fit is skipped for smaller ones after it. The first
+   chunk is always kept.
+
+Without vectors (a store that does not return them) step 2 keeps the score
+order.
+"""
+
+import os
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+from services.token_accounting import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Context windows (tokens) of the models chat can route to
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4": 8192,
+    "gpt-4-1106-preview": 128000,
+    "gpt-3.5": 16385,
+    "gpt-3.5-turbo": 16385,
+    "claude-3": 200000,
+    "claude-3-opus": 200000,
+    "claude-3-sonnet": 200000,
+    "claude-3-haiku": 200000
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+@dataclass
+class PackedContext:
+    """Chunks chosen for the prompt and what was left out"""
+    chunks: List[Dict[str, Any]]
+    tokens: int
+    budget: int
+    dropped_low_score: int = 0
+    dropped_redundant: int = 0
+    dropped_over_budget: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary for logs and debug events"""
+        return {
+            "kept": len(self.chunks),
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "dropped_low_score": self.dropped_low_score,
+            "dropped_redundant": self.dropped_redundant,
+            "dropped_over_budget": self.dropped_over_budget
+        }
+
+
+def context_window(model: str) -> int:
+    """Context window of a model, matching dated model names by prefix"""
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    prefixes = [name for name in MODEL_CONTEXT_WINDOWS if model.startswith(name)]
+    return MODEL_CONTEXT_WINDOWS[max(prefixes, key=len)] if prefixes else DEFAULT_CONTEXT_WINDOW
+
+
+def _unit_rows(vectors: List[List[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ContextPacker:
+    """Selects retrieved chunks for the prompt within a token budget"""
+
+    def __init__(self):
+        self.enabled = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+        self.min_relative_score = float(os.getenv("CONTEXT_MIN_RELATIVE_SCORE", "0.8"))
+        self.mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+        self.duplicate_similarity = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95"))
+        # Retrieved context may use at most this many tokens, and at most
+        # this fraction of the model's context window
+        self.max_tokens = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.window_fraction = float(os.getenv("CONTEXT_WINDOW_FRACTION", "0.5"))
+
+    def budget_for(self, model: str) -> int:
+        """Context token budget for a model"""
+        return min(self.max_tokens, int(context_window(model) * self.window_fraction))
+
+    def pack(self, matches: List[Dict[str, Any]], model: str) -> PackedContext:
+        """
+        Choose the matches to put in the prompt
+
+        Args:
+            matches: similarity_search results, best first; "values" (the
+                match's vector) is used for redundancy removal when present
+            model: Model the prompt is for
+
+        Returns:
+            The chosen matches in prompt order, with token and drop counts
+        """
+        budget = self.budget_for(model)
+        if not matches:
+            return PackedContext(chunks=[], tokens=0, budget=budget)
+
+        texts = [match["metadata"].get("text", "") for match in matches]
+        token_counts = [count_tokens(text) for text in texts]
+        if not self.enabled:
+            return PackedContext(chunks=list(matches), tokens=sum(token_counts), budget=budget)
+
+        # 1. Relative score cutoff (the best match always stays)
+        scores = np.asarray([match["score"] for match in matches], dtype=np.float64)
+        top_score = float(scores.max())
+        cutoff = top_score * self.min_relative_score if top_score > 0 else top_score
+        candidates = [i for i in range(len(matches)) if scores[i] >= cutoff]
+        dropped_low_score = len(matches) - len(candidates)
+
+        # 2. MMR order, dropping near-duplicates
+        order, dropped_redundant = self._mmr_order(matches, scores, candidates)
+
+        # 3. Greedy fill of the token budget (the first pick stays even if it alone is over)
+        chosen, used = [], 0
+        for i in order:
+            if used + token_counts[i] <= budget or not chosen:
+                chosen.append(i)
+                used += token_counts[i]
+        dropped_over_budget = len(order) - len(chosen)
+
+        packed = PackedContext(
+            chunks=[matches[i] for i in chosen],
+            tokens=used,
+            budget=budget,
+            dropped_low_score=dropped_low_score,
+            dropped_redundant=dropped_redundant,
+            dropped_over_budget=dropped_over_budget
+        )
+        logger.debug(f"Packed context for {model}: {packed.as_dict()}")
+        return packed
+
+    def _mmr_order(self, matches: List[Dict[str, Any]], scores: np.ndarray, candidates: List[int]):
+        """Candidates in MMR order, and how many were dropped as near-duplicates"""
+        if len(candidates) < 2 or any(not matches[i].get("values") for i in candidates):
+            return candidates, 0
+
+        vectors = _unit_rows([matches[i]["values"] for i in candidates])
+        similarity = vectors @ vectors.T
+        relevance = scores[candidates]
+
+        picked: List[int] = []  # Positions in candidates
+        remaining = list(range(len(candidates)))
+        dropped = 0
+        while remaining:
+            if picked:
+                redundancy = similarity[np.ix_(remaining, picked)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            duplicates = redundancy >= self.duplicate_similarity
+            if duplicates.any():
+                dropped += int(duplicates.sum())
+                remaining = [pos for pos, duplicate in zip(remaining, duplicates) if not duplicate]
+                if not remaining:
+                    break
+                redundancy = redundancy[~duplicates]
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(mmr))]
+            picked.append(best)
+            remaining.remove(best)
+
+        return [candidates[pos] for pos in picked], dropped
+
+
+# Singleton instance
+_context_packer = None
+
+def get_context_packer() -> ContextPacker:
+    """Get or create singleton context packer"""
+    global _context_packer
+    if _context_packer is None:
+        _context_packer = ContextPacker()
+    return _context_packer
@@ -0,0 +1,295 @@
+"""
+Near-duplicate chunk detection with MinHash + LSH
+
+Transcripts and books repeat intros, boilerplate and quoted passages across
+files. Each chunk gets a MinHash signature over its word shingles; signatures
+are banded into an LSH index persisted per persona in SQLite, so a new chunk
+whose estimated Jaccard similarity to an existing chunk (or an earlier chunk
+in the same batch) is above the threshold can be skipped before embedding.
+"""
+
+import os
+import re
+import zlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_SHINGLE_MULTIPLIER = np.uint64(1099511628211)  # FNV-1a 64-bit prime
+
+
+class MinHasher:
+    """Stable (process-independent) MinHash signatures for text"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self._word_ids: Dict[str, int] = {}
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())
+        if not words:
+            return np.zeros(1, dtype=np.uint64)
+        ids = np.empty(len(words), dtype=np.uint64)
+        for i, word in enumerate(words):
+            word_id = self._word_ids.get(word)
+            if word_id is None:
+                word_id = zlib.crc32(word.encode("utf-8"))
+                if len(self._word_ids) < 1_000_000:
+                    self._word_ids[word] = word_id
+            ids[i] = word_id
+
+        k = min(self.shingle_size, len(ids))
+        count = len(ids) - k + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for offset in range(k):
+                hashes = hashes * _SHINGLE_MULTIPLIER + ids[offset:offset + count]
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint64 values) for text"""
+        shingles = self._shingles(text) & np.uint64(0xFFFFFFFF)
+        # (a*x + b) mod p with 64-bit wraparound, as in common MinHash implementations
+        with np.errstate(over="ignore"):
+            hashed = (np.outer(shingles, self._a) + self._b) % _MERSENNE_PRIME
+        return hashed.min(axis=0)
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return float(np.count_nonzero(first == second)) / len(first)
+
+
+class DedupIndex:
+    """Persistent per-persona LSH index of chunk signatures"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        num_perm: int = 128,
+        bands: int = 32
+    ):
+        """
+        Args:
+            path: SQLite file for the index (DEDUP_INDEX_PATH)
+            threshold: Estimated Jaccard similarity at or above which a chunk is a duplicate (DEDUP_THRESHOLD)
+            num_perm: MinHash permutations per signature
+            bands: LSH bands; num_perm / bands rows per band
+        """
+        self.path = path or os.getenv("DEDUP_INDEX_PATH", "dedup_index.sqlite3")
+        self.threshold = threshold if threshold is not None else float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_signatures (
+                persona_id TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (persona_id, vector_id)
+            );
+            CREATE TABLE IF NOT EXISTS chunk_bands (
+                persona_id TEXT NOT NULL,
+                band_key INTEGER NOT NULL,
+                vector_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunk_bands_lookup ON chunk_bands (persona_id, band_key);
+            CREATE INDEX IF NOT EXISTS ix_chunk_bands_vector ON chunk_bands (persona_id, vector_id);
+            """
+        )
+        self._db.commit()
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        """One 63-bit key per band, salted with the band number"""
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = zlib.crc32(rows, band) << 31 ^ zlib.adler32(rows, band + 1)
+            keys.append(digest & 0x7FFFFFFFFFFFFFFF)
+        return keys
+
+    def find_duplicates(self, persona_id: str, texts: List[str]) -> Tuple[List[int], Dict[int, str], List[np.ndarray]]:
+        """
+        Split a batch of chunk texts into new and near-duplicate chunks
+
+        A chunk is a duplicate if it matches a chunk already indexed for the
+        persona or an earlier chunk of the same batch.
+
+        Args:
+            persona_id: Persona the chunks belong to
+            texts: Chunk texts, in order
+
+        Returns:
+            Tuple of (indices of chunks to keep,
+                      {duplicate index: matching vector id or "batch:<index>"},
+                      signatures for every text)
+        """
+        signatures = [self.hasher.signature(text) for text in texts]
+        band_keys = [self._band_keys(signature) for signature in signatures]
+
+        # Candidates from the persisted index, fetched once for the whole batch
+        all_keys = list({key for keys in band_keys for key in keys})
+        indexed: Dict[int, List[str]] = {}
+        with self._lock:
+            for i in range(0, len(all_keys), 500):
+                batch = all_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT band_key, vector_id FROM chunk_bands "
+                    f"WHERE persona_id = ? AND band_key IN ({placeholders})",
+                    [persona_id, *batch]
+                ).fetchall()
+                for band_key, vector_id in rows:
+                    indexed.setdefault(band_key, []).append(vector_id)
+        candidate_ids = list({vid for ids in indexed.values() for vid in ids})
+        stored = self._load_signatures(persona_id, candidate_ids)
+
+        keep: List[int] = []
+        duplicates: Dict[int, str] = {}
+        batch_bands: Dict[int, List[int]] = {}
+
+        for index, (signature, keys) in enumerate(zip(signatures, band_keys)):
+            match = None
+            seen = set()
+            for key in keys:
+                for vector_id in indexed.get(key, ()):
+                    if vector_id in seen or vector_id not in stored:
+                        continue
+                    seen.add(vector_id)
+                    if self.hasher.similarity(signature, stored[vector_id]) >= self.threshold:
+                        match = vector_id
+                        break
+                if match:
+                    break
+                for other in batch_bands.get(key, ()):
+                    if other in seen:
+                        continue
+                    seen.add(other)
+                    if self.hasher.similarity(signature, signatures[other]) >= self.threshold:
+                        match = f"batch:{other}"
+                        break
+                if match:
+                    break
+
+            if match:
+                duplicates[index] = match
+                continue
+            keep.append(index)
+            for key in keys:
+                batch_bands.setdefault(key, []).append(index)
+
+        return keep, duplicates, signatures
+
+    def _load_signatures(self, persona_id: str, vector_ids: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(vector_ids), 500):
+                batch = vector_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT vector_id, signature FROM chunk_signatures "
+                    f"WHERE persona_id = ? AND vector_id IN ({placeholders})",
+                    [persona_id, *batch]
+                ).fetchall()
+                for vector_id, blob in rows:
+                    found[vector_id] = np.frombuffer(blob, dtype=np.uint64)
+        return found
+
+    def add(self, persona_id: str, vector_ids: List[str], signatures: List[np.ndarray]):
+        """
+        Index signatures of chunks that were upserted
+
+        Args:
+            persona_id: Persona the chunks belong to
+            vector_ids: Vector IDs of the stored chunks
+            signatures: Their signatures from find_duplicates, in the same order
+        """
+        if not vector_ids:
+            return
+        signature_rows = [
+            (persona_id, vector_id, signature.tobytes())
+            for vector_id, signature in zip(vector_ids, signatures)
+        ]
+        band_rows = [
+            (persona_id, key, vector_id)
+            for vector_id, signature in zip(vector_ids, signatures)
+            for key in self._band_keys(signature)
+        ]
+        with self._lock:
+            # Re-indexing a vector id replaces its old bands
+            self._db.executemany(
+                "DELETE FROM chunk_bands WHERE persona_id = ? AND vector_id = ?",
+                [(persona_id, vector_id) for vector_id in vector_ids]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunk_signatures (persona_id, vector_id, signature) VALUES (?, ?, ?)",
+                signature_rows
+            )
+            self._db.executemany(
+                "INSERT INTO chunk_bands (persona_id, band_key, vector_id) VALUES (?, ?, ?)",
+                band_rows
+            )
+            self._db.commit()
+
+    def remove(self, persona_id: str, vector_ids: List[str]):
+        """Drop indexed chunks whose vectors were deleted"""
+        if not vector_ids:
+            return
+        rows = [(persona_id, vector_id) for vector_id in vector_ids]
+        with self._lock:
+            self._db.executemany("DELETE FROM chunk_bands WHERE persona_id = ? AND vector_id = ?", rows)
+            self._db.executemany("DELETE FROM chunk_signatures WHERE persona_id = ? AND vector_id = ?", rows)
+            self._db.commit()
+
+    def delete_persona(self, persona_id: str):
+        """Drop a persona's whole index"""
+        with self._lock:
+            self._db.execute("DELETE FROM chunk_bands WHERE persona_id = ?", (persona_id,))
+            self._db.execute("DELETE FROM chunk_signatures WHERE persona_id = ?", (persona_id,))
+            self._db.commit()
+        logger.info(f"Deleted dedup index for persona {persona_id}")
+
+
+# Singleton instance
+_dedup_index = None
+_dedup_index_lock = threading.Lock()
+
+def get_dedup_index() -> Optional[DedupIndex]:
+    """
+    Get the shared dedup index, or None when disabled
+
+    Set DEDUP_ENABLED=false to embed every chunk.
+    """
+    global _dedup_index
+    if os.getenv("DEDUP_ENABLED", "true").lower() != "true":
+        return None
+    if _dedup_index is None:
+        with _dedup_index_lock:
+            if _dedup_index is None:
+                try:
+                    _dedup_index = DedupIndex()
+                except Exception as e:
+                    logger.error(f"Failed to open dedup index, continuing without it: {e}")
+                    return None
+    return _dedup_index
@@ -0,0 +1,201 @@
+"""
+Registry of the documents each persona holds
+
+Every ingested file is recorded (by persona and filename) with the SHA-256 of
+its bytes and, per chunk, the hash of the chunk text and the vector it is
+stored as. Ingestion consults the registry to skip unchanged re-uploads and,
+for edited files, to embed only chunks whose text is new and delete the
+vectors of chunks that are gone.
+
+A chunk skipped as a near-duplicate is recorded with the vector it matched,
+which may belong to another document; a vector is only deleted once no
+document of the persona references it.
+"""
+
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from models import Document, DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class DocumentState:
+    """What the registry knows about a stored document"""
+    document_id: str
+    file_hash: str
+    chunk_vectors: Dict[str, List[str]]  # chunk hash -> vector IDs with that text
+
+    @property
+    def vector_ids(self) -> Set[str]:
+        return {vector_id for ids in self.chunk_vectors.values() for vector_id in ids}
+
+
+def async_session_runner(session_factory) -> Callable[[Callable[[Session], T]], Awaitable[T]]:
+    """Run a sync query function in a transaction of an async_sessionmaker session"""
+    async def run(fn):
+        async with session_factory() as session:
+            result = await session.run_sync(fn)
+            await session.commit()
+            return result
+    return run
+
+
+def sync_session_runner(session_factory) -> Callable[[Callable[[Session], T]], Awaitable[T]]:
+    """Run a query function in a transaction of a sync sessionmaker session, off the event loop"""
+    def run_sync(fn):
+        session = session_factory()
+        try:
+            result = fn(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def run(fn):
+        return await asyncio.to_thread(run_sync, fn)
+    return run
+
+
+class DocumentRegistry:
+    """
+    Reads and writes the documents/document_chunks tables
+
+    Queries are written against a synchronous Session; `run` executes one in
+    a transaction, either through AsyncSession.run_sync (RQ worker) or on a
+    thread with a sync Session (thread processor).
+    """
+
+    def __init__(self, run: Callable[[Callable[[Session], T]], Awaitable[T]]):
+        self._run = run
+
+    @classmethod
+    def for_async_sessions(cls, session_factory) -> "DocumentRegistry":
+        """Registry using an async_sessionmaker"""
+        return cls(async_session_runner(session_factory))
+
+    @classmethod
+    def for_sync_sessions(cls, session_factory) -> "DocumentRegistry":
+        """Registry using a sync sessionmaker; queries run off the event loop"""
+        return cls(sync_session_runner(session_factory))
+
+    async def get(self, persona_id: str, filename: str) -> Optional[DocumentState]:
+        """
+        Look up a persona's document by filename
+
+        Returns:
+            DocumentState, or None if the persona has no such document
+        """
+        def query(session: Session) -> Optional[DocumentState]:
+            document = session.execute(
+                select(Document.id, Document.file_hash).where(
+                    Document.persona_id == persona_id,
+                    Document.filename == filename
+                )
+            ).first()
+            if document is None:
+                return None
+            chunk_vectors: Dict[str, List[str]] = {}
+            rows = session.execute(
+                select(DocumentChunk.chunk_hash, DocumentChunk.vector_id)
+                .where(DocumentChunk.document_id == document.id)
+                .order_by(DocumentChunk.chunk_index)
+            )
+            for hash_value, vector_id in rows:
+                chunk_vectors.setdefault(hash_value, []).append(vector_id)
+            return DocumentState(document.id, document.file_hash, chunk_vectors)
+
+        return await self._run(query)
+
+    async def save(
+        self,
+        persona_id: str,
+        filename: str,
+        file_hash: str,
+        file_type: str,
+        size: Optional[int],
+        chunks: List[Tuple[int, str, str]]
+    ) -> List[str]:
+        """
+        Record the current version of a document, replacing any previous one
+
+        Args:
+            persona_id: Persona holding the document
+            filename: Document filename (its identity within the persona)
+            file_hash: SHA-256 of the file bytes
+            file_type: 'pdf' or 'text'
+            size: File size in bytes
+            chunks: (chunk_index, chunk_hash, vector_id) for every stored chunk
+
+        Returns:
+            Vector IDs of the previous version that neither the new one nor
+            any other document of the persona uses; the caller deletes them
+            from the vector store
+        """
+        def write(session: Session) -> List[str]:
+            document = session.execute(
+                select(Document)
+                .where(Document.persona_id == persona_id, Document.filename == filename)
+                .with_for_update()
+            ).scalar_one_or_none()
+
+            previous_ids: List[str] = []
+            if document is None:
+                document = Document(persona_id=persona_id, filename=filename)
+                session.add(document)
+            else:
+                previous_ids = list(session.execute(
+                    select(DocumentChunk.vector_id).where(DocumentChunk.document_id == document.id)
+                ).scalars())
+                session.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document.id))
+
+            document.file_hash = file_hash
+            document.file_type = file_type
+            document.size = size
+            document.chunk_count = len(chunks)
+            session.flush()
+
+            if chunks:
+                session.execute(
+                    insert(DocumentChunk),
+                    [
+                        {
+                            "document_id": document.id,
+                            "chunk_index": chunk_index,
+                            "chunk_hash": hash_value,
+                            "vector_id": vector_id
+                        }
+                        for chunk_index, hash_value, vector_id in chunks
+                    ]
+                )
+
+            current_ids = {vector_id for _, _, vector_id in chunks}
+            unused = [vector_id for vector_id in dict.fromkeys(previous_ids) if vector_id not in current_ids]
+            if unused:
+                # Keep vectors that other documents reference as near-duplicates
+                referenced = set(session.execute(
+                    select(DocumentChunk.vector_id)
+                    .join(Document, Document.id == DocumentChunk.document_id)
+                    .where(Document.persona_id == persona_id, DocumentChunk.vector_id.in_(unused))
+                ).scalars())
+                unused = [vector_id for vector_id in unused if vector_id not in referenced]
+            return unused
+
+        return await self._run(write)
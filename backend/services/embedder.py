@@ -1,53 +1,56 @@
 import os
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import numpy as np
 import openai
-from openai import AsyncOpenAI
+import tiktoken
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
 import asyncio
 from contextlib import asynccontextmanager
 
-logger = logging.getLogger(__name__)
+from .client_pool import get_client_pool
+from .embedding_cache import get_embedding_cache
+from .embedding_scheduler import get_embedding_scheduler
+from .query_coalescer import get_query_coalescer
 
-# Global client to reuse connections
-_openai_client = None
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def get_openai_client():
-    """Get a shared OpenAI client with proper lifecycle management"""
-    global _openai_client
-    
-    # Always create a new client to avoid fork issues on macOS
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    
-    # Create new client each time to avoid threading issues
-    client = AsyncOpenAI(api_key=api_key)
+    """
+    Get the pooled OpenAI client for the running event loop
     
+    The client is long-lived (see services.client_pool); it is not closed on exit.
+    """
+    client = get_client_pool().get_openai_client()
     try:
         yield client
     except Exception as e:
         logger.error(f"Error with OpenAI client: {e}")
         raise
-    finally:
-        # Close the client properly
-        await client.close()
+
+# Provider limits for text-embedding-3-* models
+MAX_INPUT_TOKENS = 8191
 
 class Embedder:
     def __init__(self):
         self.model = "text-embedding-3-small"
-        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        # Requests are packed by token count up to these per-request ceilings
+        self.max_request_tokens = int(os.getenv("EMBEDDING_MAX_TOKENS_PER_REQUEST", "300000"))
+        self.max_request_inputs = int(os.getenv("EMBEDDING_MAX_INPUTS_PER_REQUEST", "2048"))
+        self.max_input_tokens = MAX_INPUT_TOKENS
         self.max_retries = 3
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.cache = get_embedding_cache()
+        self.scheduler = get_embedding_scheduler()
+        self.coalescer = get_query_coalescer()
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
-        """Embed a batch of texts"""
+    async def _embed_batch(self, inputs: List[List[int]]) -> List[List[float]]:
+        """Embed a batch of token arrays (retries are handled by the scheduler)"""
         try:
             async with get_openai_client() as client:
-                response = await client.embeddings.create(
+                response = await client.with_options(max_retries=0).embeddings.create(
                     model=self.model,
-                    input=texts
+                    input=inputs
                 )
                 return [item.embedding for item in response.data]
         except Exception as e:
@@ -58,45 +61,125 @@ class Embedder:
         """
         Embed multiple documents in batches
         
+        The whole batch is looked up in the embedding cache first; only
+        distinct texts that miss are sent to the API.
+        
         Args:
             texts: List of text documents to embed
         
         Returns:
-            List of embedding vectors
+            List of embedding vectors, one per input text
+        
+        Raises:
+            Exception: If any batch fails after retries; results are never partial
         """
         if not texts:
             return []
         
-        all_embeddings = []
-        total_batches = (len(texts) + self.batch_size - 1) // self.batch_size
-        
-        logger.info(f"Embedding {len(texts)} texts in {total_batches} batches")
-        
-        # Process in batches
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i:i + self.batch_size]
-            batch_num = i // self.batch_size + 1
-            
-            try:
-                logger.debug(f"Processing batch {batch_num}/{total_batches}")
-                embeddings = await self._embed_batch(batch)
-                all_embeddings.extend(embeddings)
-                
-                # Small delay to avoid rate limits
-                if batch_num < total_batches:
-                    await asyncio.sleep(0.1)
-                    
-            except Exception as e:
-                logger.error(f"Failed to embed batch {batch_num}: {e}")
-                # Return partial results if some batches succeeded
-                if all_embeddings:
-                    logger.warning(f"Returning {len(all_embeddings)} embeddings out of {len(texts)} requested")
-                    return all_embeddings
-                raise
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+        
+        results = await self.cache.lookup(self.model, texts)
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, results) if vector is None
+        ))
+        logger.info(f"Embedding cache: {len(texts) - sum(v is None for v in results)}/{len(texts)} hits, "
+                    f"{len(missing)} distinct texts to embed")
+        
+        if missing:
+            embeddings = await self._embed_uncached(missing)
+            await self.cache.store(self.model, missing, embeddings)
+            computed = dict(zip(missing, embeddings))
+            for i, text in enumerate(texts):
+                if results[i] is None:
+                    results[i] = computed[text]
+        
+        return results
+    
+    async def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts via the API, running packed batches through the rate-limited scheduler"""
+        token_lists = await asyncio.to_thread(self.encoding.encode_ordinary_batch, texts)
+        
+        # Inputs over the model's limit are split into pieces and averaged afterwards
+        pieces: List[List[int]] = []
+        owners: List[int] = []
+        for index, tokens in enumerate(token_lists):
+            if not tokens:
+                tokens = self.encoding.encode_ordinary(" ")
+            for start in range(0, len(tokens), self.max_input_tokens):
+                pieces.append(tokens[start:start + self.max_input_tokens])
+                owners.append(index)
+        
+        batches, batch_tokens = self._pack(pieces)
+        logger.info(f"Embedding {len(texts)} texts ({len(pieces)} inputs, "
+                    f"{sum(batch_tokens)} tokens) in {len(batches)} requests")
+        
+        try:
+            results = await self.scheduler.run(batches, self._embed_batch, batch_tokens)
+        except Exception as e:
+            logger.error(f"Failed to embed {len(texts)} texts: {e}")
+            raise
+        
+        piece_embeddings = [embedding for batch in results for embedding in batch]
+        if len(pieces) == len(texts):
+            all_embeddings = piece_embeddings
+        else:
+            all_embeddings = self._combine_pieces(len(texts), pieces, owners, piece_embeddings)
         
         logger.info(f"Successfully embedded {len(all_embeddings)} texts")
         return all_embeddings
     
+    def _pack(self, inputs: List[List[int]]) -> Tuple[List[List[List[int]]], List[int]]:
+        """
+        Group inputs into requests, in order, without exceeding the per-request
+        token and input-count ceilings
+        
+        Returns:
+            Tuple of (batches, tokens per batch)
+        """
+        batches: List[List[List[int]]] = []
+        batch_tokens: List[int] = []
+        current: List[List[int]] = []
+        current_tokens = 0
+        
+        for tokens in inputs:
+            if current and (current_tokens + len(tokens) > self.max_request_tokens
+                            or len(current) >= self.max_request_inputs):
+                batches.append(current)
+                batch_tokens.append(current_tokens)
+                current, current_tokens = [], 0
+            current.append(tokens)
+            current_tokens += len(tokens)
+        
+        if current:
+            batches.append(current)
+            batch_tokens.append(current_tokens)
+        return batches, batch_tokens
+    
+    @staticmethod
+    def _combine_pieces(
+        count: int,
+        pieces: List[List[int]],
+        owners: List[int],
+        piece_embeddings: List[List[float]]
+    ) -> List[List[float]]:
+        """Token-weighted average of piece embeddings, renormalized to unit length"""
+        grouped: List[List[Tuple[int, List[float]]]] = [[] for _ in range(count)]
+        for tokens, owner, embedding in zip(pieces, owners, piece_embeddings):
+            grouped[owner].append((len(tokens), embedding))
+        
+        combined = []
+        for parts in grouped:
+            if len(parts) == 1:
+                combined.append(parts[0][1])
+                continue
+            weights = np.array([weight for weight, _ in parts], dtype=np.float64)
+            vectors = np.array([vector for _, vector in parts], dtype=np.float64)
+            average = np.average(vectors, axis=0, weights=weights)
+            norm = np.linalg.norm(average)
+            combined.append((average / norm if norm > 0 else average).tolist())
+        return combined
+    
     async def embed_query(self, query: str) -> List[float]:
         """
         Embed a single query text
@@ -110,17 +193,32 @@ class Embedder:
         if not query or not query.strip():
             raise ValueError("Query cannot be empty")
         
+        if self.cache is not None:
+            cached = (await self.cache.lookup(self.model, [query]))[0]
+            if cached is not None:
+                return cached
+        
         try:
-            async with get_openai_client() as client:
-                response = await client.embeddings.create(
-                    model=self.model,
-                    input=query
-                )
-                return response.data[0].embedding
+            if self.coalescer is not None:
+                embedding = await self.coalescer.embed(query, self._embed_texts)
+            else:
+                embedding = (await self._embed_texts([query]))[0]
+            if self.cache is not None:
+                await self.cache.store(self.model, [query], [embedding])
+            return embedding
         except Exception as e:
             logger.error(f"Error embedding query: {e}")
             raise
     
+    async def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed short texts in a single request"""
+        async with get_openai_client() as client:
+            response = await client.embeddings.create(
+                model=self.model,
+                input=texts
+            )
+            return [item.embedding for item in response.data]
+    
     def estimate_cost(self, text_count: int, avg_tokens_per_text: int = 100) -> float:
         """
         Estimate embedding cost in USD
@@ -0,0 +1,214 @@
+"""
+Content-addressed embedding cache
+
+Embeddings are a pure function of (model, text), so they are cached under
+sha256(model, text) in two tiers: a bounded in-process LRU of float32
+arrays and a persistent SQLite store shared by every process on the host.
+Re-uploads, overlapping chunks, the same file in several personas and
+repeated queries are then served without calling the embeddings API.
+
+The SQLite tier keeps the most recently written EMBEDDING_CACHE_MAX_ROWS
+vectors; older ones are pruned as new ones are written. Cache errors never
+fail an embedding call: a failed read is a miss and a failed write is skipped.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on host parameters per statement is 999
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of embedding vectors"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_items: Optional[int] = None,
+        max_rows: Optional[int] = None
+    ):
+        """
+        Args:
+            path: SQLite file for the persistent tier (EMBEDDING_CACHE_PATH)
+            memory_items: Max vectors held in the in-process LRU (EMBEDDING_CACHE_MEMORY_ITEMS)
+            max_rows: Max vectors kept in SQLite, 0 for no limit (EMBEDDING_CACHE_MAX_ROWS)
+        """
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+        self.memory_items = memory_items if memory_items is not None else int(
+            os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096")
+        )
+        self.max_rows = max_rows if max_rows is not None else int(
+            os.getenv("EMBEDDING_CACHE_MAX_ROWS", "1000000")
+        )
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._db.commit()
+        logger.info(f"Embedding cache at {self.path}")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Cache key for a (model, text) pair"""
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    async def lookup(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up a batch of texts
+
+        The memory tier is checked inline; the remaining keys are fetched
+        from SQLite in one pass off the event loop.
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            One entry per text: the cached vector, or None on a miss
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+
+        remaining = list({key for key in keys if key not in found})
+        if remaining:
+            try:
+                from_disk = await asyncio.to_thread(self._read, remaining)
+            except Exception as e:
+                # The cache is an optimization; treat an unreadable store as misses
+                logger.warning(f"Failed to read {len(remaining)} embeddings from the cache: {e}")
+                from_disk = {}
+            if from_disk:
+                self._remember(from_disk)
+                found.update(from_disk)
+
+        results = [found[key].tolist() if key in found else None for key in keys]
+        hits = sum(1 for vector in results if vector is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    async def store(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """
+        Add freshly computed embeddings to both tiers
+
+        Args:
+            model: Embedding model name
+            texts: Texts that were embedded
+            vectors: Their embeddings, in the same order
+        """
+        if not texts:
+            return
+        entries = {
+            self.make_key(model, text): np.asarray(vector, dtype=np.float32)
+            for text, vector in zip(texts, vectors)
+        }
+        self._remember(entries)
+        try:
+            await asyncio.to_thread(self._write, model, entries)
+        except Exception as e:
+            # The cache is an optimization; never fail an embedding call over it
+            logger.warning(f"Failed to persist {len(entries)} embeddings: {e}")
+
+    def _remember(self, entries: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in entries.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _read(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._db_lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                batch = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _write(self, model: str, entries: Dict[str, np.ndarray]):
+        rows = [(key, model, vector.tobytes()) for key, vector in entries.items()]
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            if self.max_rows > 0:
+                # Rows get increasing rowids as they are written (a replaced
+                # row gets a new one), so the oldest are below the cutoff
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE rowid <= (SELECT MAX(rowid) FROM embeddings) - ?",
+                    (self.max_rows,)
+                )
+            self._db.commit()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Hit/miss counters and memory tier size"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_items": len(self._memory),
+        }
+
+
+# Singleton instance
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the shared embedding cache, or None when disabled
+
+    Set EMBEDDING_CACHE_ENABLED=false to always call the embeddings API.
+    """
+    global _embedding_cache
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                try:
+                    _embedding_cache = EmbeddingCache()
+                except Exception as e:
+                    logger.error(f"Failed to open embedding cache, continuing without it: {e}")
+                    return None
+    return _embedding_cache
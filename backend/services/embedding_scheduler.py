@@ -0,0 +1,193 @@
+"""
+Rate-limit-aware scheduler for embedding requests
+
+Runs embedding batches concurrently while staying under the account's
+requests-per-minute and tokens-per-minute limits. Each batch is retried on
+its own (honouring 429 retry-after hints) and results are always returned
+in input order; if any batch ultimately fails, the whole call fails.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` units per minute
+
+    State is guarded by a thread lock rather than an asyncio primitive so a
+    single bucket can be shared by event loops running in different threads
+    (the API loop and ingestion worker loops).
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self, amount: float) -> float:
+        """Take `amount` tokens if available; otherwise return seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until `amount` tokens can be taken from the bucket"""
+        # A single request larger than the bucket could never be admitted
+        amount = min(float(amount), self.capacity)
+        while True:
+            wait = self._try_take(amount)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class EmbeddingScheduler:
+    """Bounded-concurrency executor for embedding batches"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ):
+        """
+        Args:
+            requests_per_minute: Account RPM limit (EMBEDDING_RPM_LIMIT)
+            tokens_per_minute: Account TPM limit (EMBEDDING_TPM_LIMIT)
+            max_concurrency: Max batches in flight per call (EMBEDDING_MAX_CONCURRENCY)
+            max_retries: Attempts per batch after the first (EMBEDDING_MAX_RETRIES)
+        """
+        self.requests = TokenBucket(requests_per_minute or int(os.getenv("EMBEDDING_RPM_LIMIT", "3000")))
+        self.tokens = TokenBucket(tokens_per_minute or int(os.getenv("EMBEDDING_TPM_LIMIT", "1000000")))
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+        self._paused_until = 0.0
+
+    async def run(
+        self,
+        batches: List[list],
+        embed_fn: Callable[[list], Awaitable[List[List[float]]]],
+        token_counts: Optional[List[int]] = None
+    ) -> List[List[List[float]]]:
+        """
+        Embed all batches, respecting rate limits
+
+        Args:
+            batches: Inputs (texts or token arrays) grouped into API requests
+            embed_fn: Coroutine performing one embeddings request for a batch
+            token_counts: Tokens per batch, for TPM accounting (estimated if omitted)
+
+        Returns:
+            One list of vectors per batch, in input order
+
+        Raises:
+            The last error of the first batch that exhausts its retries
+        """
+        if token_counts is None:
+            token_counts = [self.estimate_tokens(batch) for batch in batches]
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(index: int) -> List[List[float]]:
+            async with semaphore:
+                return await self._run_with_retries(index, batches[index], embed_fn, token_counts[index])
+
+        tasks = [asyncio.ensure_future(run_batch(i)) for i in range(len(batches))]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _run_with_retries(
+        self,
+        index: int,
+        batch: list,
+        embed_fn: Callable[[list], Awaitable[List[List[float]]]],
+        token_count: int
+    ) -> List[List[float]]:
+        attempt = 0
+        while True:
+            await self._wait_if_paused()
+            await self.requests.acquire(1)
+            await self.tokens.acquire(token_count)
+            try:
+                embeddings = await embed_fn(batch)
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except openai.RateLimitError as e:
+                if getattr(e, "code", None) == "insufficient_quota" or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_after(e) or self._backoff(attempt)
+                # Every batch shares the same limit, so hold them all back
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Embedding batch {index} rate limited, retrying in {delay:.1f}s")
+            except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Embedding batch {index} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+    @staticmethod
+    def _retry_after(error: openai.APIStatusError) -> Optional[float]:
+        """Read the server's retry hint from a 429 response"""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+    @staticmethod
+    def estimate_tokens(inputs: list) -> int:
+        """Token count for TPM accounting (~4 characters per token for raw text)"""
+        return sum(
+            len(item) if isinstance(item, list) else len(item) // 4 + 1
+            for item in inputs
+        )
+
+
+# Singleton instance, shared so all embedders draw from the same limits
+_embedding_scheduler = None
+
+def get_embedding_scheduler() -> EmbeddingScheduler:
+    """Get singleton embedding scheduler instance"""
+    global _embedding_scheduler
+    if _embedding_scheduler is None:
+        _embedding_scheduler = EmbeddingScheduler()
+    return _embedding_scheduler
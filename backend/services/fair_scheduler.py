@@ -0,0 +1,149 @@
+"""
+Per-user fair-share scheduling of ingestion file tasks
+
+Jobs are split into one RQ task per file so any idle worker can pick up any
+file. Feeding all of a 50-file upload straight into the FIFO `ingestion`
+queue would still make every later upload wait behind it, so tasks are first
+parked in per-user pending lists in Redis. A dispatcher moves them into the
+RQ queue round-robin across users, keeping only a few tasks queued at a time
+(INGEST_FAIR_QUEUE_DEPTH): a user with one small file gets the next free
+slot instead of waiting behind another user's whole batch.
+
+dispatch() runs whenever work is submitted and whenever a file task ends,
+from the API and the workers; the user rotation is a Lua script, so
+concurrent dispatchers never hand out the same task twice.
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from rq import Queue
+from rq.utils import parse_timeout
+
+from services.queue_manager import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+USERS_KEY = "ingest:fair:users"  # Round-robin ring of users with pending tasks
+PENDING_PREFIX = "ingest:fair:pending:"  # Per-user FIFO of task payloads
+
+# Pop up to ARGV[2] tasks, one user at a time round-robin
+_DISPATCH_SCRIPT = """
+local users_key = KEYS[1]
+local prefix = ARGV[1]
+local wanted = tonumber(ARGV[2])
+local tasks = {}
+while #tasks < wanted do
+    -- Take the user at the tail and rotate them to the head of the ring
+    local user = redis.call('RPOPLPUSH', users_key, users_key)
+    if not user then
+        break
+    end
+    local task = redis.call('LPOP', prefix .. user)
+    if task then
+        table.insert(tasks, task)
+    end
+    if redis.call('LLEN', prefix .. user) == 0 then
+        redis.call('LREM', users_key, 0, user)
+    end
+end
+return tasks
+"""
+
+
+class FairShareScheduler:
+    """Round-robin admission of per-user tasks into an RQ queue"""
+
+    def __init__(self, queue_name: str = "ingestion", queue_depth: int = None, redis_conn=None):
+        """
+        Args:
+            queue_name: RQ queue the tasks run from
+            queue_depth: Tasks kept waiting in the RQ queue (INGEST_FAIR_QUEUE_DEPTH);
+                about the number of workers keeps them busy without queueing ahead
+            redis_conn: Redis connection (defaults to REDIS_URL)
+        """
+        self.redis = redis_conn or get_redis_connection()
+        self.queue = Queue(queue_name, connection=self.redis)
+        self.queue_depth = queue_depth or int(os.getenv("INGEST_FAIR_QUEUE_DEPTH", "4"))
+        self.task_timeout = os.getenv("INGEST_FILE_TASK_TIMEOUT", "30m")
+        self.task_timeout_seconds = parse_timeout(self.task_timeout)
+        self._dispatch_script = self.redis.register_script(_DISPATCH_SCRIPT)
+
+    def submit(self, user_id: str, func: str, payloads: List[Dict[str, Any]]):
+        """
+        Park a user's tasks and dispatch what fits
+
+        Args:
+            user_id: Owner of the tasks; tasks of one user run in submission order
+            func: Dotted path of the RQ task function, called with one payload
+            payloads: JSON-serializable keyword arguments, one dict per task
+        """
+        if not payloads:
+            return
+        pipe = self.redis.pipeline()
+        pipe.rpush(PENDING_PREFIX + user_id, *[json.dumps({"func": func, "kwargs": p}) for p in payloads])
+        # The tail of the ring is served next; LREM first so a user appears once
+        pipe.lrem(USERS_KEY, 0, user_id)
+        pipe.rpush(USERS_KEY, user_id)
+        pipe.execute()
+        logger.info(f"Parked {len(payloads)} tasks for user {user_id}")
+        self.dispatch()
+
+    def dispatch(self) -> int:
+        """
+        Move pending tasks into the RQ queue, up to the queue depth
+
+        Returns:
+            Number of tasks enqueued
+        """
+        wanted = self.queue_depth - self.queue.count
+        if wanted <= 0:
+            return 0
+        tasks = self._dispatch_script(keys=[USERS_KEY], args=[PENDING_PREFIX, wanted])
+        for raw in tasks:
+            task = json.loads(raw)
+            self.queue.enqueue(task["func"], kwargs=task["kwargs"], job_timeout=self.task_timeout)
+        if tasks:
+            logger.info(f"Dispatched {len(tasks)} ingestion tasks ({self.queue.count} queued)")
+        return len(tasks)
+
+    def cancel_job(self, user_id: str, job_id: str) -> int:
+        """
+        Drop an ingestion job's tasks that have not started yet
+
+        Removes them from the user's pending list and from the RQ queue.
+        Tasks already running are not touched; the job's attempt counter
+        makes their results void (see ingestion_worker.record_file_result).
+
+        Returns:
+            Number of tasks removed
+        """
+        removed = 0
+        for raw in self.redis.lrange(PENDING_PREFIX + user_id, 0, -1):
+            if json.loads(raw)["kwargs"].get("job_id") == job_id:
+                removed += self.redis.lrem(PENDING_PREFIX + user_id, 1, raw)
+        for queued in self.queue.get_jobs():
+            if queued.kwargs.get("job_id") == job_id:
+                queued.delete()
+                removed += 1
+        if removed:
+            logger.info(f"Cancelled {removed} pending tasks of ingestion job {job_id}")
+        return removed
+
+    def pending_counts(self) -> Dict[str, int]:
+        """Tasks still parked, per user"""
+        users = [u.decode() if isinstance(u, bytes) else u for u in self.redis.lrange(USERS_KEY, 0, -1)]
+        return {user: self.redis.llen(PENDING_PREFIX + user) for user in users}
+
+
+# Singleton instance
+_fair_scheduler: Optional[FairShareScheduler] = None
+
+def get_fair_scheduler() -> FairShareScheduler:
+    """Get the ingestion fair-share scheduler"""
+    global _fair_scheduler
+    if _fair_scheduler is None:
+        _fair_scheduler = FairShareScheduler()
+    return _fair_scheduler
@@ -0,0 +1,146 @@
+"""
+File parsing shared by the ingestion paths
+
+Turns uploaded file bytes into a stream of text pieces (PDF pages, or slices
+of a text file) and then into batches of chunks, so memory use is bounded by
+the batch size rather than the document size.
+"""
+
+import os
+import base64
+import codecs
+import hashlib
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.chunker import TextChunker
+from services.embedder import Embedder
+from services.blob_store import get_blob_store
+from services.pdf_extractor import iter_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+# Text files are decoded in slices of this many bytes
+TEXT_PIECE_BYTES = 1 << 20
+
+class FileProcessor:
+    """Handles individual file processing tasks"""
+
+    def __init__(self):
+        self.chunker = TextChunker(
+            chunk_size=int(os.getenv("CHUNK_SIZE_TOKENS", "800")),
+            chunk_overlap=int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+        )
+        self.embedder = Embedder()
+        self.chunk_batch_size = int(os.getenv("INGEST_CHUNK_BATCH_SIZE", "512"))
+
+    def get_file_type(self, filename: str) -> str:
+        """Map a filename to a supported file type"""
+        filename_lower = filename.lower()
+        if filename_lower.endswith('.pdf'):
+            return "pdf"
+        if filename_lower.endswith('.txt'):
+            return "text"
+        raise ValueError(f"Unsupported file type: {filename}")
+
+    def get_file_hash(self, content: bytes) -> str:
+        """Generate SHA-256 hash of the raw file bytes for deduplication"""
+        return hashlib.sha256(content).hexdigest()
+
+    def open_content(self, file_data: Dict[str, Any]):
+        """
+        Open the bytes of a file handed to a job
+
+        Jobs reference uploads by 'blob_hash'; jobs enqueued before the blob
+        store carry base64 'content' instead.
+
+        Returns:
+            A bytes-like object; use it in a `with` block, which unmaps the
+            blob on exit
+        """
+        if file_data.get('blob_hash'):
+            return get_blob_store().open(file_data['blob_hash'])
+        return memoryview(base64.b64decode(file_data['content']))
+
+    def content_path(self, file_data: Dict[str, Any]) -> Optional[str]:
+        """Path of the file's blob, if it has one"""
+        if file_data.get('blob_hash'):
+            return get_blob_store().path(file_data['blob_hash'])
+        return None
+
+    def iter_text(self, filename: str, content: bytes, path: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream the text of a file
+
+        Args:
+            filename: Name of the file, for its type
+            content: File bytes
+            path: File holding the same bytes, if any (lets PDF workers skip a temp copy)
+
+        Yields:
+            Consecutive pieces of the document text (one per PDF page)
+        """
+        if self.get_file_type(filename) == "pdf":
+            for page_text in iter_pdf_pages(content, path=path):
+                yield page_text + "\n"
+            return
+
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        for start in range(0, len(content), TEXT_PIECE_BYTES):
+            yield decoder.decode(content[start:start + TEXT_PIECE_BYTES])
+        yield decoder.decode(b"", final=True)
+
+    def iter_chunk_batches(self, filename: str, content: bytes, path: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        Stream a file's chunks in batches of INGEST_CHUNK_BATCH_SIZE
+
+        Chunk dicts are those of TextChunker; chunk_id numbers the chunks
+        across the whole file.
+        """
+        batch = []
+        for chunk in self.chunker.iter_chunks(self.iter_text(filename, content, path), source=filename):
+            batch.append(chunk)
+            if len(batch) >= self.chunk_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def process_pdf(self, file_content: bytes) -> str:
+        """Extract text from PDF content"""
+        return "\n".join(iter_pdf_pages(file_content)).strip()
+
+    def process_text_file(self, file_content: bytes) -> str:
+        """Process text file content"""
+        try:
+            return file_content.decode('utf-8', errors='ignore').strip()
+        except Exception as e:
+            logger.error(f"Text file processing error: {e}")
+            raise ValueError(f"Failed to process text file: {str(e)}")
+
+    def parse_file(self, filename: str, content: bytes) -> Dict[str, Any]:
+        """
+        Parse file content and extract text
+
+        Prefer iter_chunk_batches for ingestion; this holds the whole text.
+
+        Returns:
+            Dict with parsed content and metadata
+        """
+        file_type = self.get_file_type(filename)
+        if file_type == "pdf":
+            text_content = self.process_pdf(content)
+        else:
+            text_content = self.process_text_file(content)
+
+        if not text_content.strip():
+            raise ValueError(f"File {filename} is empty or could not be processed")
+
+        return {
+            "filename": filename,
+            "content": text_content,
+            "file_type": file_type,
+            "hash": self.get_file_hash(content),
+            "size": len(content),
+            "char_count": len(text_content)
+        }
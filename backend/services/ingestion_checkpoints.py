@@ -0,0 +1,89 @@
+"""
+Checkpoints of ingestion progress within a file
+
+Each batch a job upserts is recorded with the chunks it stored. A requeued
+or recovered job reads the checkpoints of a file back and skips embedding
+and upserting those batches: vector IDs are derived from the file hash and
+chunk position, so the stored vectors are exactly the ones a rerun would
+write. Whole files need no checkpoint of their own: a finished file is in
+the document registry and is skipped as unchanged. A file's checkpoints are
+cleared once it is recorded there.
+"""
+
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from models import IngestionCheckpoint
+from services.document_registry import async_session_runner, sync_session_runner
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class IngestionCheckpoints:
+    """Reads and writes one job's rows of the ingestion_checkpoints table"""
+
+    def __init__(self, run: Callable[[Callable[[Session], T]], Awaitable[T]], job_id: str):
+        self._run = run
+        self.job_id = job_id
+
+    @classmethod
+    def for_async_sessions(cls, session_factory, job_id: str) -> "IngestionCheckpoints":
+        """Checkpoints using an async_sessionmaker"""
+        return cls(async_session_runner(session_factory), job_id)
+
+    @classmethod
+    def for_sync_sessions(cls, session_factory, job_id: str) -> "IngestionCheckpoints":
+        """Checkpoints using a sync sessionmaker; queries run off the event loop"""
+        return cls(sync_session_runner(session_factory), job_id)
+
+    async def load(self, file_hash: str) -> Dict[int, List[Tuple[int, str, str]]]:
+        """
+        Batches of a file upserted by an earlier attempt of the job
+
+        Returns:
+            Batch index -> (chunk_id, chunk_hash, vector_id) of the batch's chunks
+        """
+        def query(session: Session) -> Dict[int, List[Tuple[int, str, str]]]:
+            rows = session.execute(
+                select(IngestionCheckpoint.batch_index, IngestionCheckpoint.chunk_records).where(
+                    IngestionCheckpoint.job_id == self.job_id,
+                    IngestionCheckpoint.file_hash == file_hash
+                )
+            )
+            return {
+                batch_index: [tuple(record) for record in records]
+                for batch_index, records in rows
+            }
+
+        return await self._run(query)
+
+    async def save(self, file_hash: str, batch_index: int, chunk_records: List[Tuple[int, str, str]]):
+        """Record that a batch of a file is stored"""
+        def write(session: Session):
+            session.execute(
+                insert(IngestionCheckpoint).values(
+                    job_id=self.job_id,
+                    file_hash=file_hash,
+                    batch_index=batch_index,
+                    chunk_records=[list(record) for record in chunk_records]
+                )
+            )
+
+        await self._run(write)
+
+    async def clear(self, file_hash: str):
+        """Drop a file's checkpoints once the file is fully ingested"""
+        def write(session: Session):
+            session.execute(
+                delete(IngestionCheckpoint).where(
+                    IngestionCheckpoint.job_id == self.job_id,
+                    IngestionCheckpoint.file_hash == file_hash
+                )
+            )
+
+        await self._run(write)
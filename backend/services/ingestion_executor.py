@@ -0,0 +1,235 @@
+"""
+Bounded executor for in-process ingestion jobs
+
+Uploads used to start a daemon thread each, and every thread built its own
+event loop just to call the embedder, so a burst of uploads could exhaust
+threads, database connections and provider rate limits. Jobs now go to a
+fixed set of worker threads through a bounded FIFO backlog (a full backlog
+rejects new jobs with 429), and their async work runs on one long-lived event
+loop shared by all workers, which keeps provider clients and their
+connections alive between jobs. Shutdown stops accepting jobs and drains the
+backlog before the loop is closed.
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException
+
+from services.client_pool import get_client_pool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class IngestionBacklogFull(HTTPException):
+    """Raised when the backlog cannot take another job (HTTP 429)"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            429,
+            "Too many uploads are being processed, please try again shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+@dataclass
+class _Job:
+    name: str
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: Dict[str, Any]
+    submitted_at: float = field(default_factory=time.monotonic)
+
+
+class IngestionExecutor:
+    """Worker threads fed from a bounded queue, sharing one event loop"""
+
+    def __init__(self, max_workers: int = None, max_backlog: int = None):
+        """
+        Args:
+            max_workers: Jobs processed at once (INGEST_MAX_CONCURRENT_JOBS)
+            max_backlog: Jobs allowed to wait for a worker (INGEST_MAX_BACKLOG)
+        """
+        self.max_workers = max_workers or int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+        self.max_backlog = max_backlog or int(os.getenv("INGEST_MAX_BACKLOG", "20"))
+        self.retry_after = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "30"))
+
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=self.max_backlog)
+        self._lock = threading.Lock()
+        self._workers = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._started = False
+        self._stopping = False
+
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._total_wait_seconds = 0.0
+
+    def _start(self):
+        """Start the event loop and workers on first use"""
+        with self._lock:
+            if self._started:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="ingestion-loop", daemon=True
+            )
+            self._loop_thread.start()
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._work, name=f"ingestion-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            self._started = True
+            logger.info(f"Ingestion executor started: {self.max_workers} workers, backlog {self.max_backlog}")
+
+    def has_capacity(self) -> bool:
+        """Whether a job submitted now would be accepted"""
+        return not self._stopping and not self._queue.full()
+
+    def check_capacity(self):
+        """
+        Fail fast, before an upload is read, if the backlog is full
+
+        Raises:
+            IngestionBacklogFull: If a job would be rejected
+        """
+        if not self.has_capacity():
+            self.rejected += 1
+            raise IngestionBacklogFull(self.retry_after)
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) to run on a worker thread
+
+        fn runs synchronously on the worker; it can await coroutines on the
+        shared event loop with run_async().
+
+        Raises:
+            IngestionBacklogFull: If the backlog is full or the executor is shutting down
+        """
+        if self._stopping:
+            self.rejected += 1
+            raise IngestionBacklogFull(self.retry_after)
+        self._start()
+        try:
+            self._queue.put_nowait(_Job(name, fn, args, kwargs))
+        except queue.Full:
+            self.rejected += 1
+            logger.warning(f"Ingestion backlog full, rejecting {name}")
+            raise IngestionBacklogFull(self.retry_after)
+        self.submitted += 1
+        logger.info(f"Queued ingestion job {name} ({self._queue.qsize()} waiting, {self.active} active)")
+
+    def run_async(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        Run a coroutine on the shared event loop and wait for its result
+
+        For use from job functions; must not be called on the loop itself.
+        """
+        self._start()
+        if threading.current_thread() is self._loop_thread:
+            raise RuntimeError("run_async() called from the ingestion event loop")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _work(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+
+            with self._lock:
+                self.active += 1
+                self._total_wait_seconds += time.monotonic() - job.submitted_at
+            try:
+                job.fn(*job.args, **job.kwargs)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                logger.error(f"Ingestion job {job.name} failed: {e}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self.active -= 1
+                self._queue.task_done()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Stop accepting jobs and let queued and running ones finish
+
+        Args:
+            timeout: Seconds to wait for the drain (INGEST_DRAIN_TIMEOUT_SECONDS)
+        """
+        if timeout is None:
+            timeout = float(os.getenv("INGEST_DRAIN_TIMEOUT_SECONDS", "60"))
+        self._stopping = True
+        if not self._started:
+            return
+
+        logger.info(f"Draining ingestion executor: {self._queue.qsize()} queued, {self.active} active")
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+
+        if any(worker.is_alive() for worker in self._workers):
+            # Leave the loop running for the stragglers; they are daemon threads
+            logger.warning(
+                f"Ingestion drain timed out after {timeout}s with {self._queue.qsize()} queued "
+                f"and {self.active} active jobs"
+            )
+            return
+
+        try:
+            self.run_async(get_client_pool().close_current_loop(), timeout=10)
+        except Exception as e:
+            logger.warning(f"Failed to close provider clients of the ingestion loop: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join(10)
+        self._loop.close()
+        logger.info("Ingestion executor stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Concurrency limits, backlog depth and job counters"""
+        with self._lock:
+            started = self.completed + self.failed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "max_backlog": self.max_backlog,
+                "queued": self._queue.qsize(),
+                "active": self.active,
+                "accepting": not self._stopping,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": round(self._total_wait_seconds / started, 3) if started else 0.0
+            }
+
+
+# Singleton instance
+_ingestion_executor = None
+_ingestion_executor_lock = threading.Lock()
+
+def get_ingestion_executor() -> IngestionExecutor:
+    """Get the process-wide ingestion executor"""
+    global _ingestion_executor
+    if _ingestion_executor is None:
+        with _ingestion_executor_lock:
+            if _ingestion_executor is None:
+                _ingestion_executor = IngestionExecutor()
+    return _ingestion_executor
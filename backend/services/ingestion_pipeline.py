@@ -0,0 +1,513 @@
+"""
+Staged ingestion pipeline
+
+Parsing and chunking are CPU-bound while embedding and upserting wait on the
+network, so running each file start to finish leaves one side idle. Here the
+three stages run concurrently and hand chunk batches to each other through
+bounded queues: parsing file N+1 overlaps embedding file N and upserting file
+N-1, and a multi-file job approaches the throughput of its slowest stage. The
+queue bounds cap how many batches are held in memory.
+
+With a document registry, files already stored for the persona are ingested
+incrementally: an unchanged re-upload is a no-op, chunks whose text the
+stored version already has keep their vectors, and vectors of chunks the new
+version dropped are deleted once the file is stored.
+
+With checkpoints, every upserted batch is recorded, and a retried job skips
+the batches of a file that an earlier attempt already stored.
+
+Vector IDs name the persona, the file's content hash and its filename, so
+identical bytes uploaded under two names are two documents with their own
+vectors. A chunk skipped as a near-duplicate is recorded with the vector it
+matched, which the registry keeps while any document still references it.
+"""
+
+import os
+import time
+import hashlib
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.document_registry import DocumentRegistry, DocumentState, chunk_hash
+from services.file_processor import FileProcessor
+from services.ingestion_checkpoints import IngestionCheckpoints
+
+logger = logging.getLogger(__name__)
+
+
+def vector_id(persona_id: str, filename: str, file_hash: str, chunk_id: int) -> str:
+    """Deterministic ID of a chunk's vector, unique per persona, file and content"""
+    name_hash = hashlib.sha256(filename.encode("utf-8", "surrogatepass")).hexdigest()
+    return f"{persona_id}_{file_hash[:8]}_{name_hash[:8]}_{chunk_id}"
+
+
+@dataclass
+class PipelineFile:
+    """Per-file state and result"""
+    index: int
+    file_data: Dict[str, Any]
+    filename: str
+    file_type: str = ""
+    file_hash: str = ""
+    generated_chunks: int = 0
+    stored_chunks: int = 0
+    skipped: bool = False  # Same content as an earlier file of the job
+    unchanged: bool = False  # Same content as the stored version of the document
+    reused_chunks: int = 0  # Chunks whose text the stored version already had
+    deleted_chunks: int = 0  # Vectors of the stored version that were removed
+    resumed_chunks: int = 0  # Chunks an earlier attempt of the job already stored
+    error: Optional[str] = None
+    previous: Optional[DocumentState] = None
+    chunk_records: List[Tuple[int, str, str]] = field(default_factory=list)  # (chunk_id, chunk_hash, vector_id)
+
+    @property
+    def succeeded(self) -> bool:
+        if self.skipped or self.error is not None:
+            return False
+        return self.unchanged or self.generated_chunks > 0
+
+
+@dataclass
+class _Batch:
+    file: PipelineFile
+    index: int = 0  # Position of the batch within its file
+    chunks: List[Tuple[int, Dict]] = field(default_factory=list)  # (chunk_id, chunk) to store
+    vector_ids: List[str] = field(default_factory=list)
+    chunk_hashes: List[str] = field(default_factory=list)
+    reused_records: List[Tuple[int, str, str]] = field(default_factory=list)  # Chunks kept from the stored version or matching a near-duplicate
+    signatures: Optional[List[Any]] = None
+    embeddings: Optional[List[List[float]]] = None
+    end_of_file: bool = False
+
+
+class _StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+
+    def as_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "chunks": self.chunks,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": round(self.busy_seconds / elapsed, 3) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / self.busy_seconds, 1) if self.busy_seconds else 0.0
+        }
+
+
+class _MeasuredQueue(asyncio.Queue):
+    """asyncio.Queue that samples its depth on every put"""
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.full_waits = 0  # Puts that had to wait for the consumer (back-pressure)
+
+    async def put(self, item):
+        depth = self.qsize()
+        self.samples += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, min(depth + 1, self.maxsize))
+        if self.full():
+            self.full_waits += 1
+        await super().put(item)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.maxsize,
+            "avg_depth": round(self.depth_total / self.samples, 2) if self.samples else 0.0,
+            "max_depth": self.max_depth,
+            "full_waits": self.full_waits
+        }
+
+
+class IngestionPipeline:
+    """Parse -> embed -> upsert, one task per stage"""
+
+    def __init__(
+        self,
+        processor: FileProcessor,
+        vector_client: Any,
+        persona_id: str,
+        namespace: str,
+        build_metadata: Callable[[PipelineFile, int, Dict], Dict[str, Any]],
+        dedup_index: Optional[Any] = None,
+        queue_size: Optional[int] = None,
+        on_file_start: Optional[Callable[[PipelineFile], Awaitable[None]]] = None,
+        on_file_done: Optional[Callable[[PipelineFile], Awaitable[None]]] = None,
+        registry: Optional[DocumentRegistry] = None,
+        on_progress: Optional[Callable[[str, PipelineFile, int], None]] = None,
+        checkpoints: Optional[IngestionCheckpoints] = None
+    ):
+        """
+        Args:
+            processor: Parses files and embeds chunks
+            vector_client: Pinecone or local vector store client
+            persona_id: Persona the chunks belong to
+            namespace: Vector namespace of the persona
+            build_metadata: Returns the vector metadata for (file, chunk_id, chunk)
+            dedup_index: Near-duplicate chunk index, if enabled
+            queue_size: Batches buffered between stages (INGEST_PIPELINE_QUEUE_SIZE)
+            on_file_start: Awaited when parsing of a file begins
+            on_file_done: Awaited once all of a file's batches are upserted (or it failed)
+            registry: Document registry for incremental re-ingestion, if enabled
+            on_progress: Called with ('embed' or 'upsert', file, chunk count)
+                after each batch a stage completes
+            checkpoints: The job's batch checkpoints, to resume files an
+                earlier attempt left half-stored
+        """
+        self.processor = processor
+        self.vector_client = vector_client
+        self.persona_id = persona_id
+        self.namespace = namespace
+        self.build_metadata = build_metadata
+        self.dedup_index = dedup_index
+        self.queue_size = queue_size or int(os.getenv("INGEST_PIPELINE_QUEUE_SIZE", "4"))
+        self.on_file_start = on_file_start
+        self.on_file_done = on_file_done
+        self.registry = registry
+        self.on_progress = on_progress
+        self.checkpoints = checkpoints
+
+        self._stats = {name: _StageStats(name) for name in ("parse", "embed", "upsert")}
+        self._queues: Dict[str, _MeasuredQueue] = {}
+        self._elapsed = 0.0
+
+    async def run(self, files_data: List[Dict[str, Any]]) -> List[PipelineFile]:
+        """
+        Ingest files through the pipeline
+
+        Failures are isolated per file: a file whose parse, embed or upsert
+        fails gets `error` set and the rest of the job continues.
+
+        Returns:
+            One PipelineFile per input, in input order
+        """
+        files = [
+            PipelineFile(index=i, file_data=file_data, filename=file_data['filename'])
+            for i, file_data in enumerate(files_data)
+        ]
+        self._queues = {
+            "embed": _MeasuredQueue(self.queue_size),
+            "upsert": _MeasuredQueue(self.queue_size)
+        }
+
+        start = time.perf_counter()
+        tasks = [
+            asyncio.create_task(self._parse_stage(files)),
+            asyncio.create_task(self._embed_stage()),
+            asyncio.create_task(self._upsert_stage())
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._elapsed = time.perf_counter() - start
+
+        stats = self.get_stats()
+        logger.info(
+            f"Pipeline finished {len(files)} files in {stats['elapsed_seconds']}s: "
+            + ", ".join(
+                f"{name} {stage['chunks']} chunks at {stage['chunks_per_second']}/s "
+                f"({stage['utilization']:.0%} busy)"
+                for name, stage in stats["stages"].items()
+            )
+            + "; queues "
+            + ", ".join(
+                f"{name} avg {queue['avg_depth']}/{queue['capacity']}"
+                for name, queue in stats["queues"].items()
+            )
+        )
+        return files
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-stage throughput and queue occupancy of the last run"""
+        return {
+            "elapsed_seconds": round(self._elapsed, 3),
+            "stages": {name: stage.as_dict(self._elapsed) for name, stage in self._stats.items()},
+            "queues": {name: queue.as_dict() for name, queue in self._queues.items()}
+        }
+
+    async def _parse_stage(self, files: List[PipelineFile]):
+        stats = self._stats["parse"]
+        out = self._queues["embed"]
+        processor = self.processor
+        seen_hashes = set()
+
+        for pipeline_file in files:
+            file_data = pipeline_file.file_data
+            if self.on_file_start:
+                await self.on_file_start(pipeline_file)
+            try:
+                # Map the uploaded file from the blob store; unmapped when the block exits
+                with processor.open_content(file_data) as content_bytes:
+                    pipeline_file.file_type = processor.get_file_type(pipeline_file.filename)
+                    pipeline_file.file_hash = file_data.get('blob_hash') or processor.get_file_hash(content_bytes)
+
+                    if pipeline_file.file_hash in seen_hashes:
+                        logger.info(f"Skipping duplicate file: {pipeline_file.filename} (hash: {pipeline_file.file_hash[:8]})")
+                        pipeline_file.skipped = True
+                    else:
+                        seen_hashes.add(pipeline_file.file_hash)
+                        if self.registry is not None:
+                            pipeline_file.previous = await self.registry.get(self.persona_id, pipeline_file.filename)
+                        if pipeline_file.previous and pipeline_file.previous.file_hash == pipeline_file.file_hash:
+                            logger.info(f"Skipping unchanged file: {pipeline_file.filename} (hash: {pipeline_file.file_hash[:8]})")
+                            pipeline_file.unchanged = True
+                        else:
+                            await self._parse_file(pipeline_file, content_bytes, out, stats)
+            except Exception as e:
+                logger.error(f"Error processing file {pipeline_file.filename}: {e}")
+                pipeline_file.error = str(e)
+
+            await out.put(_Batch(file=pipeline_file, end_of_file=True))
+
+        await out.put(None)
+
+    async def _parse_file(self, pipeline_file: PipelineFile, content_bytes, out: _MeasuredQueue, stats: _StageStats):
+        chunk_batches = self.processor.iter_chunk_batches(
+            pipeline_file.filename, content_bytes, self.processor.content_path(pipeline_file.file_data)
+        )
+        # Vectors of the stored version, by chunk text, still free to be reused
+        reusable = {
+            hash_value: list(vector_ids)
+            for hash_value, vector_ids in pipeline_file.previous.chunk_vectors.items()
+        } if pipeline_file.previous else {}
+        resumable = await self._load_checkpoints(pipeline_file) if self.checkpoints else {}
+        batch_index = -1
+        while True:
+            started = time.perf_counter()
+            # Parsing and chunking are CPU-bound; keep them off the event loop
+            chunks = await asyncio.to_thread(next, chunk_batches, None)
+            if chunks is None:
+                stats.busy_seconds += time.perf_counter() - started
+                return
+            pipeline_file.generated_chunks += len(chunks)
+            batch_index += 1
+
+            if batch_index in resumable:
+                # Stored by an earlier attempt: chunking is deterministic, so
+                # the checkpoint covers exactly these chunks
+                records = resumable[batch_index]
+                for chunk_id, hash_value, stored_id in records:
+                    if stored_id in reusable.get(hash_value, ()):
+                        reusable[hash_value].remove(stored_id)
+                        pipeline_file.reused_chunks += 1
+                    elif stored_id == self._vector_id(pipeline_file, chunk_id):
+                        pipeline_file.stored_chunks += 1
+                        pipeline_file.resumed_chunks += 1
+                    # Otherwise a near-duplicate referencing another vector
+                pipeline_file.chunk_records.extend(records)
+                stats.batches += 1
+                stats.chunks += len(chunks)
+                stats.busy_seconds += time.perf_counter() - started
+                continue
+
+            batch = _Batch(file=pipeline_file, index=batch_index)
+            new_chunks = []
+            for chunk in chunks:
+                hash_value = chunk_hash(chunk['text'])
+                if reusable.get(hash_value):
+                    # The stored version has this text already embedded
+                    batch.reused_records.append((chunk['chunk_id'], hash_value, reusable[hash_value].pop(0)))
+                    pipeline_file.reused_chunks += 1
+                else:
+                    new_chunks.append(chunk)
+                    batch.chunk_hashes.append(hash_value)
+            batch.chunks = [(chunk['chunk_id'], chunk) for chunk in new_chunks]
+
+            if self.dedup_index is not None and new_chunks:
+                await self._drop_duplicates(batch, new_chunks)
+            pipeline_file.chunk_records.extend(batch.reused_records)
+            batch.vector_ids = [self._vector_id(pipeline_file, chunk_id) for chunk_id, _ in batch.chunks]
+            if self.dedup_index is not None:
+                # Index now rather than after the upsert, so the next batch of
+                # this file (parsed while this one is still in flight) sees it
+                await asyncio.to_thread(self.dedup_index.add, self.persona_id, batch.vector_ids, batch.signatures)
+
+            stats.batches += 1
+            stats.chunks += len(chunks)
+            stats.busy_seconds += time.perf_counter() - started
+            if batch.chunks:
+                await out.put(batch)
+
+    def _vector_id(self, pipeline_file: PipelineFile, chunk_id: int) -> str:
+        return vector_id(self.persona_id, pipeline_file.filename, pipeline_file.file_hash, chunk_id)
+
+    async def _drop_duplicates(self, batch: _Batch, chunks: List[Dict]):
+        """
+        Skip chunks that near-duplicate ones the persona already has, recording
+        each with the vector it matched
+        """
+        keep, duplicates, signatures = await asyncio.to_thread(
+            self.dedup_index.find_duplicates, self.persona_id, [chunk['text'] for chunk in chunks]
+        )
+        previous = batch.file.previous
+        if duplicates:
+            # Matches against the stored version of this file don't count:
+            # those vectors are deleted if the new version no longer has them.
+            # Nor do the chunks' own vectors, left indexed by an attempt of
+            # the job that died before storing or un-indexing them
+            own_ids = set(previous.vector_ids) if previous else set()
+            own_ids |= {self._vector_id(batch.file, chunk['chunk_id']) for chunk in chunks}
+            keep = sorted(keep + [k for k, match in duplicates.items() if match in own_ids])
+            duplicates = {k: match for k, match in duplicates.items() if match not in own_ids}
+        if duplicates:
+            logger.info(f"Skipping {len(duplicates)} near-duplicate chunks in {batch.file.filename}")
+            batch.reused_records.extend(
+                (chunks[k]['chunk_id'], batch.chunk_hashes[k], match) for k, match in duplicates.items()
+            )
+        batch.chunks = [(chunks[k]['chunk_id'], chunks[k]) for k in keep]
+        batch.chunk_hashes = [batch.chunk_hashes[k] for k in keep]
+        batch.signatures = [signatures[k] for k in keep]
+
+    async def _embed_stage(self):
+        stats = self._stats["embed"]
+        source = self._queues["embed"]
+        out = self._queues["upsert"]
+
+        while True:
+            batch = await source.get()
+            if batch is None:
+                await out.put(None)
+                return
+            if not batch.end_of_file and batch.file.error is None:
+                started = time.perf_counter()
+                try:
+                    # The embedder packs the batch into requests by token count
+                    batch.embeddings = await self.processor.embedder.embed_documents(
+                        [chunk['text'] for _, chunk in batch.chunks]
+                    )
+                    stats.batches += 1
+                    stats.chunks += len(batch.chunks)
+                    if self.on_progress:
+                        self.on_progress("embed", batch.file, len(batch.chunks))
+                except Exception as e:
+                    self._fail_batch(batch, e)
+                stats.busy_seconds += time.perf_counter() - started
+            elif not batch.end_of_file:
+                self._fail_batch(batch, None)
+            await out.put(batch)
+
+    async def _upsert_stage(self):
+        stats = self._stats["upsert"]
+        source = self._queues["upsert"]
+
+        while True:
+            batch = await source.get()
+            if batch is None:
+                return
+            pipeline_file = batch.file
+
+            if batch.end_of_file:
+                if pipeline_file.error is None and not pipeline_file.skipped and not pipeline_file.unchanged:
+                    if self.registry is not None:
+                        await self._record_document(pipeline_file)
+                    if self.checkpoints is not None and pipeline_file.error is None:
+                        await self._clear_checkpoints(pipeline_file)
+                    if pipeline_file.generated_chunks:
+                        logger.info(
+                            f"Uploaded {pipeline_file.stored_chunks} of {pipeline_file.generated_chunks} "
+                            f"chunks for {pipeline_file.filename} ({pipeline_file.reused_chunks} unchanged, "
+                            f"{pipeline_file.deleted_chunks} removed, {pipeline_file.resumed_chunks} resumed)"
+                        )
+                    else:
+                        logger.warning(f"No chunks generated for file: {pipeline_file.filename}")
+                if self.on_file_done:
+                    await self.on_file_done(pipeline_file)
+                continue
+
+            if pipeline_file.error is not None or batch.embeddings is None:
+                self._fail_batch(batch, None)
+                continue
+
+            started = time.perf_counter()
+            try:
+                await self.vector_client.upsert_vectors(
+                    namespace=self.namespace,
+                    embeddings=batch.embeddings,
+                    metadata=[
+                        self.build_metadata(pipeline_file, chunk_id, chunk)
+                        for chunk_id, chunk in batch.chunks
+                    ],
+                    ids=batch.vector_ids
+                )
+                pipeline_file.stored_chunks += len(batch.chunks)
+                records = [
+                    (chunk_id, hash_value, vector_id)
+                    for (chunk_id, _), hash_value, vector_id in zip(batch.chunks, batch.chunk_hashes, batch.vector_ids)
+                ]
+                pipeline_file.chunk_records.extend(records)
+                stats.batches += 1
+                stats.chunks += len(batch.chunks)
+                if self.on_progress:
+                    self.on_progress("upsert", pipeline_file, len(batch.chunks))
+            except Exception as e:
+                self._fail_batch(batch, e)
+            else:
+                if self.checkpoints is not None:
+                    await self._checkpoint(batch, batch.reused_records + records)
+            stats.busy_seconds += time.perf_counter() - started
+
+    async def _record_document(self, pipeline_file: PipelineFile):
+        """Save the file's new version and delete the vectors it no longer uses"""
+        try:
+            removed = await self.registry.save(
+                self.persona_id,
+                pipeline_file.filename,
+                pipeline_file.file_hash,
+                pipeline_file.file_type,
+                pipeline_file.file_data.get('size'),
+                sorted(pipeline_file.chunk_records)
+            )
+            if removed:
+                await self.vector_client.delete_vectors(self.namespace, removed)
+                if self.dedup_index is not None:
+                    await asyncio.to_thread(self.dedup_index.remove, self.persona_id, removed)
+                pipeline_file.deleted_chunks = len(removed)
+        except Exception as e:
+            logger.error(f"Error recording document {pipeline_file.filename}: {e}")
+            pipeline_file.error = str(e)
+
+    async def _load_checkpoints(self, pipeline_file: PipelineFile) -> Dict[int, List[Tuple[int, str, str]]]:
+        try:
+            return await self.checkpoints.load(pipeline_file.file_hash)
+        except Exception as e:
+            # Vector IDs are deterministic, so redoing stored batches only costs time
+            logger.warning(f"Failed to load checkpoints of {pipeline_file.filename}, ingesting it from the start: {e}")
+            return {}
+
+    async def _checkpoint(self, batch: _Batch, records: List[Tuple[int, str, str]]):
+        """Record a stored batch; without the checkpoint a retry just redoes it"""
+        try:
+            await self.checkpoints.save(batch.file.file_hash, batch.index, records)
+        except Exception as e:
+            logger.warning(f"Failed to checkpoint batch {batch.index} of {batch.file.filename}: {e}")
+
+    async def _clear_checkpoints(self, pipeline_file: PipelineFile):
+        try:
+            await self.checkpoints.clear(pipeline_file.file_hash)
+        except Exception as e:
+            logger.warning(f"Failed to clear checkpoints of {pipeline_file.filename}: {e}")
+
+    def _fail_batch(self, batch: _Batch, error: Optional[Exception]):
+        """Mark the batch's file failed and un-index the batch's chunks"""
+        if error is not None and batch.file.error is None:
+            logger.error(f"Error processing file {batch.file.filename}: {error}")
+            batch.file.error = str(error)
+        if self.dedup_index is not None and batch.vector_ids:
+            try:
+                self.dedup_index.remove(self.persona_id, batch.vector_ids)
+            except Exception as e:
+                logger.warning(f"Failed to un-index chunks of {batch.file.filename}: {e}")
+            batch.vector_ids = []
@@ -3,8 +3,6 @@ Ingestion Worker for processing multiple files asynchronously
 Handles file parsing, chunking, deduplication, embedding, and vector storage
 """
 import os
-import io
-import hashlib
 import asyncio
 import logging
 from typing import List, Dict, Any, Optional
@@ -20,18 +18,21 @@ load_dotenv()
 import asyncpg
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select, update
+from sqlalchemy import func, select, update
 
 # Import our services
-from services.chunker import TextChunker
-from services.embedder import Embedder
+from services.file_processor import FileProcessor
+from services.ingestion_pipeline import IngestionPipeline
+from services.client_pool import get_client_pool
+from services.dedup_index import get_dedup_index
+from services.document_registry import DocumentRegistry
+from services.ingestion_checkpoints import IngestionCheckpoints
+from services.answer_cache import get_answer_cache
+from services.blob_store import get_blob_store
+from services.job_progress import get_job_progress_hub
 from services.pinecone_client import get_pinecone_client
 from models import IngestionJob, JobStatus, Persona
 
-# PDF processing
-import pypdf
-from io import BytesIO
-
 logger = logging.getLogger(__name__)
 
 # Database setup for worker  
@@ -61,71 +62,24 @@ engine = create_async_engine(
 )
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
-class FileProcessor:
-    """Handles individual file processing tasks"""
-    
-    def __init__(self):
-        self.chunker = TextChunker()
-        self.embedder = Embedder()
-        
-    def process_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF content"""
-        try:
-            pdf_file = BytesIO(file_content)
-            reader = pypdf.PdfReader(pdf_file)
-            text = ""
-            
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text.strip()
-        except Exception as e:
-            logger.error(f"PDF processing error: {e}")
-            raise ValueError(f"Failed to process PDF: {str(e)}")
-    
-    def process_text_file(self, file_content: bytes) -> str:
-        """Process text file content"""
-        try:
-            return file_content.decode('utf-8', errors='ignore').strip()
-        except Exception as e:
-            logger.error(f"Text file processing error: {e}")
-            raise ValueError(f"Failed to process text file: {str(e)}")
-    
-    def get_file_hash(self, content: str) -> str:
-        """Generate SHA-256 hash of file content for deduplication"""
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
-    
-    def parse_file(self, filename: str, content: bytes) -> Dict[str, Any]:
-        """
-        Parse file content and extract text
-        
-        Returns:
-            Dict with parsed content and metadata
-        """
-        filename_lower = filename.lower()
-        
-        if filename_lower.endswith('.pdf'):
-            text_content = self.process_pdf(content)
-            file_type = "pdf"
-        elif filename_lower.endswith('.txt'):
-            text_content = self.process_text_file(content)
-            file_type = "text"
-        else:
-            raise ValueError(f"Unsupported file type: {filename}")
-        
-        if not text_content.strip():
-            raise ValueError(f"File {filename} is empty or could not be processed")
-        
-        file_hash = self.get_file_hash(text_content)
-        
-        return {
-            "filename": filename,
-            "content": text_content,
-            "file_type": file_type,
-            "hash": file_hash,
-            "size": len(content),
-            "char_count": len(text_content)
+def metadata_builder(persona_id: str, topic_tags: Optional[List[str]] = None):
+    """Vector metadata for the chunks of a persona's files"""
+    def build_metadata(pipeline_file, chunk_index, chunk):
+        metadata = {
+            "persona_id": persona_id,
+            "source": pipeline_file.filename,
+            "file_type": pipeline_file.file_type,
+            "file_hash": pipeline_file.file_hash,
+            "chunk_index": chunk_index,
+            "text": chunk['text'],
+            "created_at": datetime.utcnow().isoformat()
         }
+        
+        # Add topic tags if provided
+        if topic_tags:
+            metadata["topic_tags"] = topic_tags
+        return metadata
+    return build_metadata
 
 async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[Dict[str, Any]], topic_tags: Optional[List[str]] = None):
     """
@@ -134,7 +88,8 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
     Args:
         job_id: Database job ID (not RQ job ID)
         persona_id: Target persona ID
-        files_data: List of file data dicts with 'filename' and 'content' keys
+        files_data: List of file data dicts with 'filename' and 'blob_hash' keys
+            (or base64 'content', for jobs enqueued before the blob store)
     """
     logger.info(f"=== STARTING INGESTION JOB {job_id} ===")
     logger.info(f"Persona ID: {persona_id}")
@@ -142,6 +97,7 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
     
     processor = FileProcessor()
     rq_job = get_current_job()
+    progress_hub = get_job_progress_hub()
     
     logger.info(f"Starting ingestion job {job_id} for persona {persona_id} with {len(files_data)} files")
     
@@ -157,6 +113,11 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
             # Update job status to processing
             await update_job_status(db, job_id, JobStatus.PROCESSING, 0)
             await db.commit()  # Commit the status update immediately
+            progress_hub.publish(
+                job_id, "started",
+                persona_id=persona_id, status=JobStatus.PROCESSING.value, progress=0,
+                processed_files=0, total_files=len(files_data), chunks_embedded=0, chunks_upserted=0
+            )
             
             # Get persona info
             result = await db.execute(select(Persona).where(Persona.id == persona_id))
@@ -170,112 +131,72 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
             
             processed_files = 0
             total_chunks = 0
-            processed_hashes = set()  # For deduplication
+            removed_chunks = 0
+            
+            chunks_embedded = 0
+            chunks_upserted = 0
+            
+            async def on_file_start(pipeline_file):
+                # Push progress with current file to viewers
+                progress = int((pipeline_file.index / len(files_data)) * 100)
+                progress_hub.publish(job_id, "file_started", current_file=pipeline_file.filename, progress=progress)
+                
+                logger.info(f"Processing file {pipeline_file.index + 1}/{len(files_data)}: {pipeline_file.filename}")
             
-            for i, file_data in enumerate(files_data):
-                try:
-                    filename = file_data['filename']
-                    # Decode base64 content back to bytes
-                    import base64
-                    content_bytes = base64.b64decode(file_data['content'])
-                    
-                    # Update progress with current file
-                    progress = int((i / len(files_data)) * 100)
-                    if rq_job:
-                        rq_job.meta['current_file'] = filename
-                        rq_job.meta['progress'] = progress
-                        rq_job.save_meta()
-                    
-                    logger.info(f"Processing file {i+1}/{len(files_data)}: {filename}")
-                    
-                    # Parse file content
-                    parsed_data = processor.parse_file(filename, content_bytes)
-                    file_hash = parsed_data['hash']
-                    
-                    # Check for duplicates
-                    if file_hash in processed_hashes:
-                        logger.info(f"Skipping duplicate file: {filename} (hash: {file_hash[:8]})")
-                        continue
-                    
-                    processed_hashes.add(file_hash)
-                    
-                    # Chunk the content
-                    chunks = processor.chunker.chunk_text(
-                        text=parsed_data['content'],
-                        source=filename
-                    )
-                    
-                    if not chunks:
-                        logger.warning(f"No chunks generated for file: {filename}")
-                        continue
-                    
-                    logger.info(f"Generated {len(chunks)} chunks for {filename}")
-                    
-                    # Create embeddings in batches
-                    batch_size = 100  # Process 100 chunks at a time
-                    for batch_start in range(0, len(chunks), batch_size):
-                        batch_chunks = chunks[batch_start:batch_start + batch_size]
-                        
-                        # Generate embeddings for batch
-                        texts = [chunk['text'] for chunk in batch_chunks]
-                        embeddings = await processor.embedder.embed_documents(texts)
-                        
-                        # Prepare vectors for Pinecone
-                        vector_ids = []
-                        metadata_list = []
-                        
-                        for j, (chunk, embedding) in enumerate(zip(batch_chunks, embeddings)):
-                            vector_id = f"{persona_id}_{file_hash[:8]}_{batch_start + j}"
-                            vector_ids.append(vector_id)
-                            
-                            metadata = {
-                                "persona_id": persona_id,
-                                "source": filename,
-                                "file_type": parsed_data['file_type'],
-                                "file_hash": file_hash,
-                                "chunk_index": batch_start + j,
-                                "text": chunk['text'],
-                                "created_at": datetime.utcnow().isoformat()
-                            }
-                            
-                            # Add topic tags if provided
-                            if topic_tags:
-                                metadata["topic_tags"] = topic_tags
-                            
-                            metadata_list.append(metadata)
-                        
-                        # Upsert to Pinecone with correct method signature
-                        await pinecone_client.upsert_vectors(
-                            namespace=namespace,
-                            embeddings=embeddings,
-                            metadata=metadata_list,
-                            ids=vector_ids
-                        )
-                        
-                        logger.info(f"Uploaded batch {batch_start//batch_size + 1} for {filename}")
-                    
-                    total_chunks += len(chunks)
-                    processed_files += 1
-                    
-                    # Update job progress
-                    progress = int(((i + 1) / len(files_data)) * 100)
-                    await update_job_status(db, job_id, JobStatus.PROCESSING, progress, processed_files)
-                    
-                    if rq_job:
-                        rq_job.meta['processed_files'] = processed_files
-                        rq_job.meta['total_chunks'] = total_chunks
-                        rq_job.save_meta()
+            async def on_file_done(pipeline_file):
+                nonlocal processed_files, total_chunks, removed_chunks
+                if not pipeline_file.succeeded:
+                    return
+                total_chunks += pipeline_file.stored_chunks
+                removed_chunks += pipeline_file.deleted_chunks
+                processed_files += 1
                 
-                except Exception as file_error:
-                    logger.error(f"Error processing file {filename}: {file_error}")
-                    # Continue with other files, don't fail entire job
-                    continue
+                # Update job progress
+                progress = int(((pipeline_file.index + 1) / len(files_data)) * 100)
+                await update_job_status(db, job_id, JobStatus.PROCESSING, progress, processed_files)
+                progress_hub.publish(
+                    job_id, "file_done",
+                    progress=progress, processed_files=processed_files, total_chunks=total_chunks
+                )
+            
+            def on_progress(stage, pipeline_file, chunk_count):
+                nonlocal chunks_embedded, chunks_upserted
+                if stage == "embed":
+                    chunks_embedded += chunk_count
+                    progress_hub.publish(job_id, "chunks_embedded", chunks_embedded=chunks_embedded)
+                else:
+                    chunks_upserted += chunk_count
+                    progress_hub.publish(job_id, "vectors_upserted", chunks_upserted=chunks_upserted)
+            
+            # Parse, embed and upsert in overlapping stages; failed files are
+            # logged by the pipeline and the rest of the job continues
+            pipeline = IngestionPipeline(
+                processor,
+                pinecone_client,
+                persona_id,
+                namespace,
+                metadata_builder(persona_id, topic_tags),
+                dedup_index=get_dedup_index(),
+                on_file_start=on_file_start,
+                on_file_done=on_file_done,
+                registry=DocumentRegistry.for_async_sessions(AsyncSessionLocal),
+                on_progress=on_progress,
+                checkpoints=IngestionCheckpoints.for_async_sessions(AsyncSessionLocal, job_id)
+            )
+            await pipeline.run(files_data)
             
-            # Update persona chunk count
+            if rq_job:
+                rq_job.meta['pipeline'] = pipeline.get_stats()
+                rq_job.save_meta()
+            
+            if total_chunks or removed_chunks:
+                get_answer_cache().invalidate_persona(persona_id)
+            
+            # Update persona chunk count (re-ingested files may have dropped chunks)
             await db.execute(
                 update(Persona)
                 .where(Persona.id == persona_id)
-                .values(chunk_count=Persona.chunk_count + total_chunks)
+                .values(chunk_count=Persona.chunk_count + total_chunks - removed_chunks)
             )
             
             # Mark job as completed with chunk count in metadata
@@ -283,12 +204,21 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
             await db.commit()
             
             logger.info(f"Completed ingestion job {job_id}: {processed_files} files, {total_chunks} chunks")
+            progress_hub.publish(
+                job_id, "completed",
+                status=JobStatus.COMPLETED.value, progress=100, current_file=None,
+                processed_files=processed_files, total_chunks=total_chunks
+            )
             
             if rq_job:
                 rq_job.meta['completed'] = True
                 rq_job.meta['final_chunks'] = total_chunks
                 rq_job.save_meta()
             
+            await asyncio.to_thread(
+                get_blob_store().settle_job, job_id, [f.get('blob_hash') for f in files_data], failed=False
+            )
+            
             return {
                 "processed_files": processed_files,
                 "total_chunks": total_chunks,
@@ -302,6 +232,10 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
             error_msg = str(e)
             await update_job_status(db, job_id, JobStatus.FAILED, 0, 0, error_msg)
             await db.commit()
+            progress_hub.publish(job_id, "failed", status=JobStatus.FAILED.value, current_file=None, error=error_msg)
+            await asyncio.to_thread(
+                get_blob_store().settle_job, job_id, [f.get('blob_hash') for f in files_data], failed=True
+            )
             
             if rq_job:
                 rq_job.meta['error'] = error_msg
@@ -313,6 +247,210 @@ async def process_ingestion_job(job_id: str, persona_id: str, files_data: List[D
             # Ensure database connections are properly closed
             await db.close()
 
+async def _job_attempt(db: AsyncSession, job_id: str, lock: bool = False) -> Optional[int]:
+    """The job's current attempt (bumped by each requeue), or None if the job is gone"""
+    query = select(IngestionJob.job_metadata).where(IngestionJob.id == job_id)
+    if lock:
+        query = query.with_for_update()
+    row = (await db.execute(query)).one_or_none()
+    if row is None:
+        return None
+    return (row.job_metadata or {}).get("attempts", 1)
+
+async def process_ingestion_file(
+    job_id: str,
+    persona_id: str,
+    file_data: Dict[str, Any],
+    total_files: int,
+    topic_tags: Optional[List[str]] = None,
+    attempt: int = 1
+):
+    """
+    Worker function for one file of an ingestion job
+    
+    Jobs are fanned out into one task per file (see services.fair_scheduler),
+    so a job's files are processed in parallel by whichever workers are free.
+    The parent IngestionJob aggregates the results: each task atomically adds
+    to its counters, and the task that finishes the last file completes it.
+    
+    Args:
+        job_id: Database job ID (not RQ job ID)
+        persona_id: Target persona ID
+        file_data: File data dict with 'filename' and 'blob_hash' keys
+        total_files: Number of files in the job
+        topic_tags: Topic tags added to every chunk's metadata
+        attempt: Attempt of the job the task belongs to; tasks of an attempt
+            superseded by a requeue do nothing
+    """
+    progress_hub = get_job_progress_hub()
+    filename = file_data['filename']
+    logger.info(f"Processing file {filename} of ingestion job {job_id}")
+    
+    result = None
+    error = None
+    try:
+        async with AsyncSessionLocal() as db:
+            current_attempt = await _job_attempt(db, job_id)
+            if current_attempt is not None and current_attempt != attempt:
+                logger.info(f"Skipping {filename} of job {job_id}: attempt {attempt} was superseded by {current_attempt}")
+                return {"filename": filename, "status": "superseded", "chunks": 0, "error": None}
+            
+            # The first of the job's tasks to start moves it out of QUEUED
+            started = await db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.status == JobStatus.QUEUED)
+                .values(status=JobStatus.PROCESSING)
+            )
+            result_row = await db.execute(select(Persona.namespace).where(Persona.id == persona_id))
+            namespace = result_row.scalar_one_or_none()
+            await db.commit()
+        if started.rowcount:
+            progress_hub.publish(
+                job_id, "started",
+                persona_id=persona_id, status=JobStatus.PROCESSING.value, progress=0,
+                processed_files=0, failed_files=0, total_files=total_files
+            )
+        if namespace is None:
+            raise ValueError(f"Persona {persona_id} not found")
+        
+        progress_hub.publish(job_id, "file_started", current_file=filename)
+        
+        def on_progress(stage, pipeline_file, chunk_count):
+            if stage == "embed":
+                progress_hub.publish(job_id, "chunks_embedded", increments={"chunks_embedded": chunk_count})
+            else:
+                progress_hub.publish(job_id, "vectors_upserted", increments={"chunks_upserted": chunk_count})
+        
+        pipeline = IngestionPipeline(
+            FileProcessor(),
+            get_pinecone_client(),
+            persona_id,
+            namespace,
+            metadata_builder(persona_id, topic_tags),
+            dedup_index=get_dedup_index(),
+            registry=DocumentRegistry.for_async_sessions(AsyncSessionLocal),
+            on_progress=on_progress,
+            checkpoints=IngestionCheckpoints.for_async_sessions(AsyncSessionLocal, job_id)
+        )
+        result = (await pipeline.run([file_data]))[0]
+        if not result.succeeded:
+            error = result.error or "No chunks generated"
+    except Exception as e:
+        logger.error(f"File {filename} of job {job_id} failed: {e}")
+        error = str(e)
+    
+    await record_file_result(job_id, persona_id, filename, result, error, attempt)
+    return {
+        "filename": filename,
+        "status": "failed" if error else "completed",
+        "chunks": result.stored_chunks if result and not error else 0,
+        "error": error
+    }
+
+async def record_file_result(
+    job_id: str,
+    persona_id: str,
+    filename: str,
+    result,
+    error: Optional[str],
+    attempt: int = 1
+):
+    """
+    Add a finished file to its job's counters, completing the job after the last file
+    
+    The counters are incremented with a single UPDATE ... RETURNING, so
+    concurrent file tasks never lose an update and exactly one of them sees
+    the job's final count. Results of a superseded attempt are dropped: the
+    job row is locked while its attempt is checked, so a concurrent requeue
+    either resets the counters after this update or makes it a no-op.
+    """
+    progress_hub = get_job_progress_hub()
+    async with AsyncSessionLocal() as db:
+        current_attempt = await _job_attempt(db, job_id, lock=True)
+        if current_attempt is not None and current_attempt != attempt:
+            await db.rollback()
+            logger.info(f"Ignoring result of {filename} for job {job_id}: attempt {attempt} was superseded by {current_attempt}")
+            return
+        
+        if error is None:
+            values = {
+                "processed_files": func.coalesce(IngestionJob.processed_files, 0) + 1,
+                "chunks_created": func.coalesce(IngestionJob.chunks_created, 0) + result.stored_chunks
+            }
+        else:
+            values = {"failed_files": func.coalesce(IngestionJob.failed_files, 0) + 1}
+        row = (await db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id)
+            .values(**values)
+            .returning(
+                IngestionJob.processed_files,
+                IngestionJob.failed_files,
+                IngestionJob.total_files,
+                IngestionJob.chunks_created
+            )
+        )).one_or_none()
+        
+        if error is None and result.stored_chunks != result.deleted_chunks:
+            # Re-ingested files may have dropped chunks
+            await db.execute(
+                update(Persona)
+                .where(Persona.id == persona_id)
+                .values(chunk_count=Persona.chunk_count + result.stored_chunks - result.deleted_chunks)
+            )
+        await db.commit()
+    
+    if error is None and (result.stored_chunks or result.deleted_chunks):
+        get_answer_cache().invalidate_persona(persona_id)
+    
+    if row is None:
+        logger.error(f"Ingestion job {job_id} not found while recording {filename}")
+        return
+    
+    processed_files, failed_files, total_files, chunks_created = row
+    done = processed_files + failed_files
+    progress = int(done / total_files * 100) if total_files else 100
+    progress_hub.publish(
+        job_id, "file_done",
+        progress=progress, processed_files=processed_files, failed_files=failed_files,
+        total_files=total_files, total_chunks=chunks_created,
+        **({"error": f"{filename}: {error}"} if error else {})
+    )
+    
+    if done >= total_files:
+        await finish_ingestion_job(job_id, processed_files, failed_files, chunks_created)
+
+async def finish_ingestion_job(job_id: str, processed_files: int, failed_files: int, chunks_created: int):
+    """Mark a fanned-out job completed (or failed, if none of its files succeeded)"""
+    status = JobStatus.COMPLETED if processed_files else JobStatus.FAILED
+    error_message = None if processed_files else f"All {failed_files} files failed to process"
+    
+    async with AsyncSessionLocal() as db:
+        job = (await db.execute(select(IngestionJob).where(IngestionJob.id == job_id))).scalar_one_or_none()
+        if job is None:
+            return
+        job.status = status
+        job.error_message = error_message
+        job.job_metadata = {
+            **(job.job_metadata or {}),
+            "chunks_created": chunks_created,
+            "failed_files": failed_files,
+            "completed_at": datetime.utcnow().isoformat()
+        }
+        blob_hashes = [f.get("hash") for f in job.job_metadata.get("files", [])]
+        await db.commit()
+    
+    # Only failed jobs can be requeued, so a completed job's files can go
+    await asyncio.to_thread(get_blob_store().settle_job, job_id, blob_hashes, failed=status == JobStatus.FAILED)
+    
+    logger.info(f"Completed ingestion job {job_id}: {processed_files} files, {failed_files} failed, {chunks_created} chunks")
+    get_job_progress_hub().publish(
+        job_id, "completed" if processed_files else "failed",
+        status=status.value, progress=100, current_file=None,
+        processed_files=processed_files, failed_files=failed_files, total_chunks=chunks_created,
+        **({} if processed_files else {"error": error_message})
+    )
+
 async def update_job_status(
     db: AsyncSession, 
     job_id: str, 
@@ -364,6 +502,8 @@ def run_ingestion_job(job_id: str, persona_id: str, files_data: List[Dict[str, A
             )
             return result
         finally:
+            # Pooled provider clients are bound to this loop; close them with it
+            loop.run_until_complete(get_client_pool().close_current_loop())
             loop.close()
     except Exception as e:
         logger.error(f"Background job failed: {e}")
@@ -397,4 +537,30 @@ def run_ingestion_job(job_id: str, persona_id: str, files_data: List[Dict[str, A
         except Exception as db_error:
             logger.error(f"Failed to update job status: {db_error}")
         
-        raise e 
\ No newline at end of file
+        raise e 
+
+def run_ingestion_file(
+    job_id: str,
+    persona_id: str,
+    file_data: Dict[str, Any],
+    total_files: int,
+    topic_tags: Optional[List[str]] = None,
+    attempt: int = 1
+):
+    """RQ entry point for one file of an ingestion job (see process_ingestion_file)"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            process_ingestion_file(job_id, persona_id, file_data, total_files, topic_tags, attempt)
+        )
+    finally:
+        # Pooled provider clients are bound to this loop; close them with it
+        loop.run_until_complete(get_client_pool().close_current_loop())
+        loop.close()
+        # This worker is free again: admit the next task, fairly across users
+        try:
+            from services.fair_scheduler import get_fair_scheduler
+            get_fair_scheduler().dispatch()
+        except Exception as e:
+            logger.error(f"Failed to dispatch pending ingestion tasks: {e}")
@@ -0,0 +1,345 @@
+"""
+Push-based ingestion progress
+
+Workers publish progress events (file started, chunks embedded, vectors
+upserted, file done, job completed or failed) instead of SSE endpoints
+polling Postgres and RQ metadata. Events go to a Redis pub/sub channel per
+job, so they reach API processes from RQ workers; without Redis they are
+delivered in-process (enough for the thread-based processor). Each event
+carries the job's full current state, and the latest state is also kept
+under a snapshot key, so a viewer that connects mid-job starts from the
+current state and a slow viewer can drop intermediate events.
+
+With Redis the snapshot is a hash that every publisher merges its fields
+into, and each event carries the merged hash: a job's files run as separate
+RQ tasks in separate processes, and none of them holds the whole state.
+
+In an API process, all viewers of a job share one channel subscription, and
+one reader task serves all subscribed channels.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "ingest:progress:"
+SNAPSHOT_SUFFIX = ":state"  # A hash; ':snapshot' held the older JSON string form
+# Events that end a job's stream
+TERMINAL_EVENTS = ("completed", "failed")
+
+
+def _channel(job_id: str) -> str:
+    return f"{CHANNEL_PREFIX}{job_id}"
+
+
+def _decode_snapshot(fields: Dict[str, str]) -> Dict[str, Any]:
+    """State from a snapshot hash (each field holds a JSON value)"""
+    state = {}
+    for name, value in fields.items():
+        try:
+            state[name] = json.loads(value)
+        except ValueError:
+            state[name] = value
+    return state
+
+
+class JobSubscription:
+    """A viewer's stream of one job's progress events"""
+
+    def __init__(self, job_id: str, queue: asyncio.Queue):
+        self.job_id = job_id
+        self._queue = queue
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event
+
+        Returns:
+            The job's state after the event, or None if `timeout` passed first
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class JobProgressHub:
+    """Publishes job progress and fans it out to subscribed viewers"""
+
+    def __init__(self, redis_url: str = None):
+        """
+        Args:
+            redis_url: Redis for cross-process delivery (REDIS_URL); falls
+                back to in-process delivery if unreachable or disabled
+        """
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self.snapshot_ttl = int(os.getenv("JOB_PROGRESS_SNAPSHOT_TTL_SECONDS", "3600"))
+        self.subscriber_buffer = int(os.getenv("JOB_PROGRESS_SUBSCRIBER_BUFFER", "32"))
+
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, Any]] = {}  # job id -> latest published state
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self.events_published = 0
+
+        self.redis_client = None
+        if os.getenv("JOB_PROGRESS_REDIS", "true").lower() == "true":
+            try:
+                client = redis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=2)
+                client.ping()
+                self.redis_client = client
+                logger.info("Job progress published via Redis")
+            except Exception as e:
+                logger.info(f"Redis not available, job progress is process-local: {e}")
+
+        # Subscriber side, created on the API event loop on first use
+        self._aio_client = None
+        self._pubsub = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._subscribe_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+    def publish(self, job_id: str, event: str, increments: Optional[Dict[str, int]] = None, **fields):
+        """
+        Record a progress event for a job and push it to viewers
+
+        Safe to call from any thread or event loop. Failures are logged, never
+        raised: progress reporting must not break ingestion.
+
+        Args:
+            job_id: Ingestion job ID
+            event: Event name, e.g. 'file_started', 'chunks_embedded',
+                'vectors_upserted', 'file_done', 'completed', 'failed'
+            increments: Counters to add to (e.g. chunks_upserted); with Redis
+                they are summed across all processes working on the job
+            **fields: State to merge into the job's progress (status,
+                progress, current_file, processed_files, ...)
+        """
+        if self.redis_client is not None:
+            self._publish_redis(job_id, event, increments or {}, fields)
+            return
+
+        with self._lock:
+            state = self._state.setdefault(job_id, {"job_id": job_id})
+            for name, amount in (increments or {}).items():
+                state[name] = state.get(name, 0) + amount
+            state.update(fields)
+            state["event"] = event
+            state["updated_at"] = time.time()
+            message = dict(state)
+            if event in TERMINAL_EVENTS:
+                self._state.pop(job_id, None)
+            self.events_published += 1
+        self._deliver(job_id, message)
+
+    def _publish_redis(self, job_id: str, event: str, increments: Dict[str, int], fields: Dict[str, Any]):
+        """Merge an event into the job's snapshot hash and publish the merged state"""
+        key = _channel(job_id) + SNAPSHOT_SUFFIX
+        update = {name: json.dumps(value) for name, value in fields.items()}
+        update.update(job_id=json.dumps(job_id), event=json.dumps(event), updated_at=json.dumps(time.time()))
+        try:
+            # One transaction, so counters and fields land together and the
+            # state read back includes them
+            pipe = self.redis_client.pipeline(transaction=True)
+            for name, amount in increments.items():
+                pipe.hincrby(key, name, amount)
+            pipe.hset(key, mapping=update)
+            pipe.expire(key, self.snapshot_ttl)
+            pipe.hgetall(key)
+            message = _decode_snapshot(pipe.execute()[-1])
+            self.redis_client.publish(_channel(job_id), json.dumps(message))
+            with self._lock:
+                self.events_published += 1
+        except Exception as e:
+            logger.warning(f"Failed to publish progress for job {job_id}: {e}")
+
+    def reset(self, job_id: str):
+        """Forget a job's published state, e.g. before it is run again"""
+        with self._lock:
+            self._state.pop(job_id, None)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(_channel(job_id) + SNAPSHOT_SUFFIX)
+            except Exception as e:
+                logger.warning(f"Failed to reset progress of job {job_id}: {e}")
+
+    def _deliver(self, job_id: str, message: Dict[str, Any]):
+        """Hand an event to this process's viewers of the job"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                pass  # Viewer's loop already closed
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: Dict[str, Any]):
+        # Every event carries the full state, so a lagging viewer only needs the newest
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    async def get_snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Latest published state of a job, if it has any"""
+        if self.redis_client is not None:
+            try:
+                fields = await self._get_aio_client().hgetall(_channel(job_id) + SNAPSHOT_SUFFIX)
+                return _decode_snapshot(fields) if fields else None
+            except Exception as e:
+                logger.warning(f"Failed to read progress snapshot for job {job_id}: {e}")
+                return None
+        with self._lock:
+            state = self._state.get(job_id)
+            return dict(state) if state else None
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[JobSubscription]:
+        """
+        Watch a job's progress events
+
+        The first event is the job's current state, if it has published any.
+
+        Usage:
+            async with hub.subscribe(job_id) as subscription:
+                event = await subscription.get(timeout=15)
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_buffer)
+        entry = (loop, queue)
+        await self._add_subscriber(job_id, entry)
+        try:
+            # Subscribed before reading the snapshot, so nothing falls in between
+            snapshot = await self.get_snapshot(job_id)
+            if snapshot:
+                self._offer(queue, snapshot)
+            yield JobSubscription(job_id, queue)
+        finally:
+            await self._remove_subscriber(job_id, entry)
+
+    async def _add_subscriber(self, job_id: str, entry):
+        with self._lock:
+            subscribers = self._subscribers.setdefault(job_id, [])
+            subscribers.append(entry)
+            first = len(subscribers) == 1
+        if first and self.redis_client is not None:
+            async with self._get_subscribe_lock():
+                pubsub = self._get_pubsub()
+                await pubsub.subscribe(_channel(job_id))
+                if self._reader_task is None or self._reader_task.done():
+                    self._reader_task = asyncio.get_running_loop().create_task(self._read())
+                self._wakeup.set()
+            logger.debug(f"Subscribed to progress of job {job_id}")
+
+    async def _remove_subscriber(self, job_id: str, entry):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            if entry in subscribers:
+                subscribers.remove(entry)
+            last = not subscribers
+            if last:
+                self._subscribers.pop(job_id, None)
+        if last and self._pubsub is not None:
+            try:
+                async with self._get_subscribe_lock():
+                    with self._lock:
+                        resubscribed = job_id in self._subscribers
+                    if not resubscribed:
+                        await self._pubsub.unsubscribe(_channel(job_id))
+            except Exception as e:
+                logger.warning(f"Failed to unsubscribe from progress of job {job_id}: {e}")
+
+    async def _read(self):
+        """Dispatch messages from the shared pub/sub connection to viewers"""
+        # Checked as well as cancellation: some redis-py versions swallow
+        # CancelledError inside get_message
+        while not self._closing:
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                # Nothing subscribed: park until a viewer subscribes
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job progress subscription error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            job_id = message["channel"][len(CHANNEL_PREFIX):]
+            try:
+                self._deliver(job_id, json.loads(message["data"]))
+            except ValueError:
+                logger.warning(f"Ignoring malformed progress event for job {job_id}")
+
+    def _get_aio_client(self):
+        if self._aio_client is None:
+            self._aio_client = aioredis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1)
+        return self._aio_client
+
+    def _get_pubsub(self):
+        if self._pubsub is None:
+            self._pubsub = self._get_aio_client().pubsub()
+        return self._pubsub
+
+    def _get_subscribe_lock(self) -> asyncio.Lock:
+        if self._subscribe_lock is None:
+            self._subscribe_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+        return self._subscribe_lock
+
+    async def close(self):
+        """Stop the reader and close the subscriber connection"""
+        self._closing = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+        if self._aio_client is not None:
+            await self._aio_client.close()
+            self._aio_client = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Delivery mode and subscription counts for this process"""
+        with self._lock:
+            return {
+                "transport": "redis" if self.redis_client is not None else "local",
+                "jobs_watched": len(self._subscribers),
+                "viewers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "events_published": self.events_published
+            }
+
+
+# Singleton instance
+_job_progress_hub = None
+_job_progress_hub_lock = threading.Lock()
+
+def get_job_progress_hub() -> JobProgressHub:
+    """Get the process-wide job progress hub"""
+    global _job_progress_hub
+    if _job_progress_hub is None:
+        with _job_progress_hub_lock:
+            if _job_progress_hub is None:
+                _job_progress_hub = JobProgressHub()
+    return _job_progress_hub
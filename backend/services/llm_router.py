@@ -7,6 +7,8 @@ import logging
 from fastapi import HTTPException
 from contextlib import asynccontextmanager
 
+from services.token_accounting import TokenAccountant
+
 logger = logging.getLogger(__name__)
 
 # Global clients for connection reuse
@@ -86,7 +88,8 @@ class LLMRouter:
         model: str = "auto",
         temperature: float = 0.7,
         max_tokens: int = 2000,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        usage: Optional[TokenAccountant] = None
     ) -> AsyncIterator[str]:
         """
         Route LLM calls to appropriate provider and stream responses
@@ -97,6 +100,8 @@ class LLMRouter:
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
             system_prompt: Optional system prompt
+            usage: Accountant that receives the streamed tokens and the
+                provider-reported token counts
         
         Yields:
             Token strings as they are generated
@@ -109,13 +114,13 @@ class LLMRouter:
         if model.startswith("gpt"):
             if not self.has_openai:
                 raise HTTPException(503, "OpenAI client not configured")
-            async for token in self._call_openai(prompt, model, temperature, max_tokens, system_prompt):
+            async for token in self._call_openai(prompt, model, temperature, max_tokens, system_prompt, usage):
                 yield token
                 
         elif model.startswith("claude"):
             if not self.has_anthropic:
                 raise HTTPException(503, "Anthropic client not configured")
-            async for token in self._call_anthropic(prompt, model, temperature, max_tokens, system_prompt):
+            async for token in self._call_anthropic(prompt, model, temperature, max_tokens, system_prompt, usage):
                 yield token
         else:
             raise HTTPException(400, f"Unknown model: {model}")
@@ -126,7 +131,8 @@ class LLMRouter:
         model: str,
         temperature: float,
         max_tokens: int,
-        system_prompt: Optional[str]
+        system_prompt: Optional[str],
+        usage: Optional[TokenAccountant] = None
     ) -> AsyncIterator[str]:
         """Call OpenAI API and stream response"""
         try:
@@ -143,12 +149,25 @@ class LLMRouter:
                     messages=messages,
                     temperature=temperature,
                     max_tokens=max_tokens,
-                    stream=True
+                    stream=True,
+                    # Ask for a final chunk with the token usage (passed raw:
+                    # the pinned SDK predates the stream_options argument)
+                    extra_body={"stream_options": {"include_usage": True}}
                 )
                 
                 async for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
+                    reported = getattr(chunk, "usage", None)
+                    if reported and usage is not None:
+                        if isinstance(reported, dict):
+                            usage.record_usage(reported.get("prompt_tokens"), reported.get("completion_tokens"))
+                        else:
+                            usage.record_usage(reported.prompt_tokens, reported.completion_tokens)
+                    # The usage chunk carries no choices
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        token = chunk.choices[0].delta.content
+                        if usage is not None:
+                            usage.add(token)
+                        yield token
                     
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
@@ -160,7 +179,8 @@ class LLMRouter:
         model: str,
         temperature: float,
         max_tokens: int,
-        system_prompt: Optional[str]
+        system_prompt: Optional[str],
+        usage: Optional[TokenAccountant] = None
     ) -> AsyncIterator[str]:
         """Call Anthropic API and stream response"""
         try:
@@ -183,7 +203,14 @@ class LLMRouter:
                 
                 async for chunk in stream:
                     if chunk.type == "content_block_delta":
+                        if usage is not None:
+                            usage.add(chunk.delta.text)
                         yield chunk.delta.text
+                    elif usage is not None and chunk.type == "message_start":
+                        usage.record_usage(input_tokens=chunk.message.usage.input_tokens)
+                    elif usage is not None and chunk.type == "message_delta":
+                        # Cumulative output count, final on the last delta
+                        usage.record_usage(output_tokens=chunk.usage.output_tokens)
                     
         except Exception as e:
             logger.error(f"Anthropic API error: {e}")
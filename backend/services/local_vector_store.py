@@ -0,0 +1,454 @@
+"""
+Embedded vector store for running the RAG path on a single box
+
+Drop-in replacement for PineconeClient when no Pinecone index is available.
+Each namespace lives in its own directory:
+
+- vectors.f32:    row-major float32 matrix of unit-normalized embeddings,
+                  memory-mapped for search so large namespaces load instantly
+- metadata.jsonl: one JSON document per write, only read for returned matches
+- index.tsv:      append-only "id<TAB>row<TAB>offset<TAB>length" log mapping
+                  vector IDs to matrix rows and metadata records (last wins)
+- manifest.json:  embedding dimension
+
+Writes append to these files instead of rewriting the namespace, and
+similarity search is a single vectorized cosine top-k over the matrix.
+The store is safe for concurrent use within one process; it is not meant to
+be written by several processes at once.
+"""
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import logging
+import threading
+import time
+from typing import List, Dict, Optional, Tuple, Any
+
+import numpy as np
+
+from .pinecone_client import UpsertReport
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+INDEX_FILE = "index.tsv"
+MANIFEST_FILE = "manifest.json"
+
+
+class _Namespace:
+    """In-memory view of one namespace directory"""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.row_count = 0
+        self.ids: List[Optional[str]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.meta_offsets = np.zeros(0, dtype=np.int64)
+        self.meta_lengths = np.zeros(0, dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix: Optional[np.ndarray] = None
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live.sum())
+
+    def _grow(self, rows: int):
+        """Grow per-row bookkeeping arrays to hold at least `rows` rows"""
+        if rows <= len(self.live):
+            return
+        capacity = max(rows, len(self.live) * 2, 1024)
+        extra = capacity - len(self.live)
+        self.meta_offsets = np.concatenate([self.meta_offsets, np.zeros(extra, dtype=np.int64)])
+        self.meta_lengths = np.concatenate([self.meta_lengths, np.zeros(extra, dtype=np.int64)])
+        self.live = np.concatenate([self.live, np.zeros(extra, dtype=bool)])
+        self.ids.extend([None] * extra)
+
+    def apply_index_entry(self, vec_id: str, row: int, offset: int, length: int):
+        """Apply one index.tsv entry; offset -1 marks a deleted vector"""
+        self._grow(row + 1)
+        self.row_count = max(self.row_count, row + 1)
+        if offset < 0:
+            self.live[row] = False
+            self.id_to_row.pop(vec_id, None)
+            return
+        self.ids[row] = vec_id
+        self.id_to_row[vec_id] = row
+        self.meta_offsets[row] = offset
+        self.meta_lengths[row] = length
+        self.live[row] = True
+
+    def remap(self):
+        """Re-open the memory map after the vectors file has changed"""
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        rows = size // (self.dim * 4)
+        if rows == 0:
+            self.matrix = None
+            return
+        self.matrix = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def read_metadata(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Read metadata records for the given rows"""
+        results = []
+        with open(os.path.join(self.path, METADATA_FILE), "rb") as f:
+            for row in rows:
+                f.seek(int(self.meta_offsets[row]))
+                raw = f.read(int(self.meta_lengths[row]))
+                results.append(json.loads(raw))
+        return results
+
+
+class LocalVectorStore:
+    """Memory-mapped, in-process implementation of the PineconeClient interface"""
+
+    def __init__(self, base_path: Optional[str] = None):
+        self.base_path = base_path or os.getenv("LOCAL_VECTOR_STORE_PATH", "local_vectors")
+        self.index_name = "clone-advisor"
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+        os.makedirs(self.base_path, exist_ok=True)
+        logger.info(f"Using LocalVectorStore at {os.path.abspath(self.base_path)}")
+
+    def _namespace_path(self, namespace: str) -> str:
+        safe_name = namespace.replace(os.sep, "_")
+        return os.path.join(self.base_path, safe_name)
+
+    def _load_namespace(self, namespace: str) -> Optional[_Namespace]:
+        """Load a namespace from disk, or return the cached view"""
+        if namespace in self._namespaces:
+            return self._namespaces[namespace]
+
+        path = self._namespace_path(namespace)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+        ns = _Namespace(path, manifest["dim"])
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        continue  # Torn write at the end of the log
+                    ns.apply_index_entry(parts[0], int(parts[1]), int(parts[2]), int(parts[3]))
+        ns.remap()
+
+        self._namespaces[namespace] = ns
+        logger.info(f"Loaded namespace {namespace} with {ns.live_count} vectors")
+        return ns
+
+    def _create_namespace(self, namespace: str, dim: int) -> _Namespace:
+        path = self._namespace_path(namespace)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump({"dim": dim}, f)
+        ns = _Namespace(path, dim)
+        self._namespaces[namespace] = ns
+        return ns
+
+    def _upsert_sync(
+        self,
+        namespace: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        ids: List[str]
+    ) -> int:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError("Embeddings must be a list of equal-length vectors")
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+
+        with self._lock:
+            ns = self._load_namespace(namespace) or self._create_namespace(namespace, matrix.shape[1])
+            if matrix.shape[1] != ns.dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} does not match namespace dimension {ns.dim}"
+                )
+
+            vectors_path = os.path.join(ns.path, VECTORS_FILE)
+            metadata_path = os.path.join(ns.path, METADATA_FILE)
+            index_path = os.path.join(ns.path, INDEX_FILE)
+
+            # Existing IDs are overwritten in place, new IDs are appended
+            rows = []
+            new_rows: Dict[str, int] = {}
+            next_row = ns.row_count
+            for vec_id in ids:
+                row = ns.id_to_row.get(vec_id, new_rows.get(vec_id))
+                if row is None:
+                    row = next_row
+                    new_rows[vec_id] = row
+                    next_row += 1
+                rows.append(row)
+
+            with open(vectors_path, "ab"):
+                pass  # Make sure the file exists before opening it for update
+            with open(vectors_path, "r+b") as f:
+                for row, vector in zip(rows, matrix):
+                    f.seek(row * ns.dim * 4)
+                    f.write(vector.tobytes())
+
+            index_lines = []
+            with open(metadata_path, "ab") as f:
+                offset = f.tell()
+                for vec_id, row, meta in zip(ids, rows, metadata):
+                    record = json.dumps(meta or {}, default=str).encode("utf-8")
+                    f.write(record + b"\n")
+                    index_lines.append((vec_id, row, offset, len(record)))
+                    offset += len(record) + 1
+
+            with open(index_path, "a") as f:
+                f.writelines(f"{vec_id}\t{row}\t{off}\t{length}\n" for vec_id, row, off, length in index_lines)
+
+            for vec_id, row, off, length in index_lines:
+                ns.apply_index_entry(vec_id, row, off, length)
+            ns.remap()
+
+        return len(ids)
+
+    async def upsert_vectors(
+        self,
+        namespace: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        Upsert vectors into a local namespace
+
+        Args:
+            namespace: Namespace for the persona
+            embeddings: List of embedding vectors
+            metadata: List of metadata dicts corresponding to each embedding
+            ids: Optional list of IDs. If not provided, will generate.
+
+        Returns:
+            Dict with upsert statistics
+        """
+        if not embeddings:
+            return {"upserted_count": 0}
+
+        if len(embeddings) != len(metadata):
+            raise ValueError("Number of embeddings must match number of metadata entries")
+
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in range(len(embeddings))]
+
+        upserted = await asyncio.to_thread(self._upsert_sync, namespace, embeddings, metadata, ids)
+        logger.info(f"Upserted {upserted} vectors to local namespace {namespace}")
+        return {"upserted_count": upserted}
+
+    async def bulk_upsert(
+        self,
+        namespace: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, Any]],
+        ids: Optional[List[str]] = None
+    ) -> UpsertReport:
+        """
+        Upsert vectors and report the outcome, like PineconeClient.bulk_upsert
+
+        The local store writes everything in one append, so there is a
+        single batch and no retries.
+        """
+        report = UpsertReport(requested=len(embeddings))
+        if not embeddings:
+            return report
+        start = time.perf_counter()
+        report.batches = 1
+        try:
+            report.upserted = (await self.upsert_vectors(namespace, embeddings, metadata, ids))["upserted_count"]
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error upserting to local namespace {namespace}: {e}")
+            report.failed_batches = 1
+            report.failed_ids = list(ids) if ids else []
+            report.errors.append(str(e))
+        report.elapsed_seconds = time.perf_counter() - start
+        return report
+
+    def _search_sync(
+        self,
+        namespace: str,
+        query_embedding: List[float],
+        k: int,
+        filter: Optional[Dict],
+        include_values: bool = False
+    ) -> List[Dict]:
+        with self._lock:
+            ns = self._load_namespace(namespace)
+            if ns is None or ns.matrix is None or ns.live_count == 0:
+                return []
+            matrix = ns.matrix
+            live = ns.live[:matrix.shape[0]].copy()
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (ns.dim,):
+            raise ValueError(f"Query dimension {query.shape[0]} does not match namespace dimension {ns.dim}")
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        scores = matrix @ query
+        scores[~live] = -np.inf
+
+        if filter:
+            candidate_rows = np.flatnonzero(live)
+            candidate_meta = ns.read_metadata(candidate_rows.tolist())
+            for row, meta in zip(candidate_rows, candidate_meta):
+                if not _matches_filter(meta, filter):
+                    scores[row] = -np.inf
+
+        valid = int(np.isfinite(scores).sum())
+        k = min(k, valid)
+        if k <= 0:
+            return []
+
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        metadata = ns.read_metadata(top.tolist())
+        results = [
+            {"id": ns.ids[row], "score": float(scores[row]), "metadata": meta}
+            for row, meta in zip(top, metadata)
+        ]
+        if include_values:
+            for result, row in zip(results, top):
+                result["values"] = matrix[row].tolist()
+        return results
+
+    async def similarity_search(
+        self,
+        namespace: str,
+        query_embedding: List[float],
+        k: int = 6,
+        filter: Optional[Dict] = None,
+        include_values: bool = False
+    ) -> List[Dict]:
+        """
+        Cosine similarity search over a local namespace
+
+        Args:
+            namespace: Namespace to search in
+            query_embedding: Query vector
+            k: Number of results to return
+            filter: Optional metadata filter (Pinecone-style $eq/$ne/$in/$nin)
+            include_values: Also return each match's (unit-normalized) vector as "values"
+
+        Returns:
+            List of results with scores and metadata
+        """
+        results = await asyncio.to_thread(self._search_sync, namespace, query_embedding, k, filter, include_values)
+        logger.info(f"Found {len(results)} matches in local namespace {namespace}")
+        return results
+
+    async def check_namespace_exists(self, namespace: str) -> Tuple[bool, int]:
+        """
+        Check if a namespace exists and return vector count
+
+        Args:
+            namespace: Namespace to check
+
+        Returns:
+            Tuple of (exists: bool, vector_count: int)
+        """
+        with self._lock:
+            ns = self._load_namespace(namespace)
+            vector_count = ns.live_count if ns else 0
+        return vector_count > 0, vector_count
+
+    def _delete_sync(self, namespace: str, ids: List[str]) -> int:
+        with self._lock:
+            ns = self._load_namespace(namespace)
+            if ns is None:
+                return 0
+            entries = [(vec_id, ns.id_to_row[vec_id]) for vec_id in dict.fromkeys(ids) if vec_id in ns.id_to_row]
+            if not entries:
+                return 0
+            with open(os.path.join(ns.path, INDEX_FILE), "a") as f:
+                f.writelines(f"{vec_id}\t{row}\t-1\t0\n" for vec_id, row in entries)
+            for vec_id, row in entries:
+                ns.apply_index_entry(vec_id, row, -1, 0)
+        return len(entries)
+
+    async def delete_vectors(self, namespace: str, ids: List[str]) -> int:
+        """
+        Delete vectors by ID
+
+        Args:
+            namespace: Namespace holding the vectors
+            ids: Vector IDs to delete (unknown IDs are ignored)
+
+        Returns:
+            Number of vectors deleted
+        """
+        if not ids:
+            return 0
+        deleted = await asyncio.to_thread(self._delete_sync, namespace, ids)
+        logger.info(f"Deleted {deleted} vectors from local namespace {namespace}")
+        return deleted
+
+    async def delete_namespace(self, namespace: str) -> bool:
+        """
+        Delete all vectors in a namespace
+
+        Args:
+            namespace: Namespace to delete
+
+        Returns:
+            True if successful
+        """
+        try:
+            with self._lock:
+                self._namespaces.pop(namespace, None)
+                path = self._namespace_path(namespace)
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+            logger.info(f"Deleted local namespace {namespace}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting local namespace {namespace}: {e}")
+            return False
+
+
+def _matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a subset of Pinecone's metadata filter language"""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, expected in condition.items():
+            if op == "$eq" and not (value == expected or (isinstance(value, list) and expected in value)):
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and not (value in expected or (isinstance(value, list) and set(value) & set(expected))):
+                return False
+            if op == "$nin" and value in expected:
+                return False
+    return True
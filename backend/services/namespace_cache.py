@@ -0,0 +1,216 @@
+"""
+Namespace readiness cache for the vector store
+
+Chat, RAG and persona detail requests only need to know whether a persona's
+namespace has vectors. Answering that with describe_index_stats() costs a
+full index-wide remote call per request, so vector counts are cached here
+instead: writes update the cache directly, and the whole table is refreshed
+in the background once it is older than the TTL. A Redis hash shares counts
+between the API and ingestion workers when Redis is available; its calls run
+in a worker thread so they never block the event loop (the cache is used
+from the API loop and from workers that start a loop per task).
+"""
+
+import asyncio
+import os
+import time
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_COUNTS_KEY = "vector_namespaces:counts"
+
+
+class NamespaceCache:
+    """
+    In-process cache of namespace -> vector count with TTL refresh
+
+    Reads never wait on the vector store once the cache has been loaded:
+    stale entries are served while a single background refresh runs.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Awaitable[Dict[str, int]]],
+        ttl_seconds: Optional[float] = None,
+        write_grace_seconds: Optional[float] = None
+    ):
+        """
+        Args:
+            loader: Coroutine function returning {namespace: vector_count} for the whole index
+            ttl_seconds: Age after which counts are refreshed in the background
+            write_grace_seconds: How long a local write wins over a lower refreshed count
+                (index stats are eventually consistent right after an upsert)
+        """
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("NAMESPACE_CACHE_TTL_SECONDS", "60")
+        )
+        self.write_grace_seconds = write_grace_seconds if write_grace_seconds is not None else float(
+            os.getenv("NAMESPACE_CACHE_WRITE_GRACE_SECONDS", "30")
+        )
+
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._recent_writes: Dict[str, float] = {}
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        self._background_tasks = set()
+
+        self.redis_client = None
+        if os.getenv("NAMESPACE_CACHE_REDIS", "true").lower() == "true":
+            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            try:
+                client = redis.from_url(redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=2)
+                client.ping()
+                self.redis_client = client
+                logger.info("Namespace cache shared via Redis")
+            except Exception as e:
+                logger.info(f"Redis not available, namespace cache is process-local: {e}")
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._refreshed_at > self.ttl_seconds
+
+    async def get_count(self, namespace: str) -> int:
+        """
+        Get the cached vector count for a namespace
+
+        Only the very first call (cold cache) waits for the loader; after that
+        stale data is returned immediately and refreshed in the background.
+
+        Args:
+            namespace: Namespace to look up
+
+        Returns:
+            Vector count (0 if the namespace is unknown)
+        """
+        if self._refreshed_at == 0.0:
+            await self.refresh()
+        elif self.is_stale:
+            self._schedule_refresh()
+
+        with self._lock:
+            count = self._counts.get(namespace, 0)
+
+        if count == 0 and self.redis_client is not None:
+            # Another process may have written the namespace since our last refresh
+            count = await asyncio.to_thread(self._redis_get, namespace)
+            if count:
+                with self._lock:
+                    self._counts[namespace] = count
+
+        return count
+
+    async def refresh(self):
+        """Reload all namespace counts from the vector store"""
+        with self._lock:
+            self._refreshing = True
+        try:
+            counts = await self.loader()
+        except Exception as e:
+            logger.error(f"Namespace cache refresh failed: {e}")
+            with self._lock:
+                self._refreshing = False
+                # Back off for a full TTL instead of retrying on every request
+                self._refreshed_at = time.monotonic()
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            for namespace, written_at in list(self._recent_writes.items()):
+                if now - written_at > self.write_grace_seconds:
+                    del self._recent_writes[namespace]
+                elif counts.get(namespace, 0) < self._counts.get(namespace, 0):
+                    counts[namespace] = self._counts[namespace]
+            self._counts = counts
+            self._refreshed_at = now
+            self._refreshing = False
+
+        await asyncio.to_thread(self._redis_store, counts)
+        logger.debug(f"Namespace cache refreshed ({len(counts)} namespaces)")
+
+    def _schedule_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        task = asyncio.get_running_loop().create_task(self.refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def record_upsert(self, namespace: str, upserted_count: int):
+        """
+        Note vectors written to a namespace
+
+        Upserts may overwrite existing IDs, so the running total is an upper
+        bound until the next refresh replaces it with the exact count.
+        """
+        if upserted_count <= 0:
+            return
+        with self._lock:
+            self._counts[namespace] = self._counts.get(namespace, 0) + upserted_count
+            self._recent_writes[namespace] = time.monotonic()
+        if self.redis_client is not None:
+            await asyncio.to_thread(self._redis_update, self.redis_client.hincrby, namespace, upserted_count)
+
+    async def record_vector_delete(self, namespace: str, deleted_count: int):
+        """
+        Note vectors deleted from a namespace
+
+        The count is lowered right away and the next read triggers a
+        background refresh: IDs the store did not hold are counted as
+        deleted too, so the exact count replaces the estimate.
+        """
+        if deleted_count <= 0:
+            return
+        with self._lock:
+            self._counts[namespace] = max(self._counts.get(namespace, 0) - deleted_count, 0)
+            self._recent_writes.pop(namespace, None)
+            if self._refreshed_at:
+                self._refreshed_at = min(self._refreshed_at, time.monotonic() - self.ttl_seconds - 1)
+        if self.redis_client is not None:
+            await asyncio.to_thread(self._redis_update, self._redis_decrement, namespace, deleted_count)
+
+    async def record_delete(self, namespace: str):
+        """Forget a namespace whose vectors were all deleted"""
+        with self._lock:
+            self._counts.pop(namespace, None)
+            self._recent_writes.pop(namespace, None)
+        if self.redis_client is not None:
+            await asyncio.to_thread(self._redis_update, self.redis_client.hdel, namespace)
+
+    def _redis_update(self, command, namespace: str, *args):
+        try:
+            command(REDIS_COUNTS_KEY, namespace, *args)
+        except Exception as e:
+            logger.warning(f"Namespace cache Redis update failed: {e}")
+
+    def _redis_decrement(self, key: str, namespace: str, amount: int):
+        if self.redis_client.hincrby(key, namespace, -amount) < 0:
+            self.redis_client.hset(key, namespace, 0)
+
+    def _redis_get(self, namespace: str) -> int:
+        try:
+            value = self.redis_client.hget(REDIS_COUNTS_KEY, namespace)
+            return int(value) if value else 0
+        except Exception as e:
+            logger.warning(f"Namespace cache Redis lookup failed: {e}")
+            return 0
+
+    def _redis_store(self, counts: Dict[str, int]):
+        if self.redis_client is None:
+            return
+        if not counts:
+            return
+        try:
+            # Overwrite rather than replace the hash: namespaces written by other
+            # processes may not show up in index stats yet. Deletions are
+            # propagated explicitly by record_delete.
+            self.redis_client.hset(REDIS_COUNTS_KEY, mapping=counts)
+        except Exception as e:
+            logger.warning(f"Namespace cache Redis refresh failed: {e}")
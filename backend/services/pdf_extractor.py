@@ -0,0 +1,134 @@
+"""
+Streaming, process-parallel PDF text extraction
+
+pypdf's extract_text() is pure-Python and CPU-bound. Small PDFs are read page
+by page in the calling thread; large ones are split into page ranges that
+run on a shared process pool so every core is used. Either way pages are
+yielded one at a time and in order, so callers can feed them straight into
+the chunker without building the whole document in memory.
+"""
+
+import os
+import mmap
+import math
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Iterator, List, Optional
+
+import pypdf
+
+logger = logging.getLogger(__name__)
+
+# PDFs with at least this many pages are extracted on the process pool
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Shared process pool, recreated after a fork (e.g. in RQ work horses)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn, not fork: the callers are multi-threaded processes
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the worker processes, if they were started"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Worker: extract text of pages [start, end) from the PDF at path"""
+    reader = pypdf.PdfReader(path)
+    return [reader.pages[number].extract_text() or "" for number in range(start, end)]
+
+
+def iter_pdf_pages(content: bytes, path: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the text of each page of a PDF, in order
+
+    Args:
+        content: Raw PDF bytes, or a read-only mmap of the file
+        path: File holding the same bytes, if any; workers read it directly
+
+    Yields:
+        Page text ("" for pages without extractable text)
+
+    Raises:
+        ValueError: If the PDF cannot be read
+    """
+    try:
+        # pypdf reads an mmap in place; other buffers get a stream wrapper
+        reader = pypdf.PdfReader(content if isinstance(content, mmap.mmap) else BytesIO(content))
+        page_count = len(reader.pages)
+    except Exception as e:
+        logger.error(f"PDF processing error: {e}")
+        raise ValueError(f"Failed to process PDF: {str(e)}")
+
+    if page_count < PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    del reader
+    yield from _iter_pages_parallel(content, page_count, path)
+
+
+def _iter_pages_parallel(content: bytes, page_count: int, path: Optional[str]) -> Iterator[str]:
+    # Workers read the PDF from a file instead of receiving the bytes per task
+    temp_path = None
+    if path is None:
+        handle, temp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(handle, "wb") as f:
+            f.write(content)
+        path = temp_path
+    try:
+        # Several ranges per worker balances uneven pages; the in-flight window
+        # bounds how much extracted text waits to be consumed
+        range_size = max(4, math.ceil(page_count / (PDF_WORKERS * 4)))
+        ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+        max_in_flight = PDF_WORKERS * 2
+        logger.info(f"Extracting {page_count} PDF pages in {len(ranges)} ranges on {PDF_WORKERS} processes")
+
+        pool = _get_pool()
+        pending = deque()
+        next_range = 0
+        try:
+            while next_range < len(ranges) or pending:
+                while next_range < len(ranges) and len(pending) < max_in_flight:
+                    start, end = ranges[next_range]
+                    pending.append(pool.submit(_extract_page_range, path, start, end))
+                    next_range += 1
+                for page_text in pending.popleft().result():
+                    yield page_text
+        except Exception as e:
+            logger.error(f"PDF processing error: {e}")
+            raise ValueError(f"Failed to process PDF: {str(e)}")
+        finally:
+            for future in pending:
+                future.cancel()
+    finally:
+        if temp_path is not None:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
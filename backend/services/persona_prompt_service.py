@@ -13,6 +13,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func, update
 from models import PromptVersion, PromptLayer, PersonaSettings, Persona
 from services.async_prompt_version_service import AsyncPromptVersionService
+from services.prompt_cache import get_prompt_cache
 import uuid
 from datetime import datetime
 import json
@@ -83,7 +84,14 @@ class PersonaPromptService:
         persona_id: str,
         db: AsyncSession
     ) -> Dict[str, str]:
-        """Get all active prompts for a persona"""
+        """Get all active prompts for a persona (cached until one of its versions is activated)"""
+        
+        prompt_cache = get_prompt_cache()
+        # Read before querying, so prompts changed meanwhile are cached as stale
+        cache_version = await prompt_cache.version(persona_id)
+        cached = prompt_cache.get(persona_id, cache_version)
+        if cached is not None:
+            return cached
         
         active_prompts = {}
         
@@ -101,6 +109,7 @@ class PersonaPromptService:
                 # Fallback to default prompts if no persona-specific prompt exists
                 active_prompts[layer.value] = await self._get_fallback_prompt(layer)
         
+        prompt_cache.put(persona_id, cache_version, active_prompts)
         return active_prompts
     
     async def create_prompt_version(
@@ -1,12 +1,101 @@
 import os
+import json
+import time
+import asyncio
+import functools
 import pinecone
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import AsyncRetrying, retry, stop_after_attempt, wait_exponential
+
+from .namespace_cache import NamespaceCache
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on the serialized size of one float (and its separator) in an upsert request
+_FLOAT_BYTES = 24
+# Per-vector overhead of the request envelope ("id", "values", "metadata", ...)
+_VECTOR_OVERHEAD_BYTES = 64
+
+
+@dataclass
+class UpsertReport:
+    """Outcome of a bulk upsert"""
+    requested: int = 0
+    upserted: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    retries: int = 0  # Extra attempts across all batches
+    failed_ids: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed_ids
+
+    def as_dict(self) -> Dict[str, any]:
+        return {
+            "requested": self.requested,
+            "upserted": self.upserted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "retries": self.retries,
+            "failed_ids": len(self.failed_ids),
+            "elapsed_seconds": round(self.elapsed_seconds, 3)
+        }
+
+
+class UpsertError(Exception):
+    """Raised when some batches of an upsert failed after their retries"""
+
+    def __init__(self, report: UpsertReport):
+        super().__init__(
+            f"{report.failed_batches} of {report.batches} upsert batches failed "
+            f"({len(report.failed_ids)} vectors): {report.errors[0] if report.errors else 'unknown error'}"
+        )
+        self.report = report
+
+
+def build_upsert_batches(vectors: List[Dict], max_bytes: int, max_vectors: int) -> List[List[Dict]]:
+    """
+    Split vectors into request-sized batches
+
+    Batches close when the estimated request payload would exceed max_bytes
+    or the batch reaches max_vectors, so metadata-heavy chunks get smaller
+    batches instead of oversized requests.
+    """
+    batches: List[List[Dict]] = []
+    batch: List[Dict] = []
+    batch_bytes = 0
+    for vector in vectors:
+        size = (
+            len(vector["values"]) * _FLOAT_BYTES
+            + len(json.dumps(vector["metadata"], default=str))
+            + len(vector["id"])
+            + _VECTOR_OVERHEAD_BYTES
+        )
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_vectors):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
 class PineconeClient:
+    """
+    Async facade over the synchronous Pinecone SDK
+
+    Every SDK call runs on a dedicated, bounded thread pool so that network
+    round trips never block the event loop. The pool size caps concurrent
+    requests per process, the underlying urllib3 connection pool is shared
+    across calls, and each request carries its own timeout.
+    """
+
     def __init__(self):
         # Initialize Pinecone
         api_key = os.getenv("PINECONE_API_KEY")
@@ -16,20 +105,36 @@ class PineconeClient:
         if not api_key:
             raise ValueError("PINECONE_API_KEY not found in environment variables")
         
+        # Concurrency and timeout limits for calls made from the event loop
+        self.max_concurrency = int(os.getenv("PINECONE_MAX_CONCURRENCY", "8"))
+        self.request_timeout = float(os.getenv("PINECONE_REQUEST_TIMEOUT_SECONDS", "10"))
+        # Bulk upserts: request size limits, batches in flight and attempts per batch
+        self.upsert_max_bytes = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", str(2 * 1024 * 1024 - 64 * 1024)))
+        self.upsert_max_vectors = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", "1000"))
+        self.upsert_concurrency = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", str(self.max_concurrency)))
+        self.upsert_attempts = int(os.getenv("PINECONE_UPSERT_ATTEMPTS", "3"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="pinecone"
+        )
+        
         # Initialize Pinecone with new API
-        self.pc = pinecone.Pinecone(api_key=api_key)
+        self.pc = pinecone.Pinecone(api_key=api_key, pool_threads=self.max_concurrency)
         
         # Index name for the clone advisor
         self.index_name = "clone-advisor"
         
         # Check if index exists, create if not
         try:
-            self.index = self.pc.Index(self.index_name)
+            self.index = self.pc.Index(self.index_name, pool_threads=self.max_concurrency)
             logger.info(f"Connected to existing Pinecone index: {self.index_name}")
         except Exception as e:
             logger.warning(f"Index {self.index_name} not found, creating...")
             self._create_index()
-            self.index = self.pc.Index(self.index_name)
+            self.index = self.pc.Index(self.index_name, pool_threads=self.max_concurrency)
+        
+        # Namespace vector counts, so readiness checks skip describe_index_stats
+        self.namespace_cache = NamespaceCache(self._load_namespace_counts)
     
     def _create_index(self):
         """Create Pinecone index with appropriate settings"""
@@ -48,7 +153,29 @@ class PineconeClient:
             logger.error(f"Error creating index: {e}")
             raise
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    async def _call(self, func, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Run a blocking SDK call on the client's thread pool
+        
+        Args:
+            func: Bound SDK method, e.g. self.index.query
+            timeout: Per-call timeout in seconds (defaults to PINECONE_REQUEST_TIMEOUT_SECONDS)
+        
+        Returns:
+            The SDK call's return value
+        """
+        timeout = timeout or self.request_timeout
+        kwargs["_request_timeout"] = timeout
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        # The HTTP request itself is bounded by _request_timeout; the extra
+        # headroom covers time spent waiting for a free pool thread.
+        return await asyncio.wait_for(future, timeout=timeout * 2)
+    
+    def close(self):
+        """Release the client's worker threads"""
+        self._executor.shutdown(wait=False)
+    
     async def upsert_vectors(
         self,
         namespace: str,
@@ -67,9 +194,44 @@ class PineconeClient:
         
         Returns:
             Dict with upsert statistics
+        
+        Raises:
+            UpsertError: If any batch still failed after its retries
+        """
+        report = await self.bulk_upsert(namespace, embeddings, metadata, ids)
+        if not report.ok:
+            raise UpsertError(report)
+        return {"upserted_count": report.upserted}
+    
+    async def bulk_upsert(
+        self,
+        namespace: str,
+        embeddings: List[List[float]],
+        metadata: List[Dict[str, any]],
+        ids: Optional[List[str]] = None
+    ) -> UpsertReport:
         """
+        Upsert any number of vectors in concurrent, individually retried batches
+        
+        Batches are sized by estimated request payload
+        (PINECONE_UPSERT_MAX_BYTES, PINECONE_UPSERT_MAX_VECTORS) and up to
+        PINECONE_UPSERT_CONCURRENCY are in flight at once. A failed batch is
+        retried on its own (PINECONE_UPSERT_ATTEMPTS) without resending the
+        others; batches that still fail are listed in the report rather than
+        raised, and the rest of the upsert completes.
+        
+        Args:
+            namespace: Namespace for the persona
+            embeddings: List of embedding vectors
+            metadata: List of metadata dicts corresponding to each embedding
+            ids: Optional list of IDs. If not provided, will generate.
+        
+        Returns:
+            UpsertReport with counts, retries and the IDs that were not stored
+        """
+        report = UpsertReport(requested=len(embeddings))
         if not embeddings:
-            return {"upserted_count": 0}
+            return report
         
         if len(embeddings) != len(metadata):
             raise ValueError("Number of embeddings must match number of metadata entries")
@@ -78,30 +240,44 @@ class PineconeClient:
         if ids is None:
             ids = [f"{namespace}_{i}" for i in range(len(embeddings))]
         
-        # Prepare vectors for upsert
-        vectors = []
-        for i, (embedding, meta, vec_id) in enumerate(zip(embeddings, metadata, ids)):
-            vectors.append({
-                "id": vec_id,
-                "values": embedding,
-                "metadata": meta
-            })
-        
-        # Upsert in batches
-        batch_size = 100
-        total_upserted = 0
-        
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            try:
-                response = self.index.upsert(vectors=batch, namespace=namespace)
-                total_upserted += response.upserted_count
-            except Exception as e:
-                logger.error(f"Error upserting batch {i//batch_size}: {e}")
-                raise
-        
-        logger.info(f"Upserted {total_upserted} vectors to namespace {namespace}")
-        return {"upserted_count": total_upserted}
+        vectors = [
+            {"id": vec_id, "values": embedding, "metadata": meta}
+            for embedding, meta, vec_id in zip(embeddings, metadata, ids)
+        ]
+        batches = build_upsert_batches(vectors, self.upsert_max_bytes, self.upsert_max_vectors)
+        report.batches = len(batches)
+        semaphore = asyncio.Semaphore(self.upsert_concurrency)
+        start = time.perf_counter()
+        
+        async def upsert_batch(number: int, batch: List[Dict]):
+            async with semaphore:
+                try:
+                    async for attempt in AsyncRetrying(
+                        stop=stop_after_attempt(self.upsert_attempts),
+                        wait=wait_exponential(multiplier=1, min=1, max=10),
+                        reraise=True
+                    ):
+                        with attempt:
+                            if attempt.retry_state.attempt_number > 1:
+                                report.retries += 1
+                            response = await self._call(self.index.upsert, vectors=batch, namespace=namespace)
+                    report.upserted += response.upserted_count
+                except Exception as e:
+                    logger.error(f"Error upserting batch {number} ({len(batch)} vectors) to {namespace}: {e}")
+                    report.failed_batches += 1
+                    report.failed_ids.extend(vector["id"] for vector in batch)
+                    report.errors.append(str(e))
+        
+        await asyncio.gather(*(upsert_batch(number, batch) for number, batch in enumerate(batches)))
+        report.elapsed_seconds = time.perf_counter() - start
+        
+        await self.namespace_cache.record_upsert(namespace, report.upserted)
+        logger.info(
+            f"Upserted {report.upserted} of {report.requested} vectors to namespace {namespace} "
+            f"in {report.batches} batches ({report.retries} retries, {report.failed_batches} failed) "
+            f"in {report.elapsed_seconds:.2f}s"
+        )
+        return report
     
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def similarity_search(
@@ -109,7 +285,8 @@ class PineconeClient:
         namespace: str,
         query_embedding: List[float],
         k: int = 6,
-        filter: Optional[Dict] = None
+        filter: Optional[Dict] = None,
+        include_values: bool = False
     ) -> List[Dict]:
         """
         Search for similar vectors in Pinecone
@@ -119,26 +296,32 @@ class PineconeClient:
             query_embedding: Query vector
             k: Number of results to return
             filter: Optional metadata filter
+            include_values: Also return each match's vector (as "values")
         
         Returns:
             List of results with scores and metadata
         """
         try:
-            response = self.index.query(
+            response = await self._call(
+                self.index.query,
                 namespace=namespace,
                 vector=query_embedding,
                 top_k=k,
                 include_metadata=True,
+                include_values=include_values,
                 filter=filter
             )
             
             results = []
             for match in response.matches:
-                results.append({
+                result = {
                     "id": match.id,
                     "score": match.score,
                     "metadata": match.metadata
-                })
+                }
+                if include_values:
+                    result["values"] = match.values
+                results.append(result)
             
             logger.info(f"Found {len(results)} matches in namespace {namespace}")
             return results
@@ -158,18 +341,42 @@ class PineconeClient:
             Tuple of (exists: bool, vector_count: int)
         """
         try:
-            stats = self.index.describe_index_stats()
-            namespaces = stats.get('namespaces', {})
-            
-            if namespace in namespaces:
-                vector_count = namespaces[namespace].get('vector_count', 0)
-                return True, vector_count
-            return False, 0
+            vector_count = await self.namespace_cache.get_count(namespace)
+            return vector_count > 0, vector_count
             
         except Exception as e:
             logger.error(f"Error checking namespace {namespace}: {e}")
             return False, 0
     
+    async def _load_namespace_counts(self) -> Dict[str, int]:
+        """Fetch vector counts for every namespace in the index"""
+        stats = await self._call(self.index.describe_index_stats)
+        namespaces = stats.get('namespaces', {})
+        return {
+            name: info.get('vector_count', 0)
+            for name, info in namespaces.items()
+        }
+    
+    async def delete_vectors(self, namespace: str, ids: List[str]) -> int:
+        """
+        Delete vectors by ID
+        
+        Args:
+            namespace: Namespace holding the vectors
+            ids: Vector IDs to delete (unknown IDs are ignored by Pinecone)
+        
+        Returns:
+            Number of IDs submitted for deletion
+        """
+        # Pinecone accepts at most 1000 IDs per delete request
+        batch_size = 1000
+        for i in range(0, len(ids), batch_size):
+            await self._call(self.index.delete, ids=ids[i:i + batch_size], namespace=namespace)
+        await self.namespace_cache.record_vector_delete(namespace, len(ids))
+        if ids:
+            logger.info(f"Deleted {len(ids)} vectors from namespace {namespace}")
+        return len(ids)
+    
     async def delete_namespace(self, namespace: str) -> bool:
         """
         Delete all vectors in a namespace
@@ -181,7 +388,8 @@ class PineconeClient:
             True if successful
         """
         try:
-            self.index.delete(delete_all=True, namespace=namespace)
+            await self._call(self.index.delete, delete_all=True, namespace=namespace)
+            await self.namespace_cache.record_delete(namespace)
             logger.info(f"Deleted namespace {namespace}")
             return True
         except Exception as e:
@@ -192,14 +400,31 @@ class PineconeClient:
 _pinecone_client = None
 
 def get_pinecone_client() -> PineconeClient:
-    """Get singleton Pinecone client instance"""
+    """
+    Get singleton vector store client instance
+
+    VECTOR_BACKEND=local selects the embedded LocalVectorStore explicitly;
+    otherwise Pinecone is used, falling back to the local store when it
+    cannot be initialized.
+    """
     global _pinecone_client
     if _pinecone_client is None:
+        if os.getenv("VECTOR_BACKEND", "pinecone").lower() == "local":
+            from .local_vector_store import LocalVectorStore
+            _pinecone_client = LocalVectorStore()
+            return _pinecone_client
         try:
             _pinecone_client = PineconeClient()
         except Exception as e:
             logger.error(f"Failed to initialize real Pinecone client: {e}")
-            logger.warning("Falling back to MockPineconeClient for testing")
-            from .mock_pinecone_client import MockPineconeClient
-            _pinecone_client = MockPineconeClient()
+            logger.warning("Falling back to LocalVectorStore")
+            from .local_vector_store import LocalVectorStore
+            _pinecone_client = LocalVectorStore()
     return _pinecone_client
+
+def close_pinecone_client():
+    """Release resources held by the singleton client, if one was created"""
+    global _pinecone_client
+    if _pinecone_client is not None and hasattr(_pinecone_client, "close"):
+        _pinecone_client.close()
+    _pinecone_client = None
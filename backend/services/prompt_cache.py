@@ -0,0 +1,174 @@
+"""
+Active prompt and compiled template cache
+
+Every chat turn needs the persona's active system, RAG and user prompts,
+which only change when a prompt version is activated (creating a version
+through the API activates it). The cache keeps each persona's active prompts
+in process, tagged with the persona's prompt version: a counter in Redis
+that activating a version increments (invalidate_persona). A lookup reads
+the counter (one Redis GET, no database query) and uses the cached prompts
+only if they were loaded at the current version, so an edit made through
+any API process is seen by every process on its next turn. Without Redis
+the counter is process-local.
+
+Compiled Jinja templates are cached by source, so rendering a prompt does
+not parse its template again.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from jinja2 import Template
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "prompt_cache:version:"
+
+
+@lru_cache(maxsize=int(os.getenv("PROMPT_TEMPLATE_CACHE_SIZE", "256")))
+def compile_template(source: str) -> Template:
+    """Compiled Jinja template for a template source, cached by source"""
+    return Template(source)
+
+
+class PromptCache:
+    """Active prompts per persona, validated against a shared version counter"""
+
+    def __init__(self, redis_url: str = None):
+        """
+        Args:
+            redis_url: Redis shared by the API processes (REDIS_URL); the
+                version counters are process-local if it is unreachable
+        """
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self.enabled = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+        self.max_personas = int(os.getenv("PROMPT_CACHE_MAX_PERSONAS", "1000"))
+
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}  # Local counters when there is no Redis
+        # Persona ID -> (version the prompts were loaded at, prompts by layer)
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self.redis_client = None
+        self._aio_client = None
+        if self.enabled:
+            try:
+                client = redis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=2)
+                client.ping()
+                self.redis_client = client
+            except Exception as e:
+                logger.info(f"Redis not available, prompt cache invalidation is process-local: {e}")
+
+    def _version_key(self, persona_id: str) -> str:
+        return f"{KEY_PREFIX}{persona_id}"
+
+    def _get_aio_client(self):
+        if self._aio_client is None:
+            self._aio_client = aioredis.from_url(self.redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=2)
+        return self._aio_client
+
+    async def version(self, persona_id: str) -> Optional[int]:
+        """
+        Current prompt version of a persona
+
+        Returns:
+            The version, or None if it cannot be read (nothing is cached then)
+        """
+        if not self.enabled:
+            return None
+        if self.redis_client is None:
+            with self._lock:
+                return self._versions.get(persona_id, 0)
+        try:
+            value = await self._get_aio_client().get(self._version_key(persona_id))
+            return int(value) if value else 0
+        except Exception as e:
+            logger.warning(f"Could not read prompt version of persona {persona_id}: {e}")
+            return None
+
+    def get(self, persona_id: str, version: Optional[int]) -> Optional[Dict[str, str]]:
+        """Cached prompts of a persona if they were loaded at this version"""
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(persona_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(persona_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, persona_id: str, version: Optional[int], prompts: Dict[str, str]):
+        """
+        Cache a persona's prompts
+
+        Args:
+            version: Version read with version() before the prompts were
+                queried, so prompts changed meanwhile are not kept as current
+        """
+        if version is None:
+            return
+        with self._lock:
+            self._entries[persona_id] = (version, dict(prompts))
+            self._entries.move_to_end(persona_id)
+            while len(self._entries) > self.max_personas:
+                self._entries.popitem(last=False)
+
+    def invalidate_persona(self, persona_id: Optional[str]):
+        """
+        Mark a persona's cached prompts stale in every process (call when one
+        of its versions is activated); failures are logged, never raised
+        """
+        if not self.enabled or not persona_id:
+            return
+        with self._lock:
+            self._entries.pop(persona_id, None)
+            self.invalidations += 1
+            if self.redis_client is None:
+                self._versions[persona_id] = self._versions.get(persona_id, 0) + 1
+                return
+        try:
+            self.redis_client.incr(self._version_key(persona_id))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached prompts of persona {persona_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit counters for this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            templates = compile_template.cache_info()
+            return {
+                "enabled": self.enabled,
+                "transport": "redis" if self.redis_client is not None else "local",
+                "personas": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "templates_compiled": templates.misses,
+                "template_hits": templates.hits
+            }
+
+
+# Singleton instance
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+def get_prompt_cache() -> PromptCache:
+    """Get the process-wide prompt cache"""
+    global _prompt_cache
+    if _prompt_cache is None:
+        with _prompt_cache_lock:
+            if _prompt_cache is None:
+                _prompt_cache = PromptCache()
+    return _prompt_cache
@@ -12,7 +12,8 @@ import os
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
-from jinja2 import Template
+
+from services.prompt_cache import compile_template
 
 
 @dataclass
@@ -124,8 +125,8 @@ Instructions:
         template_path = config["layers"]["system"][system_template_key]
         template_content = self._load_template(template_path)
         
-        # Render template
-        template = Template(template_content)
+        # Render template (compiled once per template source)
+        template = compile_template(template_content)
         return template.render(
             persona_name=persona_name,
             description=description
@@ -154,8 +155,8 @@ Instructions:
                 "metadata": chunk.get("metadata", {})
             })
         
-        # Render template
-        template = Template(template_content)
+        # Render template (compiled once per template source)
+        template = compile_template(template_content)
         return template.render(chunks=formatted_chunks)
     
     def build_complete_prompt(
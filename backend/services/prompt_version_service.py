@@ -11,6 +11,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_, func
 from models import PromptVersion, PromptLayer
+from services.prompt_cache import get_prompt_cache
 import uuid
 from datetime import datetime
 
@@ -128,6 +129,7 @@ class PromptVersionService:
         
         db.commit()
         db.refresh(version)
+        get_prompt_cache().invalidate_persona(version.persona_id)
         
         return version
     
@@ -0,0 +1,123 @@
+"""
+Micro-batching for concurrent query embeddings
+
+Under load, many single-query embedding calls arrive within milliseconds of
+each other. The coalescer holds each call for a short window, sends every
+query collected in that window as one batched embeddings request, and
+resolves each caller's future with its own vector.
+"""
+
+import os
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _LoopState:
+    """Pending queries for one event loop"""
+
+    def __init__(self):
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks = set()
+
+
+class QueryCoalescer:
+    """Collects concurrent embed calls into batched requests"""
+
+    def __init__(self, window_ms: float, max_batch: int = 64):
+        """
+        Args:
+            window_ms: How long the first query in a batch waits for company
+            max_batch: Flush early once this many queries are pending
+        """
+        self.window_seconds = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self.batches_sent = 0
+        self.queries_coalesced = 0
+
+    async def embed(
+        self,
+        text: str,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]]
+    ) -> List[float]:
+        """
+        Embed one query as part of the next batch
+
+        Args:
+            text: Query text
+            embed_fn: Coroutine embedding a list of texts in one request
+
+        Returns:
+            Embedding vector for `text`
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+
+        future = loop.create_future()
+        state.pending.append((text, future))
+
+        if len(state.pending) >= self.max_batch:
+            self._flush(loop, state, embed_fn)
+        elif state.timer is None:
+            state.timer = loop.call_later(self.window_seconds, self._flush, loop, state, embed_fn)
+
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop, state: _LoopState, embed_fn):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        batch, state.pending = state.pending, []
+        if not batch:
+            return
+        task = loop.create_task(self._send(batch, embed_fn))
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]], embed_fn):
+        # Identical queries in the same window share one input
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = await embed_fn(texts)
+            by_text: Dict[str, List[float]] = dict(zip(texts, embeddings))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_sent += 1
+        self.queries_coalesced += len(batch)
+        if len(batch) > 1:
+            logger.debug(f"Coalesced {len(batch)} query embeddings into one request")
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+
+# Singleton instance
+_query_coalescer = None
+
+def get_query_coalescer() -> Optional[QueryCoalescer]:
+    """
+    Get the shared query coalescer, or None when disabled
+
+    Enabled by setting EMBEDDING_COALESCE_WINDOW_MS to a positive value.
+    """
+    global _query_coalescer
+    window_ms = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "0"))
+    if window_ms <= 0:
+        return None
+    if _query_coalescer is None:
+        _query_coalescer = QueryCoalescer(
+            window_ms=window_ms,
+            max_batch=int(os.getenv("EMBEDDING_COALESCE_MAX_BATCH", "64"))
+        )
+    return _query_coalescer
@@ -2,17 +2,14 @@
 Simple Document Processor - Threading-based approach to avoid async database conflicts
 
 This replaces the complex async ingestion_worker.py with a simple, reliable threading approach.
-Each processing thread gets its own database session to avoid conflicts.
+Jobs run on the bounded ingestion executor's worker threads; each job gets its
+own database session to avoid conflicts.
 """
 
 import os
-import io
-import hashlib
-import threading
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-import base64
 import time
 
 # Import SQLAlchemy components
@@ -56,90 +53,28 @@ SessionLocal = sessionmaker(
 from models import IngestionJob, JobStatus, Persona
 
 # Processing services
-from services.chunker import TextChunker
-from services.embedder import Embedder
+from services.file_processor import FileProcessor
+from services.ingestion_pipeline import IngestionPipeline
+from services.dedup_index import get_dedup_index
+from services.answer_cache import get_answer_cache
+from services.blob_store import get_blob_store
+from services.document_registry import DocumentRegistry
+from services.ingestion_checkpoints import IngestionCheckpoints
+from services.ingestion_executor import get_ingestion_executor
+from services.job_progress import get_job_progress_hub
 from services.pinecone_client import get_pinecone_client
 
-# PDF processing
-import pypdf
-from io import BytesIO
-
 logger = logging.getLogger(__name__)
 
-class FileProcessor:
-    """Handles individual file processing tasks"""
-    
-    def __init__(self):
-        self.chunker = TextChunker()
-        self.embedder = Embedder()
-        
-    def process_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF content"""
-        try:
-            pdf_file = BytesIO(file_content)
-            reader = pypdf.PdfReader(pdf_file)
-            text = ""
-            
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text.strip()
-        except Exception as e:
-            logger.error(f"PDF processing error: {e}")
-            raise ValueError(f"Failed to process PDF: {str(e)}")
-    
-    def process_text_file(self, file_content: bytes) -> str:
-        """Process text file content"""
-        try:
-            return file_content.decode('utf-8', errors='ignore').strip()
-        except Exception as e:
-            logger.error(f"Text file processing error: {e}")
-            raise ValueError(f"Failed to process text file: {str(e)}")
-    
-    def get_file_hash(self, content: str) -> str:
-        """Generate SHA-256 hash of file content for deduplication"""
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
-    
-    def parse_file(self, filename: str, content: bytes) -> Dict[str, Any]:
-        """
-        Parse file content and extract text
-        
-        Returns:
-            Dict with parsed content and metadata
-        """
-        filename_lower = filename.lower()
-        
-        if filename_lower.endswith('.pdf'):
-            text_content = self.process_pdf(content)
-            file_type = "pdf"
-        elif filename_lower.endswith('.txt'):
-            text_content = self.process_text_file(content)
-            file_type = "text"
-        else:
-            raise ValueError(f"Unsupported file type: {filename}")
-        
-        if not text_content.strip():
-            raise ValueError(f"File {filename} is empty or could not be processed")
-        
-        file_hash = self.get_file_hash(text_content)
-        
-        return {
-            "filename": filename,
-            "content": text_content,
-            "file_type": file_type,
-            "hash": file_hash,
-            "size": len(content),
-            "char_count": len(text_content)
-        }
-
 def process_file_simple(job_id: str, persona_id: str, files_data: List[Dict[str, Any]]):
     """
     Process files with own database session - threading-based approach
     
-    This function runs in its own thread with its own database session
-    to avoid the async database conflicts we had before.
+    This function runs on an ingestion executor worker thread with its own
+    database session to avoid the async database conflicts we had before.
     """
     thread_logger = logging.getLogger(f"processor-{job_id[:8]}")
+    progress_hub = get_job_progress_hub()
     db = SessionLocal()
     
     try:
@@ -156,6 +91,11 @@ def process_file_simple(job_id: str, persona_id: str, files_data: List[Dict[str,
         job.status = JobStatus.PROCESSING
         db.commit()
         thread_logger.info(f"Started processing job {job_id}")
+        progress_hub.publish(
+            job_id, "started",
+            persona_id=persona_id, status=JobStatus.PROCESSING.value, progress=0,
+            processed_files=0, total_files=len(files_data), chunks_embedded=0, chunks_upserted=0
+        )
         
         # Step 2: Get persona info
         persona = db.query(Persona).filter_by(id=persona_id).first()
@@ -169,97 +109,64 @@ def process_file_simple(job_id: str, persona_id: str, files_data: List[Dict[str,
         pinecone_client = get_pinecone_client()
         namespace = persona.namespace
         
-        processed_files = 0
-        total_chunks = 0
-        processed_hashes = set()  # For deduplication
-        
-        # Step 4: Process each file
-        for i, file_data in enumerate(files_data):
-            try:
-                filename = file_data['filename']
-                # Decode base64 content back to bytes
-                content_bytes = base64.b64decode(file_data['content'])
-                
-                thread_logger.info(f"Processing file {i+1}/{len(files_data)}: {filename}")
-                
-                # Parse file content
-                parsed_data = processor.parse_file(filename, content_bytes)
-                file_hash = parsed_data['hash']
-                
-                # Check for duplicates
-                if file_hash in processed_hashes:
-                    thread_logger.info(f"Skipping duplicate file: {filename} (hash: {file_hash[:8]})")
-                    continue
-                
-                processed_hashes.add(file_hash)
-                
-                # Step 5: Chunk text
-                chunks = processor.chunker.chunk_text(
-                    parsed_data['content'], 
-                    source=filename
-                )
-                
-                thread_logger.info(f"Created {len(chunks)} chunks for {filename}")
-                
-                # Step 6: Generate embeddings
-                # Extract text content from chunk dictionaries
-                chunk_texts = []
-                for chunk in chunks:
-                    if isinstance(chunk, dict):
-                        chunk_texts.append(chunk.get('text', chunk.get('content', str(chunk))))
-                    else:
-                        chunk_texts.append(str(chunk))
-                
-                # Use async embedder in sync context
-                import asyncio
-                try:
-                    # Check if we're already in an event loop
-                    loop = asyncio.get_running_loop()
-                    # If we're in a loop, we need to run in a thread
-                    import concurrent.futures
-                    with concurrent.futures.ThreadPoolExecutor() as executor:
-                        future = executor.submit(asyncio.run, processor.embedder.embed_documents(chunk_texts))
-                        embeddings = future.result()
-                except RuntimeError:
-                    # No event loop running, we can use asyncio.run directly
-                    embeddings = asyncio.run(processor.embedder.embed_documents(chunk_texts))
-                
-                # Step 7: Store in vector database
-                vectors_to_upsert = []
-                for j, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                    vector_id = f"{persona_id}_{file_hash[:8]}_{j}"
-                    
-                    # Extract chunk text properly
-                    chunk_text = chunk.get('text', chunk.get('content', str(chunk))) if isinstance(chunk, dict) else str(chunk)
-                    
-                    vectors_to_upsert.append({
-                        "id": vector_id,
-                        "values": embedding,
-                        "metadata": {
-                            "content": chunk_text,
-                            "filename": filename,
-                            "file_type": parsed_data['file_type'],
-                            "chunk_index": j,
-                            "persona_id": persona_id,
-                            "file_hash": file_hash
-                        }
-                    })
-                
-                # Batch upsert to Pinecone
-                if vectors_to_upsert:
-                    pinecone_client.index.upsert(
-                        vectors=vectors_to_upsert,
-                        namespace=namespace
-                    )
-                    thread_logger.info(f"Upserted {len(vectors_to_upsert)} vectors for {filename}")
-                
-                processed_files += 1
-                total_chunks += len(chunks)
-                
-            except Exception as file_error:
-                thread_logger.error(f"Error processing file {filename}: {str(file_error)}")
-                # Continue with other files, don't fail the entire job
-                continue
+        # Step 4: Parse, embed and store the files in overlapping pipeline
+        # stages, on the executor's shared event loop
+        def build_metadata(pipeline_file, chunk_index, chunk):
+            return {
+                "content": chunk['text'],
+                "filename": pipeline_file.filename,
+                "file_type": pipeline_file.file_type,
+                "chunk_index": chunk_index,
+                "persona_id": persona_id,
+                "file_hash": pipeline_file.file_hash
+            }
+        
+        progress = {"processed_files": 0, "chunks_embedded": 0, "chunks_upserted": 0}
+        
+        async def on_file_start(pipeline_file):
+            thread_logger.info(f"Processing file {pipeline_file.index + 1}/{len(files_data)}: {pipeline_file.filename}")
+            progress_hub.publish(
+                job_id, "file_started",
+                current_file=pipeline_file.filename, progress=int(pipeline_file.index / len(files_data) * 100)
+            )
+        
+        async def on_file_done(pipeline_file):
+            if pipeline_file.succeeded:
+                thread_logger.info(f"Stored {pipeline_file.stored_chunks} chunks for {pipeline_file.filename}")
+                progress["processed_files"] += 1
+            progress_hub.publish(
+                job_id, "file_done",
+                progress=int((pipeline_file.index + 1) / len(files_data) * 100),
+                processed_files=progress["processed_files"]
+            )
+        
+        def on_progress(stage, pipeline_file, chunk_count):
+            if stage == "embed":
+                progress["chunks_embedded"] += chunk_count
+                progress_hub.publish(job_id, "chunks_embedded", chunks_embedded=progress["chunks_embedded"])
+            else:
+                progress["chunks_upserted"] += chunk_count
+                progress_hub.publish(job_id, "vectors_upserted", chunks_upserted=progress["chunks_upserted"])
+        
+        pipeline = IngestionPipeline(
+            processor,
+            pinecone_client,
+            persona_id,
+            namespace,
+            build_metadata,
+            dedup_index=get_dedup_index(),
+            on_file_start=on_file_start,
+            on_file_done=on_file_done,
+            registry=DocumentRegistry.for_sync_sessions(SessionLocal),
+            on_progress=on_progress,
+            checkpoints=IngestionCheckpoints.for_sync_sessions(SessionLocal, job_id)
+        )
+        results = get_ingestion_executor().run_async(pipeline.run(files_data))
+        
+        processed_files = sum(1 for result in results if result.succeeded)
+        total_chunks = sum(result.stored_chunks for result in results if result.succeeded)
+        if total_chunks or any(result.deleted_chunks for result in results):
+            get_answer_cache().invalidate_persona(persona_id)
         
         # Step 8: Update job status to completed
         job.status = JobStatus.COMPLETED
@@ -269,14 +176,22 @@ def process_file_simple(job_id: str, persona_id: str, files_data: List[Dict[str,
         if job.job_metadata:
             job.job_metadata['chunks_created'] = total_chunks
             job.job_metadata['completed_at'] = datetime.utcnow().isoformat()
+            job.job_metadata['pipeline'] = pipeline.get_stats()
         
         db.commit()
+        get_blob_store().settle_job(job_id, [f.get('blob_hash') for f in files_data], failed=False)
         thread_logger.info(f"=== COMPLETED PROCESSING {job_id} ===")
         thread_logger.info(f"Processed {processed_files}/{len(files_data)} files")
         thread_logger.info(f"Created {total_chunks} total chunks")
+        progress_hub.publish(
+            job_id, "completed",
+            status=JobStatus.COMPLETED.value, progress=100, current_file=None,
+            processed_files=processed_files, total_chunks=total_chunks
+        )
         
     except Exception as e:
         thread_logger.error(f"Error processing job {job_id}: {str(e)}")
+        progress_hub.publish(job_id, "failed", status=JobStatus.FAILED.value, current_file=None, error=str(e)[:500])
         
         # Update job status to failed with error message
         try:
@@ -289,26 +204,22 @@ def process_file_simple(job_id: str, persona_id: str, files_data: List[Dict[str,
                 db.commit()
         except Exception as update_error:
             thread_logger.error(f"Failed to update job status: {update_error}")
+        get_blob_store().settle_job(job_id, [f.get('blob_hash') for f in files_data], failed=True)
             
     finally:
         db.close()
         thread_logger.info(f"Database session closed for job {job_id}")
 
-def start_processing_thread(job_id: str, persona_id: str, files_data: List[Dict[str, Any]]):
+def submit_processing_job(job_id: str, persona_id: str, files_data: List[Dict[str, Any]]):
     """
-    Start processing in background thread
+    Queue a job on the ingestion executor
     
-    This replaces the asyncio.create_task() approach that was causing database conflicts.
-    Each thread gets its own database session and runs independently.
-    """
-    thread = threading.Thread(
-        target=process_file_simple,
-        args=(job_id, persona_id, files_data),
-        name=f"processor-{job_id[:8]}"
-    )
-    thread.daemon = True
-    thread.start()
+    This replaces the thread-per-upload approach: the executor caps how many
+    jobs run at once and how many may wait.
     
-    logger.info(f"Started processing thread for job {job_id}")
-    
-    return thread 
\ No newline at end of file
+    Raises:
+        IngestionBacklogFull: If the backlog is full (HTTP 429)
+    """
+    get_ingestion_executor().submit(
+        f"processor-{job_id[:8]}", process_file_simple, job_id, persona_id, files_data
+    ) 
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Token accounting for streamed completions
+
+Counting a streamed answer by re-encoding everything received so far after
+each token is quadratic in the answer length and runs on the event loop.
+The accountant prefers the counts the provider reports with the stream
+(OpenAI's final usage chunk, Anthropic's message_start/message_delta
+events) and otherwise counts locally and incrementally: streamed text is
+buffered and encoded in pieces cut at word boundaries, which the tokenizer
+never merges across, so each piece is encoded once and the total matches
+encoding the whole answer.
+"""
+
+import os
+import logging
+from typing import List, Optional
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def get_encoding():
+    """The tokenizer used for local counts (cl100k_base)"""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text"""
+    return len(get_encoding().encode(text))
+
+
+def _last_boundary(text: str) -> int:
+    """
+    Index of the last word boundary in text, or 0 if there is none
+
+    A boundary is a single space between two non-space characters: the
+    space starts the next word's token, so the text before it encodes the
+    same alone as it does followed by the rest.
+    """
+    i = text.rfind(" ", 0, len(text) - 1)
+    while i > 0:
+        if not text[i - 1].isspace() and not text[i + 1].isspace():
+            return i
+        i = text.rfind(" ", 0, i)
+    return 0
+
+
+class TokenAccountant:
+    """Input and output token counts of one streamed completion"""
+
+    def __init__(self, prompt: Optional[str] = None, flush_chars: int = None):
+        """
+        Args:
+            prompt: Prompt text, counted locally if the provider reports no usage
+            flush_chars: Buffered characters that trigger an incremental
+                encode (TOKEN_COUNT_FLUSH_CHARS)
+        """
+        self.prompt = prompt
+        self.flush_chars = flush_chars or int(os.getenv("TOKEN_COUNT_FLUSH_CHARS", "2048"))
+
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._local_output_tokens = 0
+        self._local_input_tokens: Optional[int] = None
+
+        self.provider_input_tokens: Optional[int] = None
+        self.provider_output_tokens: Optional[int] = None
+        self.encode_calls = 0
+
+    def add(self, text: str):
+        """Account for a streamed piece of the answer"""
+        if not text:
+            return
+        self._parts.append(text)
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= self.flush_chars:
+            self._flush(final=False)
+
+    def record_usage(self, input_tokens: Optional[int] = None, output_tokens: Optional[int] = None):
+        """Record counts reported by the provider; they take precedence over local counts"""
+        if input_tokens is not None:
+            self.provider_input_tokens = input_tokens
+        if output_tokens is not None:
+            self.provider_output_tokens = output_tokens
+
+    def _flush(self, final: bool):
+        text = "".join(self._pending)
+        cut = len(text) if final else _last_boundary(text)
+        if cut:
+            self._local_output_tokens += len(get_encoding().encode(text[:cut]))
+            self.encode_calls += 1
+        rest = text[cut:]
+        self._pending = [rest] if rest else []
+        self._pending_chars = len(rest)
+
+    @property
+    def text(self) -> str:
+        """The answer streamed so far"""
+        return "".join(self._parts)
+
+    @property
+    def output_tokens(self) -> int:
+        """Answer tokens: provider-reported, else counted locally"""
+        if self.provider_output_tokens is not None:
+            return self.provider_output_tokens
+        if self._pending:
+            self._flush(final=True)
+        return self._local_output_tokens
+
+    @property
+    def input_tokens(self) -> int:
+        """Prompt tokens: provider-reported, else counted locally"""
+        if self.provider_input_tokens is not None:
+            return self.provider_input_tokens
+        if self._local_input_tokens is None:
+            self._local_input_tokens = count_tokens(self.prompt) if self.prompt else 0
+            self.encode_calls += 1
+        return self._local_input_tokens
+
+    @property
+    def source(self) -> str:
+        """'provider' if the provider reported the output count, else 'local'"""
+        return "provider" if self.provider_output_tokens is not None else "local"
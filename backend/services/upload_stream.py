@@ -0,0 +1,281 @@
+"""
+Streaming multipart upload parsing
+
+FastAPI's File() parameters buffer the whole request before the endpoint
+runs, and endpoints then read each file into memory again. Here the request
+body is parsed as it arrives: file parts are written to the blob store in
+fixed-size blocks while their SHA-256 is computed, and size limits are
+enforced per block, so oversized uploads are rejected before they are fully
+received and memory per upload stays at a constant buffer.
+
+Stored files are held by the upload (see blob_store) until the endpoint hands
+them to a job and calls release_upload(). A rejected upload releases the
+files it already stored, so they are deleted unless something else holds them.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from services.blob_store import BlobWriter, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+# File bytes are written to disk in blocks of this size
+SPOOL_BLOCK_BYTES = int(os.getenv("UPLOAD_SPOOL_BLOCK_BYTES", str(1 << 20)))
+# Largest accepted non-file form field
+MAX_FIELD_BYTES = 64 * 1024
+
+
+@dataclass
+class StreamedFile:
+    """A file part that was written to the blob store"""
+    field_name: str
+    filename: str
+    content_type: str
+    blob_hash: str
+    size: int
+
+
+@dataclass
+class StreamedForm:
+    """Parsed multipart form: stored files plus plain text fields"""
+    files: List[StreamedFile] = field(default_factory=list)
+    fields: Dict[str, str] = field(default_factory=dict)
+    holder: str = field(default_factory=lambda: f"upload-{uuid.uuid4().hex}")  # Holds the stored files
+
+
+class _FormSpooler:
+    """
+    Collects parser callbacks into events for the async driver
+
+    MultipartParser callbacks are synchronous; they only record what
+    happened (and enforce the per-file limit), while the driver does the
+    disk writes off the event loop.
+    """
+
+    def __init__(
+        self,
+        file_fields: Sequence[str],
+        max_file_size: int,
+        max_files: Optional[int],
+        allowed_extensions: Optional[Sequence[str]]
+    ):
+        self.file_fields = file_fields
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.allowed_extensions = allowed_extensions
+        self.events: List[tuple] = []
+        self.file_count = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._part: Optional[Dict[str, Any]] = None
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._part = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        filename = options.get(b"filename")
+        content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+
+        if filename is None:
+            self._part = {"kind": "field", "name": name, "size": 0}
+            self.events.append(("field", name))
+            return
+
+        filename = os.path.basename(filename.decode("utf-8", errors="replace").replace("\\", "/"))
+        if name not in self.file_fields:
+            raise HTTPException(400, f"Unexpected file field '{name}'")
+        self.file_count += 1
+        if self.max_files is not None and self.file_count > self.max_files:
+            raise HTTPException(400, f"Too many files. Maximum {self.max_files} files per upload")
+        if self.allowed_extensions and not filename.lower().endswith(tuple(self.allowed_extensions)):
+            raise HTTPException(400, f"Unsupported file type for '{filename}'. Use PDF or TXT")
+
+        self._part = {"kind": "file", "name": name, "filename": filename, "size": 0}
+        self.events.append(("file", name, filename, content_type))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        part["size"] += end - start
+        if part["kind"] == "file":
+            if part["size"] > self.max_file_size:
+                limit_mb = self.max_file_size / (1024 * 1024)
+                raise HTTPException(413, f"File '{part['filename']}' exceeds {limit_mb:g}MB limit")
+        elif part["size"] > MAX_FIELD_BYTES:
+            raise HTTPException(413, f"Form field '{part['name']}' is too large")
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end",))
+
+
+async def stream_multipart_upload(
+    request: Request,
+    file_fields: Sequence[str] = ("files",),
+    max_file_size: int = 10 * 1024 * 1024,
+    max_total_size: Optional[int] = None,
+    max_files: Optional[int] = None,
+    allowed_extensions: Optional[Sequence[str]] = (".pdf", ".txt")
+) -> StreamedForm:
+    """
+    Parse a multipart/form-data request body straight into the blob store
+
+    Args:
+        request: The incoming request; its body must not have been read
+        file_fields: Form field names that may carry files
+        max_file_size: Per-file limit in bytes
+        max_total_size: Limit on the whole request body in bytes
+        max_files: Limit on the number of files
+        allowed_extensions: Accepted filename suffixes (None accepts any)
+
+    Returns:
+        StreamedForm with the stored files, in upload order, and text fields
+
+    Raises:
+        HTTPException: 400 for malformed or disallowed parts, 413 as soon as
+            a size limit is exceeded
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(400, "Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if max_total_size is not None and content_length and content_length.isdigit():
+        if int(content_length) > max_total_size:
+            raise HTTPException(413, f"Total upload size exceeds {max_total_size // (1024 * 1024)}MB limit")
+
+    blob_store = get_blob_store()
+    spooler = _FormSpooler(file_fields, max_file_size, max_files, allowed_extensions)
+    parser = MultipartParser(boundary, spooler.callbacks())
+    form = StreamedForm()
+
+    writer: Optional[BlobWriter] = None
+    current: Optional[tuple] = None
+    buffer = bytearray()
+    received = 0
+
+    async def flush():
+        if buffer:
+            await asyncio.to_thread(writer.write, bytes(buffer))
+            buffer.clear()
+
+    async def drain():
+        nonlocal writer, current
+        events, spooler.events = spooler.events, []
+        for event in events:
+            kind = event[0]
+            if kind == "file":
+                current = event
+                writer = await asyncio.to_thread(blob_store.writer)
+            elif kind == "field":
+                current = event
+            elif kind == "data":
+                buffer.extend(event[1])
+                if writer is not None and len(buffer) >= SPOOL_BLOCK_BYTES:
+                    await flush()
+            elif current is not None and current[0] == "file":
+                await flush()
+                blob_hash = await asyncio.to_thread(writer.commit, form.holder)
+                _, name, filename, part_type = current
+                form.files.append(StreamedFile(name, filename, part_type, blob_hash, writer.size))
+                writer, current = None, None
+            elif current is not None:
+                form.fields[current[1]] = buffer.decode("utf-8", errors="replace")
+                buffer.clear()
+                current = None
+
+    try:
+        try:
+            async for data in request.stream():
+                received += len(data)
+                if max_total_size is not None and received > max_total_size:
+                    raise HTTPException(413, f"Total upload size exceeds {max_total_size // (1024 * 1024)}MB limit")
+                parser.write(data)
+                await drain()
+            parser.finalize()
+            await drain()
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to parse multipart upload: {e}")
+            raise HTTPException(400, f"Malformed upload: {str(e)}")
+        finally:
+            if writer is not None:
+                writer.abort()
+
+        if current is not None:
+            raise HTTPException(400, "Malformed upload: body ended inside a part")
+    except BaseException:
+        # Discard the files stored before the upload was rejected
+        if form.files:
+            await release_upload(form)
+        raise
+
+    logger.info(f"Streamed {len(form.files)} file(s), {received} bytes")
+    return form
+
+
+async def release_upload(form: StreamedForm):
+    """
+    Drop the upload's hold on its files; call once a job holds them, or when
+    they are no longer needed. Failures are logged, never raised.
+    """
+    hashes = [f.blob_hash for f in form.files]
+    try:
+        await asyncio.to_thread(get_blob_store().release, hashes, form.holder)
+    except Exception as e:
+        logger.warning(f"Failed to release uploaded files: {e}")
+
+
+def multipart_openapi(file_field: str = "files", multiple: bool = True, text_fields: Sequence[str] = ()) -> Dict[str, Any]:
+    """openapi_extra describing a form parsed by stream_multipart_upload"""
+    file_schema = {"type": "string", "format": "binary"}
+    properties: Dict[str, Any] = {
+        file_field: {"type": "array", "items": file_schema} if multiple else file_schema
+    }
+    for name in text_fields:
+        properties[name] = {"type": "string"}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "required": [file_field], "properties": properties}
+                }
+            }
+        }
+    }
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Regression check: TextChunker on text containing surrogate code points
+
+Text extracted from some PDFs holds lone surrogates, which cannot be encoded
+as UTF-8 and used to make the chunker raise. Every chunk must now be valid
+UTF-8, with the surrogates replaced by U+FFFD and the character offsets still
+pointing at the right span of the input.
+
+Usage:
+    python test_chunker_surrogates.py
+"""
+
+import sys
+import random
+
+import services.chunker as chunker_module
+from services.chunker import TextChunker
+
+WORDS = "the customer offer value price market growth revenue leads scale".split()
+SURROGATES = ["\ud800", "\udfff", "\ud83d\ude00", "\udc00\ud800"]
+
+
+def build_text(rng: random.Random, size: int) -> str:
+    """Prose with surrogates scattered through words, sentences and paragraph breaks"""
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.05:
+            word = rng.choice(SURROGATES) + word
+        elif roll < 0.1:
+            word += rng.choice(SURROGATES)
+        elif roll < 0.15:
+            word += rng.choice([".", "!", "?", ".\n\n"])
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)
+
+
+def check(text: str, pieces, chunker: TextChunker, label: str) -> int:
+    """Chunk the pieces and verify each chunk; returns the number of failures"""
+    expected = "".join("\ufffd" if "\ud800" <= char <= "\udfff" else char for char in text)
+
+    failures = 0
+    chunks = list(chunker.iter_chunks(pieces, source=label))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if chunk["chunk_id"] != previous["chunk_id"] + 1 or chunk["char_start"] <= previous["char_start"]:
+            print(f"FAIL {label}: chunk {chunk['chunk_id']} repeats or goes back after chunk {previous['chunk_id']}")
+            failures += 1
+    for chunk in chunks:
+        try:
+            chunk["text"].encode("utf-8")
+        except UnicodeEncodeError as e:
+            print(f"FAIL {label}: chunk {chunk['chunk_id']} is not valid UTF-8: {e}")
+            failures += 1
+            continue
+        if chunk["text"] != expected[chunk["char_start"]:chunk["char_end"]]:
+            print(f"FAIL {label}: chunk {chunk['chunk_id']} does not match its offsets")
+            failures += 1
+    if not chunks:
+        print(f"FAIL {label}: no chunks")
+        failures += 1
+    print(f"{label}: {len(chunks)} chunks, {failures} failures")
+    return failures
+
+
+def build_blocks(rng: random.Random, block_chars: int, count: int, padding: int = 30) -> str:
+    """
+    Paragraphs of exactly block_chars characters, each ending in at least
+    `padding` characters of whitespace and a paragraph break
+    """
+    blocks = []
+    for _ in range(count):
+        block = build_text(rng, block_chars)[:block_chars - padding].rstrip() + "."
+        blocks.append(block.ljust(block_chars - 2) + "\n\n")
+    return "".join(blocks)
+
+
+def main():
+    rng = random.Random(7)
+    chunker = TextChunker(chunk_size=200, chunk_overlap=50)
+    failures = 0
+
+    # Only a surrogate, and one at each end of the text
+    failures += check("\ud800", ["\ud800"], chunker, "lone surrogate")
+    edges = "\udc00" + build_text(rng, 2000) + "\ud800"
+    failures += check(edges, [edges], chunker, "surrogates at both ends")
+
+    text = build_text(rng, 50000)
+    failures += check(text, [text], chunker, "single piece")
+
+    # Pieces split next to surrogates, as page-by-page PDF extraction does
+    cuts = sorted(rng.sample(range(1, len(text)), 40))
+    pieces = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+    failures += check(text, pieces, chunker, "many pieces")
+
+    # Several tokenization segments
+    segment_chars = chunker_module.SEGMENT_CHARS
+    chunker_module.SEGMENT_CHARS = 4096
+    try:
+        failures += check(text, pieces, chunker, "small segments")
+
+        # Segment cuts right after a paragraph break: the last window of a
+        # segment can end at its last content without carrying over
+        chunker_module.SEGMENT_CHARS = 2000
+        blocks = build_blocks(rng, 2000, 20)
+        failures += check(blocks, [blocks], TextChunker(chunk_size=20, chunk_overlap=5), "segments cut on whitespace")
+    finally:
+        chunker_module.SEGMENT_CHARS = segment_chars
+
+    if failures:
+        print(f"{failures} failures")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,8 @@ from datetime import datetime
 import sys
 sys.path.append('.')
 
-from services.simple_processor import process_file_simple, start_processing_thread, SessionLocal
+from services.simple_processor import process_file_simple, submit_processing_job, SessionLocal
+from services.ingestion_executor import get_ingestion_executor
 from models import IngestionJob, JobStatus
 
 def create_test_file_data():
@@ -53,6 +54,27 @@ def create_test_file_data():
         'size': len(test_content)
     }]
 
+def wait_for_jobs(job_ids, timeout=30):
+    """Wait until the jobs are READY or FAILED, or the executor has drained"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        db = SessionLocal()
+        try:
+            statuses = [
+                job.status for job in db.query(IngestionJob).filter(IngestionJob.id.in_(job_ids))
+            ]
+        finally:
+            db.close()
+        if len(statuses) == len(job_ids) and all(
+            status in (JobStatus.READY, JobStatus.FAILED) for status in statuses
+        ):
+            return True
+        stats = get_ingestion_executor().get_stats()
+        if stats["queued"] == 0 and stats["active"] == 0:
+            return True
+        time.sleep(0.5)
+    return False
+
 def test_simple_processing():
     """Test the simplified processing approach"""
     print("=== Testing Simplified Document Processing ===")
@@ -82,9 +104,9 @@ def test_simple_processing():
         files_data = create_test_file_data()
         print(f"✓ Created test file data: {files_data[0]['filename']}")
         
-        # Start processing in a thread
-        print("✓ Starting processing thread...")
-        thread = start_processing_thread(job_id, persona_id, files_data)
+        # Queue processing on the ingestion executor
+        print("✓ Queueing processing job...")
+        submit_processing_job(job_id, persona_id, files_data)
         
         # Monitor the job status
         print("✓ Monitoring job status...")
@@ -118,10 +140,10 @@ def test_simple_processing():
             db.refresh(job)
             print(f"  Final status: {job.status.value}")
         
-        # Wait for thread to complete
-        if thread.is_alive():
-            print("  Waiting for thread to complete...")
-            thread.join(timeout=5)
+        # Wait for the executor to finish the job
+        if not wait_for_jobs([job_id], timeout=5):
+            print("  Job still running on the ingestion executor")
+        db.refresh(job)
         
         return job.status == JobStatus.READY
         
@@ -169,10 +191,10 @@ def test_error_handling():
         print("✓ Created invalid file data")
         
         # Start processing
-        thread = start_processing_thread(job_id, persona_id, invalid_files_data)
+        submit_processing_job(job_id, persona_id, invalid_files_data)
         
         # Wait for processing to complete
-        time.sleep(5)
+        wait_for_jobs([job_id], timeout=10)
         
         # Check that job failed gracefully
         db.refresh(job)
@@ -196,7 +218,7 @@ def test_multiple_threads():
     """Test that multiple processing threads don't interfere with each other"""
     print("\n=== Testing Multiple Threads ===")
     
-    threads = []
+    job_ids = []
     results = []
     
     try:
@@ -222,17 +244,18 @@ def test_multiple_threads():
             files_data = create_test_file_data()
             files_data[0]['filename'] = f'test_file_{i}.txt'
             
-            thread = start_processing_thread(job_id, persona_id, files_data)
-            threads.append((thread, job_id))
+            submit_processing_job(job_id, persona_id, files_data)
+            job_ids.append(job_id)
             
-            print(f"✓ Started thread {i}: {job_id}")
+            print(f"✓ Queued job {i}: {job_id}")
         
-        # Wait for all threads to complete
-        print("✓ Waiting for all threads to complete...")
-        time.sleep(10)
+        # Wait for all jobs to complete
+        print("✓ Waiting for all jobs to complete...")
+        if not wait_for_jobs(job_ids, timeout=30):
+            print("⚠️  Jobs still running after 30 seconds")
         
         # Check results
-        for thread, job_id in threads:
+        for job_id in job_ids:
             db = SessionLocal()
             try:
                 job = db.query(IngestionJob).filter_by(id=job_id).first()